@@ -0,0 +1,384 @@
+import time
+import asyncio
+import threading
+import concurrent.futures
+from config import AI_PIPELINE_STAGE_WORKERS, AI_PIPELINE_QUEUE_SIZE, DEEPSEEK_BATCH_SIZE, AI_LLM_BATCH_LINGER_SEC # type: ignore
+from data_harvester import fetch_kline_snapshot_local, fetch_multi_dim_intelligence # type: ignore
+from deepseek_brain import ask_deepseek, ask_deepseek_batch # type: ignore
+from sentiment_scorer import score_intelligence, triage # type: ignore
+from monitor_hud import send_mobile_notification # type: ignore
+from ipc_bus import get_bus, TOPIC_DECISION # type: ignore
+from sim_clock import get_clock # type: ignore
+from market_hours import hk_now # type: ignore
+from cycle_scheduler import run_with_deadline, DeadlineExceeded, OUTCOME_DEFERRED # type: ignore
+from debug_sentinel import log_info, log_error, log_warn # type: ignore
+
+# ==========================================
+# Phase 29: AI Decision Pipeline (常驻异步分级决策流水线)
+# ==========================================
+# 旧调度每次触发都新建线程池，每个标的内部再开一个 2 线程池并阻塞在大模型调用上。
+# 这里改为一条常驻的分级流水线: 采集 -> 特征 -> 大模型 -> 风控 -> 执行。
+# 每个阶段有独立并发度，阶段之间用有界队列衔接 (下游堵塞时上游自动减速)，
+# 于是第 N+1 个标的的采集与第 N 个标的的大模型推理重叠进行，一轮耗时趋近于最慢阶段而不是逐个累加。
+# A long-lived staged pipeline (fetch -> feature -> llm -> risk -> execute). Each stage has its
+# own concurrency and bounded hand-off queues, so fetching symbol N+1 overlaps the LLM call for
+# symbol N and a cycle takes roughly as long as its slowest stage.
+#
+# 大模型阶段默认批量运行: 在 AI_LLM_BATCH_LINGER_SEC 内凑齐最多 DEEPSEEK_BATCH_SIZE 个标的合并成一次请求。
+# The LLM stage batches by default: up to DEEPSEEK_BATCH_SIZE symbols gathered per request.
+#
+# 大模型阶段先做本地情绪分诊，情绪与技术面都平静的标的本地 HOLD，不占用大模型调用。
+# The LLM stage triages locally first; symbols with quiet news and technicals HOLD without a call.
+#
+# 各阶段的同步函数同时被 main.single_target_cycle 顺序复用，两条路径的决策逻辑完全一致。
+# The stage functions are plain sync functions, reused sequentially by main.single_target_cycle.
+
+STAGES = ["fetch", "feature", "llm", "risk", "execute"]
+# 截止时间只约束出网阶段；特征阶段含止损前置检查，过了截止时间也必须执行，已拿到决策的标的照常走完风控与执行
+# Only the network-bound stages honour the deadline. The feature stage runs the stop-loss exit and
+# must run even past the deadline; decided symbols still run risk and execution
+DEADLINE_STAGES = {"fetch", "llm"}
+
+# ---------- 阶段函数 (Stage functions) ----------
+
+def build_features(snapshot: dict) -> dict:
+    """把流式指标快照整理为喂给大模型的行情特征 (Shape the indicator snapshot into LLM features)"""
+    return {
+        "current_price": float(snapshot['收盘']),
+        "RSI_14": float(snapshot['RSI_14']),
+        "MACD_HIST": float(snapshot['MACD_HIST']),
+    }
+
+def pre_trade_guard(symbol: str, market_data: dict, risk_sys, hud, notify_fn=send_mobile_notification) -> bool:
+    """风控前置：触发割肉/止盈时立即清仓并返回 True，后续阶段不再执行 (True = position exited)"""
+    current_price = market_data["current_price"]
+    if risk_sys.monitor_dynamic_stop_loss(symbol, current_price):
+        hud.update_status(symbol, "SELL_ALL")
+        notify_fn(symbol, "SELL_ALL", f"触发本地风控止损/止盈防线！现价: {current_price}")
+        risk_sys.mock_sell_all(symbol)
+        return True
+    return False
+
+def local_triage(symbol: str, market_data: dict, intelligence_dict: dict):
+    """
+    本地情绪分诊: 需要升级时返回附带本地情绪分的情报，否则返回本地 HOLD 决策
+    Returns (intel with the local score, None) to escalate, or (None, local HOLD decision).
+    """
+    sentiment = score_intelligence(intelligence_dict)
+    escalate, why = triage(market_data, sentiment)
+    if not escalate:
+        log_info(f"[*] {symbol} 本地分诊未升级大模型: {why}")
+        return None, {"action": "HOLD", "reason": f"LOCAL_TRIAGE: {why}"}
+    return dict(intelligence_dict, local_sentiment=sentiment), None
+
+def consult_llm(symbol: str, market_data: dict, intelligence_dict: dict, hud, llm_fn=ask_deepseek) -> dict:
+    """本地分诊后呼叫 DeepSeek 决策大脑并把往返延迟刷到 HUD (Triage, ask the LLM, report latency)"""
+    intelligence_dict, local_decision = local_triage(symbol, market_data, intelligence_dict)
+    if local_decision is not None:
+        return local_decision
+    start_time = time.time()
+    ai_decision = llm_fn(symbol, market_data, intelligence_dict)
+    latency_ms = int((time.time() - start_time) * 1000)
+    hud.update_network_latency(latency_ms)
+    return ai_decision
+
+def consult_llm_batch(items: dict, hud, batch_fn=ask_deepseek_batch) -> dict:
+    """批量呼叫大模型: {标的: (行情特征, 情报)} -> {标的: 决策}，只有通过分诊的标的进入请求 (Batched LLM call)"""
+    decisions, escalated = {}, {}
+    for symbol, (market_data, intelligence_dict) in items.items():
+        intelligence_dict, local_decision = local_triage(symbol, market_data, intelligence_dict)
+        if local_decision is not None:
+            decisions[symbol] = local_decision
+        else:
+            escalated[symbol] = (market_data, intelligence_dict)
+    if escalated:
+        start_time = time.time()
+        decisions.update(batch_fn(escalated))
+        hud.update_network_latency(int((time.time() - start_time) * 1000))
+    return decisions
+
+def apply_risk(symbol: str, ai_decision: dict, market_data: dict, risk_sys) -> dict:
+    """本地双重副驾驶审核 (Local dual-copilot review)"""
+    return risk_sys.dual_copilot_interceptor(symbol, ai_decision, market_data["current_price"], market_data["RSI_14"])
+
+def execute_decision(symbol: str, final_decision: dict, market_data: dict, risk_sys, hud,
+                     notify_fn=send_mobile_notification) -> str:
+    """执行层：下单落盘、更新 UI、总线广播与手机推送，返回最终动作 (Execute; returns the action)"""
+    action = final_decision["action"]
+    current_price = market_data["current_price"]
+    hud.update_status(symbol, action)
+    get_bus().publish(TOPIC_DECISION, {symbol: {
+        "action": action,
+        "reason": final_decision.get("reason", ""),
+        "price": current_price,
+        "ts": hk_now().strftime('%Y-%m-%d %H:%M:%S'),
+    }})
+    if action == "BUY":
+        vol = final_decision.get("suggested_volume", 0)
+        risk_sys.mock_buy(symbol, current_price, vol)
+        notify_fn(symbol, f"BUY ({vol}股)", final_decision.get("reason", ""))
+    elif action == "SELL":
+        risk_sys.mock_sell_all(symbol)
+        notify_fn(symbol, "SELL", final_decision.get("reason", ""))
+    return action
+
+# ---------- 常驻流水线 (Long-lived pipeline) ----------
+
+class _Cycle:
+    """一轮扫描的进度跟踪，全部标的出流水线后完成 Future (Resolves once every symbol has left)"""
+    def __init__(self, symbols, deadline: float = None):
+        self.symbols = list(symbols)
+        self.deadline = deadline
+        self.remaining = len(self.symbols)
+        self.results = {}
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        self.started_at = time.monotonic()
+        self.future = concurrent.futures.Future()
+        if not self.symbols:
+            self.future.set_result({})
+
+    def finish(self, symbol: str, outcome: str):
+        self.results[symbol] = outcome
+        self.remaining -= 1
+        if self.remaining == 0:
+            wall = time.monotonic() - self.started_at
+            busiest = " | ".join(f"{s} {self.stage_seconds[s]:.1f}s" for s in STAGES)
+            log_info(f"[*] 决策流水线本轮完成 {len(self.symbols)} 个标的，墙钟 {wall:.1f}s (各阶段累计: {busiest})")
+            self.future.set_result(self.results)
+
+class DecisionPipeline:
+    def __init__(self, risk_sys, hud, stage_workers: dict = None, queue_size: int = AI_PIPELINE_QUEUE_SIZE,
+                 kline_fn=fetch_kline_snapshot_local, intel_fn=fetch_multi_dim_intelligence, llm_fn=ask_deepseek,
+                 batch_llm_fn=None, llm_batch_size: int = DEEPSEEK_BATCH_SIZE, notify_fn=send_mobile_notification):
+        """
+        :param stage_workers: 各阶段并发度，缺省取 config.AI_PIPELINE_STAGE_WORKERS
+        :param kline_fn / intel_fn / llm_fn: 可替换的数据源与大模型调用 (回放/测试时注入桩函数)
+        :param batch_llm_fn: 批量大模型调用，缺省仅在使用 ask_deepseek 时启用 ask_deepseek_batch
+                             (Batched LLM call; defaults to ask_deepseek_batch only when llm_fn is ask_deepseek)
+        :param llm_batch_size: 大模型阶段单批最多标的数，1 表示逐个调用 (Max symbols per LLM call)
+        :param notify_fn: 手机推送，回放时注入空函数 (Phone push; replay injects a no-op)
+        """
+        self.risk_sys = risk_sys
+        self.hud = hud
+        self.stage_workers = dict(AI_PIPELINE_STAGE_WORKERS, **(stage_workers or {}))
+        self.queue_size = queue_size
+        self.kline_fn = kline_fn
+        self.intel_fn = intel_fn
+        self.llm_fn = llm_fn
+        self.notify_fn = notify_fn
+        self.batch_llm_fn = batch_llm_fn if batch_llm_fn is not None else (ask_deepseek_batch if llm_fn is ask_deepseek else None)
+        self.llm_batch_size = llm_batch_size if self.batch_llm_fn is not None else 1
+
+        # 阶段函数都是阻塞调用 (网络/落盘)，统一放进一个常驻线程池；采集阶段每个标的占两个线程
+        # Blocking stage calls share one long-lived pool; each fetch uses two threads
+        pool_size = sum(self.stage_workers.values()) + self.stage_workers["fetch"]
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="ai_pipeline")
+        self.loop = None
+        self.queues = {}
+        self.tasks = []
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """在独立线程中启动常驻事件循环 (Run the event loop on its own thread)"""
+        self._thread = threading.Thread(target=self._run_loop, name="ai_pipeline_loop", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        log_info(f"[+] AI 决策流水线已就绪，各阶段并发度: {self.stage_workers}")
+        return self
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queues = {stage: asyncio.Queue(maxsize=self.queue_size) for stage in STAGES}
+        handlers = {
+            "fetch": self._fetch,
+            "feature": self._feature,
+            "llm": self._llm,
+            "risk": self._risk,
+            "execute": self._execute,
+        }
+        for i, stage in enumerate(STAGES):
+            next_stage = STAGES[i + 1] if i + 1 < len(STAGES) else None
+            if stage == "llm" and self.llm_batch_size > 1:
+                # 批量模式只有一个凑批协程，避免多个收集者按 FIFO 瓜分队列把批次拆碎；
+                # 凑好的批次并发发出，真实在途请求数由大模型调度器的 AIMD 上限控制
+                # One collector in batch mode (several would split batches between them); batches are
+                # dispatched concurrently and the LLM dispatcher's AIMD limit caps requests in flight
+                self.tasks.append(self.loop.create_task(self._batch_llm_collector(next_stage)))
+                continue
+            for _ in range(self.stage_workers[stage]):
+                self.tasks.append(self.loop.create_task(self._worker(stage, handlers[stage], next_stage)))
+        self._ready.set()
+        self.loop.run_forever()
+
+    async def _blocking(self, deadline, fn, *args):
+        """在线程池中执行阻塞调用，并把截止时间带进工作线程 (Carry the deadline into the worker thread)"""
+        return await self.loop.run_in_executor(self.executor, run_with_deadline, deadline, fn, *args)
+
+    async def _worker(self, stage: str, handler, next_stage: str):
+        queue = self.queues[stage]
+        while True:
+            item = await queue.get()
+            cycle = item["cycle"]
+            started = time.monotonic()
+            try:
+                try:
+                    if stage in DEADLINE_STAGES and cycle.deadline is not None and get_clock().time() >= cycle.deadline:
+                        outcome = OUTCOME_DEFERRED
+                    else:
+                        outcome = await handler(item)
+                except DeadlineExceeded as e:
+                    log_warn(f"[!] {item['symbol']} 在 [{stage}] 阶段赶不上截止时间，顺延至下一轮: {e}")
+                    outcome = OUTCOME_DEFERRED
+                except Exception as e:
+                    log_error(f"[-] AI 决策流水线 [{stage}] 处理标的 {item['symbol']} 时发生崩溃: {e}")
+                    outcome = f"ERROR: {e}"
+                cycle.stage_seconds[stage] += time.monotonic() - started
+                await self._route(item, outcome, next_stage)
+            finally:
+                # 交接完成后才标记完成，保证排空时按阶段 join 不会漏掉在途标的
+                # Marked done only after the hand-off so a stage-by-stage join never misses work
+                queue.task_done()
+
+    async def _route(self, item: dict, outcome, next_stage: str):
+        # handler 返回 None 表示继续流向下一阶段，否则为该标的的最终结果
+        # None means "hand on to the next stage"; anything else ends the symbol
+        if outcome is None and next_stage is not None:
+            await self.queues[next_stage].put(item)
+        else:
+            item["cycle"].finish(item["symbol"], outcome)
+
+    async def _collect_batch(self, queue: asyncio.Queue) -> list:
+        """
+        取一个标的后在 AI_LLM_BATCH_LINGER_SEC 内继续凑批，凑满或超时即返回
+        Take one item, then keep filling the batch until it is full or the linger time runs out.
+        """
+        batch = [await queue.get()]
+        linger_until = self.loop.time() + AI_LLM_BATCH_LINGER_SEC
+        while len(batch) < self.llm_batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = linger_until - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_llm_collector(self, next_stage: str):
+        """
+        大模型阶段的唯一凑批协程: 凑好一批即交给独立任务发出，同时发出的批次不超过 llm 阶段并发度 (占用线程池)
+        The single batching coroutine of the LLM stage: each full batch runs as its own task, with at
+        most stage_workers["llm"] batches running at once (each holds a pool thread).
+        """
+        queue = self.queues["llm"]
+        slots = asyncio.Semaphore(self.stage_workers["llm"])
+        while True:
+            await slots.acquire()
+            try:
+                batch = await self._collect_batch(queue)
+            except BaseException:
+                slots.release()
+                raise
+            task = self.loop.create_task(self._run_llm_batch(batch, next_stage))
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_llm_batch(self, batch: list, next_stage: str):
+        """一批标的合并为一次请求 (Several symbols per request)"""
+        queue = self.queues["llm"]
+        started = time.monotonic()
+        try:
+            now = get_clock().time()
+            live = [item for item in batch if item["cycle"].deadline is None or now < item["cycle"].deadline]
+            outcomes = {id(item): OUTCOME_DEFERRED for item in batch}
+            if live:
+                deadlines = [item["cycle"].deadline for item in live if item["cycle"].deadline is not None]
+                symbols = [item["symbol"] for item in live]
+                try:
+                    decisions = await self._blocking(min(deadlines) if deadlines else None, consult_llm_batch,
+                                                     {item["symbol"]: (item["market_data"], item["intel"]) for item in live},
+                                                     self.hud, self.batch_llm_fn)
+                    for item in live:
+                        item["decision"] = decisions[item["symbol"]]
+                        outcomes[id(item)] = None
+                except DeadlineExceeded as e:
+                    log_warn(f"[!] {symbols} 在 [llm] 阶段赶不上截止时间，顺延至下一轮: {e}")
+                except Exception as e:
+                    log_error(f"[-] AI 决策流水线 [llm] 批量处理 {symbols} 时发生崩溃: {e}")
+                    outcomes.update({id(item): f"ERROR: {e}" for item in live})
+            elapsed = time.monotonic() - started
+            for cycle in {id(item["cycle"]): item["cycle"] for item in batch}.values():
+                cycle.stage_seconds["llm"] += elapsed
+            for item in batch:
+                await self._route(item, outcomes[id(item)], next_stage)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+    async def _fetch(self, item: dict):
+        symbol = item["symbol"]
+        self.hud.update_status(symbol, "SCANNING...")
+        # K 线 (本地合成 + 流式指标) 与多维情报两路并行 (Kline snapshot and intelligence in parallel)
+        item["snapshot"], item["intel"] = await asyncio.gather(
+            self._blocking(item["cycle"].deadline, self.kline_fn, symbol, "60"),
+            self._blocking(item["cycle"].deadline, self.intel_fn, symbol),
+        )
+        return None if item["snapshot"] else "NO_DATA"
+
+    async def _feature(self, item: dict):
+        item["market_data"] = build_features(item["snapshot"])
+        exited = await self._blocking(None, pre_trade_guard, item["symbol"], item["market_data"], self.risk_sys, self.hud, self.notify_fn)
+        return "SELL_ALL" if exited else None
+
+    async def _llm(self, item: dict):
+        item["decision"] = await self._blocking(item["cycle"].deadline, consult_llm, item["symbol"], item["market_data"], item["intel"], self.hud, self.llm_fn)
+        return None
+
+    async def _risk(self, item: dict):
+        item["final"] = apply_risk(item["symbol"], item["decision"], item["market_data"], self.risk_sys)
+        return None
+
+    async def _execute(self, item: dict):
+        return await self._blocking(None, execute_decision, item["symbol"], item["final"], item["market_data"], self.risk_sys, self.hud,
+                                   self.notify_fn)
+
+    async def _enqueue(self, cycle: _Cycle):
+        for symbol in cycle.symbols:
+            # 队列满时在此等待，形成反压 (Waits here when the fetch queue is full)
+            await self.queues["fetch"].put({"symbol": symbol, "cycle": cycle})
+
+    def submit(self, symbols, deadline: float = None) -> concurrent.futures.Future:
+        """
+        按给定顺序提交一轮标的，返回 {symbol: 最终动作} 的 Future；deadline 为 epoch 秒，
+        到期仍未进入风控阶段的标的记为 DEFERRED
+        Submit symbols in priority order; symbols that miss `deadline` resolve as DEFERRED.
+        """
+        cycle = _Cycle(symbols, deadline)
+        if cycle.symbols:
+            asyncio.run_coroutine_threadsafe(self._enqueue(cycle), self.loop)
+        return cycle.future
+
+    def run_cycle(self, symbols, deadline: float = None, timeout: float = None) -> dict:
+        """提交一轮并阻塞等待完成 (Submit a cycle and wait for it)"""
+        return self.submit(symbols, deadline).result(timeout=timeout)
+
+    async def _drain(self):
+        for stage in STAGES:
+            await self.queues[stage].join()
+        for task in self.tasks:
+            task.cancel()
+
+    def stop(self, timeout: float = 60):
+        """优雅退出：等在途标的走完流水线，再关闭事件循环与线程池 (Drain in-flight work, then shut down)"""
+        if self.loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._drain(), self.loop).result(timeout=timeout)
+        except Exception as e:
+            log_error(f"[-] AI 决策流水线排空超时或失败: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.executor.shutdown(wait=True)
@@ -1,8 +1,9 @@
 import pandas as pd
-import akshare as ak
 import datetime
 import random
 from config import setup_global_proxy
+from bar_store import get_bar_store
+import indicators
 from deepseek_brain import ask_deepseek
 from execution_risk import LocalRiskController
 
@@ -32,17 +33,14 @@ class TimeMachineBacktester:
         """
         print(f"[*] 正在拉取 {self.symbol} 从 {start_date} 到 {end_date} 的前复权日线数据...")
         try:
-            # 港股日线前复权数据获取 (Daily forward-adjusted K-line)
-            df = ak.stock_hk_hist(symbol=self.symbol, period="daily", start_date=start_date, end_date=end_date, adjust="qfq")
+            # 港股日线前复权数据获取 (Daily forward-adjusted K-line, served by the local bar store)
+            df = get_bar_store().sync(self.symbol, "daily")
             df['日期'] = pd.to_datetime(df['日期'])
             df.set_index('日期', inplace=True)
+            df = df.loc[pd.to_datetime(start_date):pd.to_datetime(end_date)].copy()
             
-            # 预热计算 RSI (RSI calculation)
-            delta = df['收盘'].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-            rs = gain / loss
-            df['RSI_14'] = 100 - (100 / (1 + rs))
+            # 预热计算 RSI (RSI calculation via the shared panel library)
+            df['RSI_14'] = indicators.rsi_simple(df['收盘'].to_numpy(dtype=float))[0]
             df.dropna(inplace=True)
             return df
         except Exception as e:
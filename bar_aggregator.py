@@ -0,0 +1,164 @@
+import threading
+import datetime
+import collections
+import pandas as pd # type: ignore
+from config import BAR_AGG_PERIODS, BAR_AGG_MAX_BARS, BAR_AGG_RECONCILE_TOLERANCE # type: ignore
+from market_hours import bar_end, next_bar_end # type: ignore
+from debug_sentinel import log_info, log_warn # type: ignore
+
+# ==========================================
+# Phase 32: Local Intraday Bar Aggregator (由高频快照合成分时 K 线)
+# ==========================================
+# 高频雷达每轮都能看到所有监控标的的最新价与累计成交量，这里把这条快照流在内存中合成为
+# 1/5/15/60 分钟 OHLCV K 线。切分规则与东财一致: 按收线时刻标记，早/午两个时段各自从开盘切分，
+# 午休与盘前盘后的快照直接丢弃 (与 fetch_and_clean_kline_data 的时段清洗相同)。
+# 收盘后与东财 K 线对账，以东财为准覆盖本地合成结果，并记录偏差。
+# Builds 1/5/15/60-minute OHLCV bars in memory from the tick snapshot stream, labelled by bar
+# close like the vendor and bucketed per HK session (lunch-break ticks are dropped). After the
+# close the bars are reconciled against the vendor, whose values win.
+
+# 合成 K 线的列，与东财分时 K 线同名 (Same column names as the vendor minute bars)
+BAR_COLUMNS = ["开盘", "收盘", "最高", "最低", "成交量"]
+
+class BarAggregator:
+    def __init__(self, periods=BAR_AGG_PERIODS, max_bars: int = BAR_AGG_MAX_BARS):
+        self.periods = [int(p) for p in periods]
+        self.max_bars = max_bars
+        self._bars = {}          # (symbol, period) -> deque[bar dict]，按收线时间升序
+        self._first_seen = {}    # symbol -> 本进程首次收到该标的快照的时间 (First tick seen)
+        self._last_volume = {}   # symbol -> 上一笔累计成交量 (Last cumulative volume)
+        self.lock = threading.Lock()
+
+    def ingest(self, symbol: str, ts: datetime.datetime, price: float, cum_volume: float = None):
+        """
+        吞入一笔快照报价 (ts 为不带时区的香港本地时间，cum_volume 为当日累计成交量)
+        Consume one quote; ts is naive HK local time, cum_volume the day's cumulative volume.
+        """
+        if price is None or price != price or price <= 0:
+            return
+        labels = {p: bar_end(ts, p) for p in self.periods}
+        if labels[self.periods[0]] is None:
+            return  # 午休 / 盘前 / 盘后 (Outside the continuous sessions)
+
+        with self.lock:
+            volume = 0.0
+            if cum_volume is not None and cum_volume == cum_volume:
+                last = self._last_volume.get(symbol)
+                # 首笔快照或跨日累计量回落时只建立基准，不计入成交量 (New baseline on first tick / new day)
+                if last is not None and cum_volume >= last:
+                    volume = cum_volume - last
+                self._last_volume[symbol] = cum_volume
+            first_seen = self._first_seen.setdefault(symbol, ts)
+
+            for period, label in labels.items():
+                bars = self._bars.setdefault((symbol, period), collections.deque(maxlen=self.max_bars))
+                if bars and bars[-1]["时间"] == label:
+                    bar = bars[-1]
+                    bar["收盘"] = price
+                    bar["最高"] = max(bar["最高"], price)
+                    bar["最低"] = min(bar["最低"], price)
+                    bar["成交量"] += volume
+                elif not bars or bars[-1]["时间"] < label:
+                    bars.append({
+                        "时间": label, "开盘": price, "收盘": price, "最高": price, "最低": price, "成交量": volume,
+                        # 本进程在该 K 线开始前已在接收快照，合成结果才完整 (Complete only if seen from its start)
+                        "full": first_seen <= label - datetime.timedelta(minutes=period),
+                    })
+
+    def bars(self, symbol: str, period: int, full_only: bool = False) -> pd.DataFrame:
+        """合成 K 线 (时间索引)，无数据时返回 None (Aggregated bars with a datetime index)"""
+        with self.lock:
+            rows = [dict(b) for b in self._bars.get((symbol, int(period)), ())]
+        if full_only:
+            rows = [r for r in rows if r["full"]]
+        if not rows:
+            return None
+        return pd.DataFrame(rows).set_index("时间")[BAR_COLUMNS]
+
+    def extend_history(self, symbol: str, period: int, stored: pd.DataFrame):
+        """
+        用本地合成 K 线接续仓库中的历史 K 线 (时间索引)，零网络请求。
+        合成序列必须从仓库最后一根 (可能是同步时尚未收线的临时 K 线) 或紧随其后的一根起完整连续，
+        否则返回 None，由调用方退回东财同步。
+        Continue stored history with the locally built bars, with no network calls. The live bars
+        must be complete and contiguous from the stored last bar (which may have been captured
+        while still forming); otherwise None is returned and the caller falls back to the vendor.
+        """
+        live = self.bars(symbol, period)
+        if stored is None or stored.empty or live is None:
+            return None
+        stored_last = stored.index[-1]
+        live = live[live.index >= stored_last]
+        full = self._full_flags(symbol, period, live.index)
+        if live.empty or not all(full):
+            return None
+
+        expected = stored_last if live.index[0] == stored_last else next_bar_end(stored_last.to_pydatetime(), int(period))
+        for label in live.index:
+            if label != expected:
+                return None
+            expected = next_bar_end(label.to_pydatetime(), int(period))
+
+        # 仓库的最后一根若在同步时仍在走，以本地合成的完整 K 线为准 (Live bars replace a stale forming bar)
+        merged = pd.concat([stored[stored.index < live.index[0]], live])
+        merged.index.name = "时间"
+        return merged
+
+    def _full_flags(self, symbol: str, period: int, labels) -> list:
+        with self.lock:
+            flags = {b["时间"]: b["full"] for b in self._bars.get((symbol, int(period)), ())}
+        return [flags.get(label.to_pydatetime(), False) for label in labels]
+
+    def is_current(self, symbol: str, period: int, now: datetime.datetime) -> bool:
+        """合成序列是否已覆盖到当前时刻所在的 K 线 (Whether the live bars reach the current bar)"""
+        label = bar_end(now, int(period))
+        with self.lock:
+            bars = self._bars.get((symbol, int(period)))
+            return bool(bars) and (label is None or bars[-1]["时间"] >= label)
+
+    def symbols(self) -> list:
+        with self.lock:
+            return sorted({sym for sym, _ in self._bars})
+
+    def reconcile(self, symbol: str, period: int, vendor_df: pd.DataFrame) -> dict:
+        """
+        收盘对账：与东财 K 线 (时间索引) 逐根比较收盘价，记录偏差后丢弃已被东财覆盖的本地 K 线
+        Compare closes against the vendor bars, log the drift, then drop the locally built bars the
+        vendor now covers (the stored vendor history is authoritative from here on).
+        """
+        live = self.bars(symbol, period)
+        report = {"symbol": symbol, "period": int(period), "compared": 0, "max_drift": 0.0, "missing": 0}
+        if live is None or vendor_df is None or vendor_df.empty:
+            return report
+
+        common = live.index.intersection(vendor_df.index)
+        report["missing"] = int(len(live.index.difference(vendor_df.index)))
+        if len(common):
+            local_close = live.loc[common, "收盘"].astype(float)
+            vendor_close = vendor_df.loc[common, "收盘"].astype(float)
+            drift = ((local_close - vendor_close).abs() / vendor_close).max()
+            report["compared"] = int(len(common))
+            report["max_drift"] = float(drift)
+            if drift > BAR_AGG_RECONCILE_TOLERANCE:
+                log_warn(f"[!] {symbol}/{period} 本地合成 K 线与东财最大收盘偏差 {drift * 100:.3f}%，以东财为准。")
+
+        covered_until = vendor_df.index[-1].to_pydatetime()
+        with self.lock:
+            bars = self._bars.get((symbol, int(period)))
+            while bars and bars[0]["时间"] <= covered_until:
+                bars.popleft()
+        log_info(f"[+] {symbol}/{period} 收盘对账完成: 比对 {report['compared']} 根，"
+                 f"最大偏差 {report['max_drift'] * 100:.3f}%，东财缺失 {report['missing']} 根。")
+        return report
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_aggregator = None
+_default_aggregator_guard = threading.Lock()
+
+def get_bar_aggregator() -> BarAggregator:
+    """获取进程级共享的分时 K 线合成器 (Get the process-wide bar aggregator)"""
+    global _default_aggregator
+    with _default_aggregator_guard:
+        if _default_aggregator is None:
+            _default_aggregator = BarAggregator()
+        return _default_aggregator
@@ -0,0 +1,194 @@
+import os
+import threading
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+import akshare as ak # type: ignore
+from config import BAR_STORE_DIR, BAR_STORE_ANCHOR_BARS, BAR_STORE_QFQ_TOLERANCE # type: ignore
+from rate_limiter import limited_call # type: ignore
+from debug_sentinel import log_info, log_error, log_warn # type: ignore
+
+# ==========================================
+# Phase 20: Local Bar Store (本地增量 K 线仓库)
+# ==========================================
+# 采集层 / 选股雷达 / 时光机回测 三方共享的本地列式 K 线仓库。
+# 每个 (标的, 周期) 落盘为一个 .npz 文件，每一列单独存放为一个 NumPy 数组。
+# 同步时只向 AkShare 请求最后一根已存 K 线之后的增量数据，并通过回看锚点 K 线
+# 侦测前复权 (qfq) 因分红派息而整体改写历史的情况，一旦侦测到立即全量重建。
+# Shared columnar bar store for harvester, scanner and backtester. Sync is append-only:
+# only bars after the last stored timestamp are requested, and a few already-closed
+# anchor bars are re-fetched to detect qfq history rewrites (dividends) and rebuild.
+
+# 日线使用 "日期" 作为时间列，分钟线使用 "时间" (Time column naming follows AkShare)
+DAILY_PERIOD = "daily"
+MINUTE_PERIODS = ("1", "5", "15", "30", "60")
+
+def time_column_for(period: str) -> str:
+    """返回对应周期在 AkShare 原始数据中的时间列名 (Time column name for a period)"""
+    return "日期" if period == DAILY_PERIOD else "时间"
+
+class LocalBarStore:
+    def __init__(self, root_dir: str = BAR_STORE_DIR):
+        """
+        本地列式 K 线仓库 (Local Columnar Bar Store)
+        目录结构: {root_dir}/{period}/{symbol}.npz
+        """
+        self.root_dir = root_dir
+        self._locks = {}
+        self._locks_guard = threading.Lock() # 保护锁字典本身 (Guards the per-key lock table)
+
+    def _lock_for(self, symbol: str, period: str) -> threading.Lock:
+        """每个 (标的, 周期) 独占一把锁，不同标的之间互不阻塞"""
+        with self._locks_guard:
+            key = (symbol, period)
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def _path_for(self, symbol: str, period: str) -> str:
+        return os.path.join(self.root_dir, period, f"{symbol}.npz")
+
+    # ------------------------------------------
+    # 落盘读写 (Columnar persistence)
+    # ------------------------------------------
+
+    def load(self, symbol: str, period: str):
+        """
+        纯本地读取已落盘的 K 线 (不触网)，不存在时返回 None
+        Load stored bars from disk only (no network). Returns None when absent.
+        """
+        path = self._path_for(symbol, period)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                columns = [str(c) for c in data["__columns__"]]
+                time_col = time_column_for(period)
+                frame = {time_col: pd.to_datetime(data["__time__"])}
+                for col in columns:
+                    frame[col] = data[col]
+            return pd.DataFrame(frame)
+        except Exception as e:
+            log_error(f"[-] 本地 K 线仓库读取失败 ({symbol}/{period}): {e}")
+            return None
+
+    def _save(self, symbol: str, period: str, df: pd.DataFrame):
+        """原子级写入 (tmp + os.replace)，与持仓落盘保持同样的防断电策略"""
+        time_col = time_column_for(period)
+        path = self._path_for(symbol, period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        value_cols = [c for c in df.columns if c != time_col]
+        arrays = {
+            "__time__": df[time_col].values.astype("datetime64[ns]"),
+            "__columns__": np.array(value_cols, dtype=str),
+        }
+        for col in value_cols:
+            arrays[col] = df[col].to_numpy(dtype=np.float64)
+
+        tmp_path = path + ".tmp.npz"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log_error(f"[-] 本地 K 线仓库落盘失败 ({symbol}/{period}): {e}")
+
+    # ------------------------------------------
+    # 上游抓取 (Upstream fetch)
+    # ------------------------------------------
+
+    def _fetch(self, symbol: str, period: str, start=None):
+        """
+        从 AkShare 拉取前复权 K 线; start 为 None 时拉取全量历史
+        Fetch qfq bars from AkShare; full history when start is None.
+        """
+        time_col = time_column_for(period)
+        if period == DAILY_PERIOD:
+            start_date = start.strftime("%Y%m%d") if start is not None else "19700101"
+            df = limited_call("eastmoney", ak.stock_hk_hist, symbol=symbol, period="daily", start_date=start_date, end_date="22220101", adjust="qfq")
+        elif period in MINUTE_PERIODS:
+            start_date = start.strftime("%Y-%m-%d %H:%M:%S") if start is not None else "1979-09-01 09:32:00"
+            df = limited_call("eastmoney", ak.stock_hk_hist_min_em, symbol=symbol, period=period, adjust="qfq", start_date=start_date, end_date="2222-01-01 09:32:00")
+        else:
+            raise ValueError(f"[!] 不支持的 K 线周期: {period}")
+
+        if df is None or df.empty:
+            return None
+
+        df = df.copy()
+        df[time_col] = pd.to_datetime(df[time_col])
+        # 只保留数值列，保证列式落盘的类型统一 (Keep numeric columns only for a uniform columnar layout)
+        for col in df.columns:
+            if col != time_col:
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        df = df.dropna(axis=1, how="all")
+        df = df.drop_duplicates(subset=time_col, keep="last").sort_values(time_col)
+        return df.reset_index(drop=True)
+
+    def _rebuild(self, symbol: str, period: str):
+        """全量重建 (Full rebuild)"""
+        fresh = self._fetch(symbol, period)
+        if fresh is not None:
+            self._save(symbol, period, fresh)
+            log_info(f"[+] 本地 K 线仓库全量建档: {symbol}/{period} 共 {len(fresh)} 根。")
+        return fresh
+
+    def _qfq_rewritten(self, stored: pd.DataFrame, fresh: pd.DataFrame, time_col: str) -> bool:
+        """
+        比对锚点 K 线 (已收盘) 的收盘价，判断历史是否被前复权改写
+        Compare closes of closed anchor bars to detect a qfq history rewrite.
+        """
+        # 最后一根已存 K 线可能是盘中未走完的 K 线，不参与比对 (The last stored bar may still be forming)
+        anchors = stored.iloc[-BAR_STORE_ANCHOR_BARS:-1]
+        if anchors.empty:
+            return False
+        overlap = anchors[[time_col, "收盘"]].merge(fresh[[time_col, "收盘"]], on=time_col, how="left", suffixes=("_old", "_new"))
+        if overlap["收盘_new"].isna().any():
+            # 上游不再返回锚点 K 线，无法校验连续性，按改写处理 (Anchor vanished upstream: treat as rewrite)
+            return True
+        drift = ((overlap["收盘_new"] - overlap["收盘_old"]).abs() / overlap["收盘_old"].abs()).max()
+        return bool(drift > BAR_STORE_QFQ_TOLERANCE)
+
+    def sync(self, symbol: str, period: str):
+        """
+        增量同步并返回该标的的完整 K 线 (时间列为普通列，与 AkShare 原始格式一致)
+        Incrementally sync and return the full bar history (same layout as raw AkShare output).
+        """
+        time_col = time_column_for(period)
+        with self._lock_for(symbol, period):
+            stored = self.load(symbol, period)
+            if stored is None or len(stored) < BAR_STORE_ANCHOR_BARS:
+                return self._rebuild(symbol, period)
+
+            anchor_ts = stored[time_col].iloc[-BAR_STORE_ANCHOR_BARS]
+            fresh = self._fetch(symbol, period, start=anchor_ts)
+            if fresh is None:
+                # 上游暂无新数据或网络抖动，退回本地存量 (Upstream empty: serve what we have)
+                return stored
+
+            if self._qfq_rewritten(stored, fresh, time_col):
+                log_warn(f"[!] 侦测到 {symbol}/{period} 前复权历史被改写 (分红/派息)，触发全量重建...")
+                rebuilt = self._rebuild(symbol, period)
+                return rebuilt if rebuilt is not None else stored
+
+            first_new_ts = fresh[time_col].iloc[0]
+            merged = pd.concat([stored[stored[time_col] < first_new_ts], fresh], ignore_index=True)
+            appended = len(merged) - len(stored)
+            # 即使没有新增 K 线，盘中最后一根也可能被刷新，因此总是落盘 (The forming bar may have changed)
+            self._save(symbol, period, merged)
+            log_info(f"[*] 本地 K 线仓库增量同步: {symbol}/{period} 新增 {max(appended, 0)} 根 (共 {len(merged)} 根)。")
+            return merged
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_store = None
+_default_store_guard = threading.Lock()
+
+def get_bar_store() -> LocalBarStore:
+    """获取进程级共享的 K 线仓库实例 (Get the process-wide bar store)"""
+    global _default_store
+    with _default_store_guard:
+        if _default_store is None:
+            _default_store = LocalBarStore()
+        return _default_store
@@ -20,6 +20,232 @@ PROXIES = {
 # Suppress urllib3 HTTPS warnings (Prevent console from being flooded)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# === 本地 K 线仓库配置 (Local Bar Store Configuration) ===
+
+# 按 标的/周期 落盘的列式 K 线仓库根目录 (Root dir of the per-symbol, per-period columnar bar store)
+BAR_STORE_DIR = "bar_store"
+# 增量同步时回看的已收盘锚点 K 线数量，用于侦测前复权改写历史 (Anchor bars re-fetched to detect qfq rewrites)
+BAR_STORE_ANCHOR_BARS = 2
+# 锚点收盘价相对偏差超过该阈值即判定为除权改写，触发全量重建 (Relative close drift that triggers a full rebuild)
+BAR_STORE_QFQ_TOLERANCE = 1e-4
+
+# === 流式指标状态配置 (Streaming Indicator State Configuration) ===
+
+# 每个 标的/周期 的 RSI/MACD 累加器落盘目录，重启后可直接续算 (Persisted accumulators survive restarts)
+INDICATOR_STATE_DIR = "indicator_state"
+
+# === 情报缓存配置 (Intelligence Cache Configuration) ===
+
+# 财联社宏观电报为全市场共享数据源，同一轮扫描内所有标的复用一份 (Shared macro feed TTL, seconds)
+MACRO_NEWS_TTL_SEC = 300
+# 个股新闻按标的独立缓存，过期更快 (Per-symbol stock news TTL, seconds)
+STOCK_NEWS_TTL_SEC = 120
+
+# === 大模型流式回复配置 (Streaming LLM Reply Configuration) ===
+
+# 以 SSE 流式接收回复，思考内容边到边丢弃，截取到完整决策 JSON 即返回 (Stream and return on the first full JSON)
+DEEPSEEK_STREAM = True
+# 思考过程旁路日志目录，空字符串表示不记录 (Side log dir for reasoning text; empty disables it)
+DEEPSEEK_REASONING_LOG_DIR = ""
+# 截取到决策后最多再读多少字节的剩余回复以便连接回池复用，超过则直接关闭连接 (Drain cap for connection reuse)
+DEEPSEEK_STREAM_DRAIN_MAX_BYTES = 64 * 1024
+
+# === 大模型自适应并发配置 (Adaptive LLM Concurrency Configuration) ===
+
+# AIMD 在途请求上限: 成功时缓慢上调，429/超时/延迟越线时乘以 LLM_AIMD_DECREASE (AIMD in-flight limit)
+LLM_MIN_IN_FLIGHT = 1
+LLM_MAX_IN_FLIGHT = 8
+LLM_INITIAL_IN_FLIGHT = 2
+LLM_AIMD_DECREASE = 0.5
+# 单次调用超过该秒数也视为拥塞信号 (Calls slower than this count as congestion)
+LLM_LATENCY_CEILING_SEC = 45
+# 重试退避: full-jitter 指数退避的基数与上限，服务端给出 Retry-After 时以其为准 (Backoff base / cap, seconds)
+LLM_BACKOFF_BASE_SEC = 1.0
+LLM_BACKOFF_MAX_SEC = 30
+# 对冲请求: 调用超过近期延迟该分位仍未返回且有空闲名额时再发一份 (Hedge past this latency percentile)
+LLM_HEDGE_ENABLED = True
+LLM_HEDGE_PERCENTILE = 0.9
+# 至少积累该数量的延迟样本后才开始对冲 (Latency samples needed before hedging)
+LLM_HEDGE_MIN_SAMPLES = 10
+
+# === HTTP 连接池配置 (Pooled HTTP Client Configuration) ===
+
+# 每个主机的最大长连接数，池满时排队等待空闲连接 (Per-host keep-alive connection caps; callers wait when full)
+HTTP_POOL_LIMITS = {
+    "api.deepseek.com": 8,
+    "sctapi.ftqq.com": 2,
+    "default": 4,
+}
+# 异步变体使用的线程数 (Threads behind the asyncio variant)
+HTTP_ASYNC_WORKERS = 8
+
+# === 大模型决策缓存配置 (LLM Decision Cache Configuration) ===
+
+DECISION_CACHE_FILE = "decision_cache.json"
+# 略长于一个 60 分钟决策间隔，行情与新闻未变时下一轮可直接复用 (Slightly over one hourly cycle)
+DECISION_CACHE_TTL_SEC = 3900
+DECISION_CACHE_MAX_ENTRIES = 512
+# 价格的相对量化步长 (0.5%)，以及其余特征的绝对量化步长 (Quantization steps for the cache key)
+DECISION_CACHE_PRICE_STEP = 0.005
+DECISION_CACHE_FEATURE_STEPS = {"RSI_14": 2.0, "MACD_HIST": 0.05}
+
+# === 大模型触发门配置 (LLM Novelty/Drift Gate Configuration) ===
+
+# 无新标题且特征漂移未过阈值时沿用上次决策，不调用大模型 (Skip the LLM when nothing new arrived)
+LLM_GATE_ENABLED = True
+LLM_GATE_FILE = "llm_gate_state.json"
+# 无论有无新信息，距上次真实决策超过该秒数都强制重新推理 (Force a fresh decision after this long)
+LLM_GATE_MAX_AGE_SEC = 4 * 3600
+# 价格相对上次决策的相对变动阈值 (1.5%)，以及其余特征的绝对变动阈值；MACD 柱翻转总会触发
+# Relative price move and absolute feature moves that trigger a call; a MACD histogram flip always does
+LLM_GATE_PRICE_MOVE = 0.015
+LLM_GATE_FEATURE_MOVES = {"RSI_14": 5.0, "MACD_HIST": 0.1}
+
+# === 本地情绪分诊配置 (Local Sentiment Triage Configuration) ===
+
+# 只有情绪或技术面越过阈值的标的才升级给大模型，其余本地 HOLD (Escalate only symbols past a threshold)
+SENTIMENT_TRIAGE_ENABLED = True
+# 个股新闻/宏观电报情绪分 (取值 [-1, 1]) 的绝对值阈值 (Absolute sentiment thresholds per feed)
+SENTIMENT_MICRO_THRESHOLD = 0.3
+SENTIMENT_MACRO_THRESHOLD = 0.6
+# RSI 落在该区间外视为技术面有信号 (RSI outside this band counts as a technical signal)
+SENTIMENT_RSI_BAND = (35, 65)
+# 原始词典得分经 tanh(得分 / SENTIMENT_SCALE) 归一化 (Squash scale for raw lexicon scores)
+SENTIMENT_SCALE = 3.0
+
+# === 上游限速配置 (Upstream Rate Limit Configuration) ===
+
+# 每个上游主机一个令牌桶: rate 为每秒补充的令牌数，burst 为允许的瞬时突发数
+# One token bucket per upstream host: rate = tokens per second, burst = bucket capacity
+RATE_LIMITS = {
+    "eastmoney": {"rate": 3.0, "burst": 5},   # 东方财富 (行情/K线/个股新闻)
+    "cls": {"rate": 0.5, "burst": 2},         # 财联社电报
+    "deepseek": {"rate": 2.0, "burst": 4},    # DeepSeek API
+    "default": {"rate": 1.0, "burst": 2},
+}
+# 单次排队超过该秒数时写入 debug 日志 (Queue waits above this are logged)
+RATE_LIMIT_WAIT_LOG_SEC = 0.5
+
+# === AI 决策流水线配置 (AI Decision Pipeline Configuration) ===
+
+# 每个阶段的并发度；真正的出网节奏仍由上面的令牌桶控制 (Per-stage concurrency; pacing stays with the buckets)
+AI_PIPELINE_STAGE_WORKERS = {
+    "fetch": 4,      # K 线 + 情报采集 (每个标的两路并行)
+    "feature": 2,    # 特征构建 + 止损前置检查
+    "llm": 8,        # DeepSeek 推理 (最慢的一段)；批量模式下为同时发出的批次数，真实在途数由 AIMD 调度器控制
+    "risk": 1,       # 本地双重副驾驶审核
+    "execute": 1,    # 下单落盘 / UI / 推送，串行保证持仓写入有序
+}
+# 阶段之间的队列上限，下游堵塞时上游自动减速 (Bounded hand-off queues give backpressure)
+AI_PIPELINE_QUEUE_SIZE = 8
+# 每轮决策的截止时间 = 下一根 60 分钟 K 线收线前该秒数，未完成的标的顺延到下一轮 (Deadline margin, seconds)
+AI_CYCLE_DEADLINE_MARGIN_SEC = 120
+# 自选股打分来源: 选股雷达导出的 Top 20 表 (Scanner export used to order the watchlist by score)
+AI_CYCLE_SCORE_FILE = "top20_promising_stocks.csv"
+
+# === 大模型批量决策配置 (Batched LLM Decision Configuration) ===
+
+# 一次推理请求最多覆盖的标的数，1 表示关闭批量模式 (Symbols per request; 1 disables batching)
+DEEPSEEK_BATCH_SIZE = 6
+# 单批提示词的 token 预算 (粗略估算)，超出则拆成下一批 (Estimated prompt-token budget per batch)
+DEEPSEEK_BATCH_MAX_PROMPT_TOKENS = 12000
+# 大模型阶段凑批时最多等待后续标的的秒数 (How long the LLM stage waits to fill a batch)
+AI_LLM_BATCH_LINGER_SEC = 1.0
+
+# === 选股雷达配置 (Market Scanner Configuration) ===
+
+# 流动性初筛保留的标的数量 (Liquidity prefilter size)
+SCANNER_TOP_N = 100
+# 深度计算并发线程数；出网节奏仍由东财令牌桶控制 (Scan workers; pacing still via the eastmoney bucket)
+SCANNER_MAX_WORKERS = 8
+# 历史 K 线拉取失败重试间的指数退避 (带全抖动): 第 n 次重试前随机等待 [0, min(上限, 基数 * 2^n)] 秒
+# Full-jitter exponential backoff between history-fetch retries
+SCANNER_RETRY_BACKOFF_BASE_SEC = 1.0
+SCANNER_RETRY_BACKOFF_MAX_SEC = 15.0
+
+# 全市场分级漏斗 (--funnel): 第一级只用快照列给全部港股打分，第二级才为幸存者拉取历史 K 线
+# Tiered funnel: tier one ranks the whole market from the spot snapshot, tier two pays for history
+SCANNER_FUNNEL_TIERS = [
+    {"name": "spot_snapshot", "keep": 300, "time_budget_sec": 15},
+    {"name": "history_deep_scan", "keep": 20, "time_budget_sec": 300},
+]
+# 盘中增量重排间隔 (分钟)，每轮只消耗一次全市场快照请求 (Intraday re-rank interval, minutes)
+SCANNER_INTRADAY_INTERVAL_MIN = 15
+
+# Top 20 图表输出: "png" (低 dpi) / "svg" / "none" (不出图，也不加载 matplotlib)
+# Chart output format; "none" skips rendering and never imports matplotlib
+CHART_FORMAT = "png"
+CHART_DPI = 100
+
+# 扫描断点目录，每个交易日一个 JSONL 文件 (Per-trading-day scan checkpoint directory)
+SCAN_CHECKPOINT_DIR = "scan_checkpoints"
+
+# 第一级快照打分各维度的权重 (按全市场百分位排名加权) (Percentile-rank weights for tier one)
+SCANNER_SNAPSHOT_WEIGHTS = {"涨跌幅": 0.4, "成交额": 0.4, "振幅": 0.2}
+
+# === 本地消息总线配置 (Local IPC Bus Configuration) ===
+
+# 仅监听本机回环地址，Windows / Linux 通用 (Loopback only; works on Windows and Linux)
+BUS_HOST = "127.0.0.1"
+BUS_PORT = 8765
+# 握手令牌文件: 守护进程每次启动随机生成并以 0600 权限写入，订阅端读取后出示 (Per-run token, mode 0600)
+BUS_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".deepseek_quant_bus_token")
+# 单条消息帧的上限，超出即断开该连接 (Largest accepted frame, bytes)
+BUS_MAX_FRAME_BYTES = 16 * 1024 * 1024
+# 每个订阅者的待发送帧上限: 订阅者读得太慢 (或停止读取) 导致队列溢出时直接断开它，发布方永不阻塞
+# Outbound frames buffered per subscriber; a subscriber that overflows it is dropped so publish never blocks
+BUS_CLIENT_QUEUE_MAX = 1024
+# 总线在线时 realtime_cache.json 降级为兜底快照，只需低频落盘 (Fallback snapshot interval, seconds)
+REALTIME_CACHE_SNAPSHOT_SEC = 60
+# 大屏局部刷新间隔；总线模式下只读内存，可以远快于原先的 2 秒文件轮询 (Dashboard refresh, seconds)
+DASHBOARD_REFRESH_SEC = 0.5
+
+# === 高频雷达自适应轮询配置 (Adaptive Tick Polling Configuration) ===
+
+# 轮询间隔上下限 (秒)：持仓逼近止损/止盈防线时收紧到下限，全部远离时放宽到上限
+# Poll interval bounds: tighten near a stop trigger, back off when everything is far away
+TICK_INTERVAL_MIN_SEC = 2.0
+TICK_INTERVAL_MAX_SEC = 15.0
+# 现价距最近触发价的相对距离阈值: 小于 NEAR 用最快轮询，大于 FAR 用最慢轮询，中间线性过渡
+# Distance-to-trigger band: <= NEAR polls fastest, >= FAR polls slowest, linear in between
+TICK_STOP_NEAR_PCT = 0.01
+TICK_STOP_FAR_PCT = 0.05
+# 高频雷达最多占用东财令牌桶速率的比例，给 K 线与新闻留出配额 (Share of the eastmoney quota for ticks)
+TICK_RATE_BUDGET_SHARE = 0.5
+
+# === 本地分时 K 线合成配置 (Local Intraday Bar Aggregation Configuration) ===
+
+# 由高频快照在内存中合成的 K 线周期 (分钟) (Bar periods built from the tick snapshots, minutes)
+BAR_AGG_PERIODS = [1, 5, 15, 60]
+# 每个 标的/周期 在内存中保留的最大 K 线数量 (Bars kept in memory per symbol and period)
+BAR_AGG_MAX_BARS = 600
+# 收盘后与东财 K 线对账的周期与时间 (Periods reconciled with the vendor after the close, and when)
+BAR_AGG_RECONCILE_PERIODS = ["60"]
+BAR_AGG_RECONCILE_TIME = "16:15"
+# 本地合成收盘价与东财收盘价的相对偏差超过该值时告警 (Close drift that triggers a warning)
+BAR_AGG_RECONCILE_TOLERANCE = 0.002
+
+# === 行情快照日志配置 (Tick Journal Configuration) ===
+
+# 高频快照的压缩列式日志根目录，每个交易日一个子目录 (Root dir, one sub-directory per trading day)
+TICK_JOURNAL_DIR = "tick_journal"
+# False 只记录监控名单，True 记录全市场快照 (约 2600 行/轮) (Record the whole market instead of the watch set)
+TICK_JOURNAL_FULL_MARKET = False
+# 缓冲区满该行数或距上次落盘超过该秒数即写出一个压缩分块 (Flush thresholds: rows / seconds)
+TICK_JOURNAL_BUFFER_ROWS = 50000
+TICK_JOURNAL_FLUSH_SEC = 60
+# 落盘持续失败时缓冲区最多保留的行数，超出丢弃最旧的数据 (Hard cap on buffered rows if flushes keep failing)
+TICK_JOURNAL_MAX_BUFFER_ROWS = 500000
+
+# === 回放模式配置 (Replay Mode Configuration) ===
+
+# 回放时 AI 决策轮读取的本地合成 K 线周期 (分钟)：单日回放没有历史 K 线，用 1 分钟线才能完成指标预热
+# Bar period the replayed AI cycle reads; one replayed day only warms up RSI/MACD on 1-minute bars
+REPLAY_KLINE_PERIOD = 1
+# 合成行情的快照间隔 (秒) 与每步波动率 (Synthetic stream: snapshot step and per-step volatility)
+REPLAY_SYNTHETIC_STEP_SEC = 5
+REPLAY_SYNTHETIC_VOLATILITY = 0.0012
+
 def setup_global_proxy():
     """
     配置全局环境变量接管所有底层请求 (如底层库发出的请求)
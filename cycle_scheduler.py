@@ -0,0 +1,115 @@
+import os
+import datetime
+import contextlib
+import contextvars
+import pandas as pd # type: ignore
+from config import AI_CYCLE_DEADLINE_MARGIN_SEC, AI_CYCLE_SCORE_FILE # type: ignore
+from market_hours import hk_now, next_bar_close # type: ignore
+from sim_clock import get_clock # type: ignore
+from debug_sentinel import log_info, log_warn # type: ignore
+
+# ==========================================
+# Phase 30: Deadline-Aware Cycle Scheduler (截止时间 + 优先级的决策轮调度)
+# ==========================================
+# 每轮 AI 决策都有一个截止时间: 下一根 60 分钟 K 线收线前 AI_CYCLE_DEADLINE_MARGIN_SEC 秒。
+# 处理顺序: 持仓标的 > 上一轮被顺延的标的 > 按选股雷达得分排序的自选股 > 其余标的。
+# 截止时间通过 ContextVar 下发，限速层在排队令牌前检查，等不到的请求直接放弃而不是睡过收线；
+# 到期未完成的标的记为顺延，下一轮优先处理。自选股再多，持仓标的的延迟也不受影响。
+# Each cycle gets a deadline (next hourly bar close minus a margin). Positions go first, then
+# symbols carried over from the last cycle, then the watchlist by scanner score. The deadline is
+# published through a ContextVar that the rate limiter checks before queueing for a token, and
+# unfinished symbols are carried over to the front of the next cycle.
+
+OUTCOME_DEFERRED = "DEFERRED"
+
+class DeadlineExceeded(Exception):
+    """当前工作已无法在截止时间前完成 (The current work cannot finish before its deadline)"""
+
+# 当前线程/协程所属决策轮的截止时间 (epoch 秒)，None 表示不限时
+# Epoch-second deadline of the cycle the current thread/task works for; None = unbounded
+CURRENT_DEADLINE = contextvars.ContextVar("current_deadline", default=None)
+
+@contextlib.contextmanager
+def deadline_scope(deadline: float):
+    """在代码块内设置截止时间 (Set the deadline for the enclosed block)"""
+    token = CURRENT_DEADLINE.set(deadline)
+    try:
+        yield
+    finally:
+        CURRENT_DEADLINE.reset(token)
+
+def run_with_deadline(deadline: float, fn, *args, **kwargs):
+    """在截止时间作用域内执行 fn，用于线程池中的阻塞调用 (Run fn inside a deadline scope)"""
+    with deadline_scope(deadline):
+        check_deadline()
+        return fn(*args, **kwargs)
+
+def remaining_seconds() -> float:
+    """距当前截止时间的剩余秒数，不限时返回 None (Seconds left, or None when unbounded)"""
+    deadline = CURRENT_DEADLINE.get()
+    return None if deadline is None else deadline - get_clock().time()
+
+def check_deadline(extra_wait: float = 0.0):
+    """若再等待 extra_wait 秒就会越过截止时间则抛出 DeadlineExceeded (Raise if the wait would overrun)"""
+    left = remaining_seconds()
+    if left is not None and extra_wait >= left:
+        raise DeadlineExceeded(f"剩余 {max(left, 0.0):.1f}s，不足以等待 {extra_wait:.1f}s")
+
+def load_watchlist_scores(path: str = AI_CYCLE_SCORE_FILE) -> dict:
+    """读取选股雷达导出的综合看好得分 {代码: 得分} (Scanner scores keyed by bare code)"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        df = pd.read_csv(path, dtype={"代码": str}, encoding="utf-8-sig")
+        return dict(zip(df["代码"].str.replace(".HK", "", regex=False), df["综合看好得分"].astype(float)))
+    except Exception as e:
+        log_warn(f"[!] 读取自选股得分失败，按原顺序处理: {e}")
+        return {}
+
+def _is_held(symbol: str, positions: dict) -> bool:
+    return symbol in positions or symbol.replace(".HK", "") in positions
+
+class CycleScheduler:
+    def __init__(self, margin_sec: float = AI_CYCLE_DEADLINE_MARGIN_SEC):
+        self.margin_sec = margin_sec
+        self.carry_over = []
+
+    def deadline_for(self, now: datetime.datetime = None) -> datetime.datetime:
+        """本轮截止时间: 下一根 60 分钟 K 线收线前 margin 秒 (Next hourly close minus the margin)"""
+        return next_bar_close(now or hk_now()) - datetime.timedelta(seconds=self.margin_sec)
+
+    def prioritize(self, targets, positions: dict, scores: dict = None) -> list:
+        """
+        持仓 > 顺延 > 有得分的自选股 (降序) > 其余标的 (保持原顺序)
+        Positions, then carry-over, then scored symbols (desc), then the rest in input order.
+        """
+        scores = scores if scores is not None else load_watchlist_scores()
+        targets = list(dict.fromkeys(targets))
+        carried = set(self.carry_over)
+
+        def rank(item):
+            idx, sym = item
+            code = sym.replace(".HK", "")
+            if _is_held(sym, positions):
+                return (0, 0.0, idx)
+            if sym in carried:
+                return (1, 0.0, idx)
+            if code in scores:
+                return (2, -scores[code], idx)
+            return (3, 0.0, idx)
+
+        return [sym for _, sym in sorted(enumerate(targets), key=rank)]
+
+    def plan(self, targets, positions: dict):
+        """返回 (排好序的标的, 截止时间 epoch 秒) (Ordered symbols and the epoch deadline)"""
+        ordered = self.prioritize(targets, positions)
+        deadline = self.deadline_for()
+        log_info(f"[*] 本轮决策截止 {deadline.strftime('%H:%M:%S')}，持仓 {sum(1 for s in ordered if _is_held(s, positions))} 个优先，"
+                 f"顺延 {len(self.carry_over)} 个")
+        return ordered, deadline.timestamp()
+
+    def record(self, results: dict):
+        """记下本轮被顺延的标的，下一轮排在持仓之后优先处理 (Remember deferred symbols for next cycle)"""
+        self.carry_over = [sym for sym, outcome in results.items() if outcome == OUTCOME_DEFERRED]
+        if self.carry_over:
+            log_warn(f"[!] 截止时间前未完成 {len(self.carry_over)} 个标的，顺延至下一轮: {self.carry_over}")
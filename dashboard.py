@@ -4,6 +4,9 @@ import os
 import pandas as pd # type: ignore
 from datetime import datetime
 import time
+from config import DASHBOARD_REFRESH_SEC # type: ignore
+from execution_risk import HARD_STOP_RATIO # type: ignore
+from ipc_bus import BusClient, TOPIC_TICK, TOPIC_POSITIONS, TOPIC_WATCHLIST # type: ignore
 
 # ==========================================
 # Phase 8/12: Web UI Dashboard (Bilingual Localization)
@@ -26,7 +29,18 @@ CACHE_FILE = "realtime_cache.json"
 WATCHLIST_FILE = "watchlist.json"
 INITIAL_CAPITAL = 100000.0
 
+@st.cache_resource
+def get_bus_client():
+    """订阅主守护进程的本地消息总线，整个 Streamlit 服务共享一个连接 (One bus subscription per server)"""
+    return BusClient().start()
+
 def load_positions():
+    # 总线在线时直接读内存中的最新持仓，否则读取落盘文件兜底 (Bus first, file as fallback)
+    bus_client = get_bus_client()
+    if bus_client.connected:
+        positions = bus_client.latest(TOPIC_POSITIONS)
+        if positions is not None:
+            return positions
     if os.path.exists(POSITIONS_FILE):
         try:
             with open(POSITIONS_FILE, "r", encoding="utf-8") as f:
@@ -39,6 +53,10 @@ def fetch_realtime_prices(symbols):
     """从主进程剥离出来的本地缓存读取价格，切断所有直连 API 避免封禁"""
     if not symbols:
         return {}
+    bus_client = get_bus_client()
+    if bus_client.connected:
+        cache = bus_client.latest(TOPIC_TICK, {})
+        return {sym: cache.get(sym, {}).get("price", 0.0) for sym in symbols}
     if os.path.exists(CACHE_FILE):
         try:
             with open(CACHE_FILE, "r", encoding="utf-8") as f:
@@ -50,6 +68,9 @@ def fetch_realtime_prices(symbols):
 
 def fetch_realtime_cache():
     """读取所有缓存（含价格与涨跌幅），供自选股表盘使用"""
+    bus_client = get_bus_client()
+    if bus_client.connected:
+        return bus_client.latest(TOPIC_TICK, {})
     if os.path.exists(CACHE_FILE):
         try:
             with open(CACHE_FILE, "r", encoding="utf-8") as f:
@@ -59,6 +80,11 @@ def fetch_realtime_cache():
     return {}
 
 def update_watchlist_file(symbols_list):
+    # 自选股编辑先推送到总线 (主守护进程即时生效)，同时写文件作为兜底
+    # Push the edit over the bus for immediate pickup; the file stays as the fallback
+    bus_client = get_bus_client()
+    if bus_client.latest(TOPIC_WATCHLIST) != symbols_list:
+        bus_client.publish(TOPIC_WATCHLIST, symbols_list)
     try:
         with open(WATCHLIST_FILE, "w", encoding="utf-8") as f:
             json.load(f) if False else json.dump(symbols_list, f, ensure_ascii=False)
@@ -121,7 +147,7 @@ if watch_input.strip():
 st.sidebar.markdown("---")
 st.sidebar.info(T["sidebar_tip"])
 
-@st.fragment(run_every="2s")
+@st.fragment(run_every=DASHBOARD_REFRESH_SEC)
 def render_live_matrices():
     positions = load_positions()
     symbols_held = list(positions.keys())
@@ -149,7 +175,7 @@ def render_live_matrices():
         total_current_value += curr_value
         
         drawdown_from_high = ((highest - current_p) / highest) * 100 if highest > 0 else 0
-        stop_loss_price = cost * 0.92
+        stop_loss_price = cost * HARD_STOP_RATIO
         
         holding_records.append({
             T["col_symbol"]: sym,
@@ -1,10 +1,15 @@
 import pandas as pd # type: ignore
 import akshare as ak # type: ignore
-from base64 import b64encode
 import datetime
-import time
-import random
-from config import setup_global_proxy # type: ignore
+from config import setup_global_proxy, MACRO_NEWS_TTL_SEC, STOCK_NEWS_TTL_SEC, BAR_AGG_RECONCILE_PERIODS # type: ignore
+from bar_store import get_bar_store # type: ignore
+from indicator_state import get_indicator_engine # type: ignore
+from bar_aggregator import get_bar_aggregator # type: ignore
+from market_hours import hk_now # type: ignore
+from ttl_cache import TTLCache # type: ignore
+import indicators # type: ignore
+from rate_limiter import limited_call # type: ignore
+from cycle_scheduler import DeadlineExceeded # type: ignore
 from debug_sentinel import log_info, log_error, log_warn # type: ignore
 
 # ==========================================
@@ -19,9 +24,42 @@ from debug_sentinel import log_info, log_error, log_warn # type: ignore
 # 00700 (腾讯), 03690 (美团), 09988 (阿里)
 TARGET_POOL = ["00700", "03690", "09988"] 
 
+def _load_session_bars(symbol: str, period: str):
+    """
+    经由本地 K 线仓库同步并清洗交易时段 K 线 (时间索引)，无数据时返回 None
+    Sync through the local bar store and keep only HK session bars (datetime index).
+    """
+    # 经由本地 K 线仓库增量同步港股分时行情 (底层仍为东方财富 stock_hk_hist_min_em)
+    # 仓库强制带入 adjust="qfq" (前复权) 参数，并在分红派息改写历史时自动全量重建
+    # Incremental qfq sync through the local bar store (rebuilds on dividend rewrites)
+    df = get_bar_store().sync(symbol, period)
+    if df is None or df.empty:
+        log_warn(f"[-] {symbol} 暂无可用的 {period} 分钟 K 线。")
+        return None
+    return _clean_session_bars(df)
+
+def _clean_session_bars(df: pd.DataFrame) -> pd.DataFrame:
+    """时间列转为索引并剔除非交易时段 / 午休 K 线 (Index by time; drop off-session and lunch bars)"""
+    df = df.copy()
+    # 将时间列转换为 datetime 对象，并设为索引
+    df['时间'] = pd.to_datetime(df['时间'])
+    df.set_index('时间', inplace=True)
+    
+    # 脏数据清洗：处理午休断层 (Lunch Break Gap Handling)
+    # 港股交易时间段：09:30-12:00, 13:00-16:00
+    # 如果是 60 分钟线，确保时间轴连续，避免指标偏移
+    # 过滤掉非交易时间段的数据 (Filter out non-trading hours)
+    df = df.between_time('09:30', '16:00')
+    # 剔除 12:01 到 12:59 之间的午休幽灵数据 (如果有)
+    # Exclude ghost data during lunch break (12:01 - 12:59)
+    lunch_mask = (df.index.time > datetime.time(12, 0)) & (df.index.time < datetime.time(13, 0))
+    return df[~lunch_mask]
+
 def fetch_and_clean_kline_data(symbol: str, period: str = "60") -> pd.DataFrame:
     """
     抓取并清洗指定股票的 K 线数据 (默认 60 分钟级别)
+    批量全量计算版本，需要完整指标序列时使用；只需最新一根时请用 fetch_kline_snapshot。
+    Batch version over the full history; use fetch_kline_snapshot when only the latest bar matters.
     """
     if symbol not in TARGET_POOL:
         raise ValueError(f"[!] 越权访问警告: {symbol} 不在 TARGET_POOL 白名单中！")
@@ -29,41 +67,25 @@ def fetch_and_clean_kline_data(symbol: str, period: str = "60") -> pd.DataFrame:
     log_info(f"[*] 正在拉取 {symbol} 的 {period} 分钟级别感知数据...")
     
     try:
-        # 使用 AkShare 的 stock_hk_hist_min_em 接口获取港股分时行情数据 (东方财富数据源)
-        # 必须强制带入 adjust="qfq" (前复权) 参数，防止分红派息导致的 K 线缺口
-        # Mandatory adjust="qfq" to prevent flash-crash gaps from dividends
-        df = ak.stock_hk_hist_min_em(symbol=symbol, period=period, adjust="qfq")
-        
-        # 将时间列转换为 datetime 对象，并设为索引
-        df['时间'] = pd.to_datetime(df['时间'])
-        df.set_index('时间', inplace=True)
-        
-        # 脏数据清洗：处理午休断层 (Lunch Break Gap Handling)
-        # 港股交易时间段：09:30-12:00, 13:00-16:00
-        # 如果是 60 分钟线，确保时间轴连续，避免指标偏移
-        # 过滤掉非交易时间段的数据 (Filter out non-trading hours)
-        df = df.between_time('09:30', '16:00')
-        # 剔除 12:01 到 12:59 之间的午休幽灵数据 (如果有)
-        # Exclude ghost data during lunch break (12:01 - 12:59)
-        lunch_mask = (df.index.time > datetime.time(12, 0)) & (df.index.time < datetime.time(13, 0))
-        df = df[~lunch_mask]
+        df = _load_session_bars(symbol, period)
+        if df is None:
+            return None
 
         # 计算基础指标：RSI 相对强弱指标 (14期) 和 MACD
         # Calculate basic indicators: RSI (14-period) and MACD
         
+        # 统一走 indicators 向量化面板库 (单标的即 1 行面板)
+        # Shared vectorized panel library (a single symbol is a one-row panel)
+        closes = df['收盘'].to_numpy(dtype=float)
+        
         # 1. RSI
-        delta = df['收盘'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI_14'] = 100 - (100 / (1 + rs))
+        df['RSI_14'] = indicators.rsi_simple(closes)[0]
         
         # 2. MACD (12, 26, 9)
-        exp1 = df['收盘'].ewm(span=12, adjust=False).mean()
-        exp2 = df['收盘'].ewm(span=26, adjust=False).mean()
-        df['MACD_DIF'] = exp1 - exp2
-        df['MACD_DEA'] = df['MACD_DIF'].ewm(span=9, adjust=False).mean()
-        df['MACD_HIST'] = 2 * (df['MACD_DIF'] - df['MACD_DEA'])
+        dif, dea, hist = indicators.macd(closes)
+        df['MACD_DIF'] = dif[0]
+        df['MACD_DEA'] = dea[0]
+        df['MACD_HIST'] = hist[0]
         
         # 清除因为计算指标产生的 NaN 行
         df.dropna(inplace=True)
@@ -75,61 +97,132 @@ def fetch_and_clean_kline_data(symbol: str, period: str = "60") -> pd.DataFrame:
         log_error(f"[-] 数据收割失败 ({symbol}): {str(e)}")
         return None
 
+def fetch_kline_snapshot(symbol: str, period: str = "60") -> dict:
+    """
+    流式版本：只对新到达的 K 线做 O(1) 指标增量更新，返回最新一根 K 线的指标快照
+    Streaming version: O(1) indicator update per new bar, returns the latest bar's snapshot.
+    返回字段 (Keys): 时间, 收盘, RSI_14, MACD_DIF, MACD_DEA, MACD_HIST
+    """
+    if symbol not in TARGET_POOL:
+        raise ValueError(f"[!] 越权访问警告: {symbol} 不在 TARGET_POOL 白名单中！")
+
+    log_info(f"[*] 正在拉取 {symbol} 的 {period} 分钟级别感知数据 (流式指标)...")
+
+    try:
+        df = _load_session_bars(symbol, period)
+        if df is None:
+            return None
+        snapshot = get_indicator_engine().update(symbol, period, df)
+        if snapshot is None:
+            log_warn(f"[-] {symbol} 指标预热不足，暂无有效快照。")
+        return snapshot
+    except DeadlineExceeded:
+        raise  # 本轮截止前等不到令牌，交由调度器顺延 (Let the scheduler carry the symbol over)
+    except Exception as e:
+        log_error(f"[-] 数据收割失败 ({symbol}): {str(e)}")
+        return None
+
+def fetch_kline_snapshot_local(symbol: str, period: str = "60") -> dict:
+    """
+    零网络版本：仓库中已落盘的历史 K 线 + 高频雷达快照在本地合成的最新 K 线，再做流式指标增量更新。
+    本地合成序列不完整或不连续 (如守护进程刚启动) 时，退回 fetch_kline_snapshot 走东财同步。
+    Zero-network version: stored history plus the bars built locally from tick snapshots. Falls
+    back to fetch_kline_snapshot (vendor sync) when the local bars are incomplete or not contiguous.
+    """
+    if symbol not in TARGET_POOL:
+        raise ValueError(f"[!] 越权访问警告: {symbol} 不在 TARGET_POOL 白名单中！")
+
+    aggregator = get_bar_aggregator()
+    stored = get_bar_store().load(symbol, period)
+    merged = None
+    if stored is not None and not stored.empty and aggregator.is_current(symbol, period, hk_now().replace(tzinfo=None)):
+        merged = aggregator.extend_history(symbol, int(period), _clean_session_bars(stored))
+    if merged is None:
+        log_info(f"[*] {symbol} 本地合成 {period} 分钟 K 线尚不连续，退回东财同步...")
+        return fetch_kline_snapshot(symbol, period)
+
+    log_info(f"[*] {symbol} 使用本地合成的 {period} 分钟 K 线 (零网络请求)。")
+    snapshot = get_indicator_engine().update(symbol, period, merged)
+    if snapshot is None:
+        log_warn(f"[-] {symbol} 指标预热不足，暂无有效快照。")
+    return snapshot
+
+def reconcile_local_bars():
+    """
+    收盘对账：为每个本地合成过 K 线的标的同步一次东财 K 线，比对偏差并以东财为准
+    Post-close reconciliation: one vendor sync per symbol, drift logged, vendor bars win.
+    """
+    aggregator = get_bar_aggregator()
+    for symbol in aggregator.symbols():
+        for period in BAR_AGG_RECONCILE_PERIODS:
+            try:
+                aggregator.reconcile(symbol, int(period), _load_session_bars(symbol, period))
+            except Exception as e:
+                log_error(f"[-] {symbol}/{period} 收盘对账失败: {e}")
+
 # ==========================================
 # 2. 非结构化情绪引擎 (Unstructured Sentiment Engine)
 # ==========================================
 
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2.1 Safari/605.1.15",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:122.0) Gecko/20100101 Firefox/122.0",
-    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-]
+# 宏观电报对所有标的都一样，全进程共享一份；个股新闻按标的缓存，TTL 更短
+# The macro feed is market-wide and shared process-wide; per-symbol news gets a shorter TTL.
+MACRO_NEWS_CACHE = TTLCache(MACRO_NEWS_TTL_SEC, name="macro_telegraph")
+STOCK_NEWS_CACHE = TTLCache(STOCK_NEWS_TTL_SEC, name="stock_news")
+
+def _load_stock_news(symbol: str) -> list:
+    """维度 1: 抓取个股微观新闻 (Micro Sentiment)"""
+    news_df = limited_call("eastmoney", ak.stock_news_em, symbol=symbol)
+    if news_df is None or news_df.empty:
+        return []
+    titles = news_df['新闻标题'].head(5).tolist()
+    return [f"【个股】{t}" for t in titles]
+
+def _load_macro_telegraph() -> list:
+    """维度 2: 抓取全市场宏观实时电报 (Macro Sentiment - 财联社)"""
+    # 抓取财联社实时电报，获取大盘宏观情绪 (经由财联社令牌桶限速)
+    macro_df = limited_call("cls", ak.stock_telegraph_cls)
+    if macro_df is None or macro_df.empty:
+        return []
+    # 过滤掉过长的内容，只取标题或简讯的前 4 条
+    # 如果标题为空，尝试提取内容的前 50 个字
+    cleaned_macros = []
+    for idx, row in macro_df.head(4).iterrows():
+        title_str = str(row.get('标题', ''))
+        content_str = str(row.get('内容', ''))
+        text = title_str if title_str and title_str != 'nan' else content_str[:50] + "..." # type: ignore
+        cleaned_macros.append(f"【宏观】{text}")
+    return cleaned_macros
 
 def fetch_multi_dim_intelligence(symbol: str) -> dict:
     """
     抓取多维度情报网 (Multi-Dimensional Intelligence Web)
     包含: 1. 个股微观新闻  2. 宏观实时电报
+    两个维度均经过 TTL 缓存，并发线程对同一数据源只会产生一次在途请求。
+    Both feeds go through TTL caches; concurrent threads share one in-flight request per feed.
     """
     if symbol not in TARGET_POOL:
         raise ValueError(f"[!] 越权访问警告: {symbol} 不在 TARGET_POOL 白名单中！")
         
     print(f"[*] 正在雷达扫描 {symbol} 的多维度市场情绪...")
     
-    # 防封 IP 休眠机制
-    headers = {"User-Agent": random.choice(USER_AGENTS)}
-    time.sleep(random.uniform(2, 5))
-    
     intelligence_pack = {
         "micro_stock_news": [],   # 个股新闻
         "macro_market_news": []   # 宏观大盘电报
     }
     
-    # 维度 1: 抓取个股微观新闻 (Micro Sentiment)
+    # 维度 1: 个股微观新闻 (按标的缓存)
     try:
-        news_df = ak.stock_news_em(symbol=symbol)
-        if news_df is not None and not news_df.empty:
-            titles = news_df['新闻标题'].head(5).tolist()
-            intelligence_pack["micro_stock_news"] = [f"【个股】{t}" for t in titles]
+        intelligence_pack["micro_stock_news"] = list(STOCK_NEWS_CACHE.get_or_load(symbol, lambda: _load_stock_news(symbol)))
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"[-] 获取 {symbol} 个股新闻失败: {str(e)}")
 
-    # 维度 2: 抓取全市场宏观实时电报 (Macro Sentiment - 财联社)
+    # 维度 2: 全市场宏观电报 (全进程共享)
     try:
-        # 抓取财联社实时电报，获取大盘宏观情绪
-        macro_df = ak.stock_telegraph_cls()
-        if macro_df is not None and not macro_df.empty:
-            # 过滤掉过长的内容，只取标题或简讯的前 4 条
-            macro_titles = macro_df['标题'].head(4).tolist()
-            # 如果标题为空，尝试提取内容的前 50 个字
-            cleaned_macros = []
-            for idx, row in macro_df.head(4).iterrows():
-                title_str = str(row.get('标题', ''))
-                content_str = str(row.get('内容', ''))
-                text = title_str if title_str and title_str != 'nan' else content_str[:50] + "..." # type: ignore
-                cleaned_macros.append(f"【宏观】{text}")
-                
-            intelligence_pack["macro_market_news"] = cleaned_macros
+        intelligence_pack["macro_market_news"] = list(MACRO_NEWS_CACHE.get_or_load("cls_telegraph", _load_macro_telegraph))
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"[-] 获取宏观电报失败: {str(e)}")
 
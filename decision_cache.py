@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import math
+import hashlib
+import threading
+import collections
+from config import (DECISION_CACHE_FILE, DECISION_CACHE_TTL_SEC, DECISION_CACHE_MAX_ENTRIES, # type: ignore
+                    DECISION_CACHE_PRICE_STEP, DECISION_CACHE_FEATURE_STEPS)
+from sim_clock import get_clock # type: ignore
+from debug_sentinel import log_info, log_error # type: ignore
+
+# ==========================================
+# Phase 36: Content-Addressed Decision Cache (大模型决策内容寻址缓存)
+# ==========================================
+# ask_deepseek 每轮都发一次完整的推理请求，哪怕行情特征与新闻和上一次几乎一样。
+# 这里以 (标的, 量化后的行情特征, 归一化的新闻集合, 模型与提示词版本) 的哈希为键缓存决策:
+# 价格按相对步长、RSI/MACD 按绝对步长量化，新闻去空白/标点后排序去重，噪声级的变化落在同一个键上。
+# 带 TTL 与 LRU 淘汰，原子落盘跨重启保留，并记录命中/未命中统计。
+# Caches reasoner decisions under a hash of the symbol, quantized market features, the
+# normalized headline set and the model/prompt version, so near-identical inputs reuse the last
+# answer. TTL + LRU bounded, persisted atomically across restarts, with hit/miss counters.
+
+_PUNCT = re.compile(r"[\s　，。！？、；：“”‘’（）【】《》,.!?;:'\"()\[\]<>]+")
+
+def quantize_features(market_data: dict) -> dict:
+    """
+    行情特征量化: 价格按相对步长取对数桶，其余按 DECISION_CACHE_FEATURE_STEPS 的绝对步长取整
+    Price goes into relative (log) buckets; other features are rounded to absolute steps.
+    """
+    quantized = {}
+    for key, value in sorted(market_data.items()):
+        if not isinstance(value, (int, float)) or value != value:
+            quantized[key] = value
+        elif key == "current_price" and value > 0:
+            quantized[key] = round(math.log(value) / math.log1p(DECISION_CACHE_PRICE_STEP))
+        else:
+            step = DECISION_CACHE_FEATURE_STEPS.get(key)
+            quantized[key] = round(value / step) if step else round(float(value), 4)
+    return quantized
+
+def normalize_news(intelligence_dict: dict) -> dict:
+    """新闻按栏目去空白/标点后排序去重，顺序与排版差异不影响键 (Order- and formatting-insensitive headlines)"""
+    normalized = {}
+    for key, items in sorted((intelligence_dict or {}).items()):
+        if isinstance(items, (list, tuple)):
+            normalized[key] = sorted({_PUNCT.sub("", str(item)).lower() for item in items} - {""})
+        else:
+            normalized[key] = _PUNCT.sub("", str(items)).lower()
+    return normalized
+
+def decision_key(symbol: str, market_data: dict, intelligence_dict: dict, version: str = "") -> str:
+    """内容寻址键 (Content-addressed key)"""
+    payload = json.dumps({
+        "symbol": symbol,
+        "features": quantize_features(market_data),
+        "news": normalize_news(intelligence_dict),
+        "version": version,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class DecisionCache:
+    def __init__(self, path: str = DECISION_CACHE_FILE, ttl_sec: float = DECISION_CACHE_TTL_SEC,
+                 max_entries: int = DECISION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> {"expire_at", "symbol", "decision"}，按最近使用排序
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._load()
+
+    def _load(self):
+        """从磁盘恢复未过期的条目 (Restore unexpired entries from disk)"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            now = get_clock().time()
+            for key, entry in entries.items():
+                if entry["expire_at"] > now:
+                    self._entries[key] = entry
+            log_info(f"[+] 已恢复 {len(self._entries)} 条大模型决策缓存。")
+        except Exception as e:
+            log_error(f"[-] 加载决策缓存失败，从空缓存开始: {e}")
+
+    def _save_locked(self):
+        """原子级写入 (Atomic write)"""
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log_error(f"[-] 保存决策缓存失败: {e}")
+
+    def get(self, key: str):
+        """命中且未过期返回决策副本，否则返回 None (A copy of the cached decision, or None)"""
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expire_at"] <= get_clock().time():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # 调用方 (风控) 会在决策上追加字段，返回副本 (Callers annotate decisions, so hand out a copy)
+            return dict(entry["decision"])
+
+    def put(self, key: str, symbol: str, decision: dict):
+        """写入一条决策并落盘，超过容量淘汰最久未使用的条目 (Insert, evict LRU, persist)"""
+        with self.lock:
+            self._entries[key] = {"expire_at": get_clock().time() + self.ttl_sec, "symbol": symbol, "decision": dict(decision)}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            self._save_locked()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_cache = None
+_default_cache_guard = threading.Lock()
+
+def get_decision_cache() -> DecisionCache:
+    """获取进程级共享的决策缓存 (Get the process-wide decision cache)"""
+    global _default_cache
+    with _default_cache_guard:
+        if _default_cache is None:
+            _default_cache = DecisionCache()
+        return _default_cache
+
+def report_decision_cache_stats():
+    """将决策缓存统计输出到日志 (Log decision-cache stats)"""
+    st = get_decision_cache().stats()
+    log_info(f"[*] 决策缓存 {st['entries']} 条 | 命中 {st['hits']} 次 | 未命中 {st['misses']} 次 | "
+             f"命中率 {st['hit_rate']} | 过期 {st['expired']} | 淘汰 {st['evicted']}")
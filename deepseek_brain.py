@@ -1,8 +1,17 @@
 import json
 import re
 import os
+import hashlib
 import requests # type: ignore
-from config import setup_global_proxy # type: ignore
+from http_client import get_http_client # type: ignore
+from config import (setup_global_proxy, DEEPSEEK_BATCH_SIZE, DEEPSEEK_BATCH_MAX_PROMPT_TOKENS, # type: ignore
+                    DEEPSEEK_STREAM, DEEPSEEK_REASONING_LOG_DIR)
+from llm_stream import stream_decision # type: ignore
+from rate_limiter import limited_call # type: ignore
+from decision_cache import get_decision_cache, decision_key # type: ignore
+from llm_gate import get_llm_gate # type: ignore
+from llm_dispatcher import get_llm_dispatcher # type: ignore
+from cycle_scheduler import DeadlineExceeded # type: ignore
 from debug_sentinel import log_info, log_error, log_warn # type: ignore
 
 # ==========================================
@@ -35,6 +44,30 @@ STRICT OUTPUT RULES:
 }
 """
 
+def build_batch_system_prompt() -> str:
+    """
+    批量模式的系统级提示词：一次请求覆盖多个标的，输出 JSON 数组 (Batch prompt: one JSON array for N symbols)
+    """
+    return """You are a battle-tested quantitative trading AI.
+You will receive ONE shared macro market context and SEVERAL HK stocks, each with its own price-volume data and stock news.
+Analyze every stock independently against the shared macro context and make a discrete trading decision for each.
+
+STRICT OUTPUT RULES:
+1. You MUST output ONLY a valid JSON array, with exactly one object per stock, in any order.
+2. No markdown formatting, no conversational text before or after the JSON.
+3. Each object must exactly match this structure:
+{
+    "symbol": "<the stock code exactly as given>",
+    "action": "BUY" | "SELL" | "HOLD",
+    "reason": "A concise, 1-2 sentence explanation of your rationale"
+}
+"""
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算提示词 token 数: ASCII 约 4 字符/token，中文约 1 字/token (Rough prompt-token estimate)"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
 def clean_r1_output(raw_output: str) -> str:
     """
     针对 DeepSeek-R1 模型的特殊解析：剥离 <think> 标签及其内容。
@@ -49,19 +82,77 @@ def clean_r1_output(raw_output: str) -> str:
     
     # 2. 如果包含 markdown 的 ```json 代码块，定向提取出来
     # If it contains markdown ```json blocks, extract the core content
-    json_match = re.search(r'```(?:json)?\s*({.*?})\s*```', cleaned, flags=re.DOTALL)
+    json_match = re.search(r'```(?:json)?\s*([{\[].*?[}\]])\s*```', cleaned, flags=re.DOTALL)
     if json_match:
         return json_match.group(1).strip()
     
     # 3. 兜底清理首尾空白符
     return cleaned.strip()
 
+def _cache_version(system_prompt: str) -> str:
+    """模型或提示词变化会换键，旧决策自然失效 (Model/prompt changes invalidate old decisions)"""
+    return MODEL_NAME + hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+
+def _chat_completion(system_prompt: str, user_prompt: str, openers: str = "{", label: str = "") -> str:
+    """
+    发送一次对话补全请求并返回大模型的回复文本 (One chat-completion call; returns the reply text)
+    流式模式下边收边丢弃思考内容，截取到第一个完整 JSON 即返回其文本 (openers 为允许的 JSON 起始字符)
+    In streaming mode reasoning is dropped as it arrives and the first complete JSON value is returned.
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
+    }
+    
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": 0.1, # 降低温度，减少幻觉 (Lower temperature to reduce hallucinations)
+        "stream": DEEPSEEK_STREAM,
+    }
+
+    # 发送请求 (发送到底层 Requests 时会自动走 config.py 中挂载的代理)
+    # Send request (will automatically use the proxy mounted in config.py)
+    # 先向 DeepSeek 令牌桶取令牌，避免并发线程同时撞击 API 配额 (Token bucket before hitting the API)
+    # 走共享连接池复用长连接，省去每次的 TCP + TLS 握手 (Pooled keep-alive connection)
+    response = limited_call("deepseek", get_http_client().post, DEEPSEEK_API_URL, headers=headers, json=payload,
+                            timeout=30, stream=DEEPSEEK_STREAM)
+    response.raise_for_status() # 这会捕获非2xx状态码的错误
+    
+    if DEEPSEEK_STREAM:
+        decision = stream_decision(response, openers, DEEPSEEK_REASONING_LOG_DIR, label)
+        return json.dumps(decision, ensure_ascii=False)
+    
+    # 提取大模型的原始回复
+    return response.json()['choices'][0]['message']['content']
+
+def _log_request_error(attempt: int, retry_count: int, e: requests.exceptions.RequestException):
+    log_error(f"[-] 尝试 {attempt}/{retry_count} 失败: API 请求失败或网络错误 - {e}")
+    if e.response is not None:
+        log_error(f"[-] API 响应状态码: {e.response.status_code}, 响应内容: {e.response.text}")
+
 def ask_deepseek(symbol: str, market_data: dict, intelligence_dict: dict, retry_count: int = 3) -> dict:
     """
     与 DeepSeek 大脑进行交互并带有容错回退机制
     Interact with the DeepSeek Brain with fault-tolerance and fallback mechanisms.
+    行情特征与新闻 (量化/归一化后) 未变时直接复用缓存决策 (Reuse the cached decision for unchanged inputs)
+    无新标题且特征漂移未过阈值时由触发门沿用上次决策 (The gate reuses the last decision when nothing is new)
     """
+    gate = get_llm_gate()
+    reused = gate.check(symbol, market_data, intelligence_dict)
+    if reused is not None:
+        return reused
     system_prompt = build_system_prompt()
+    cache = get_decision_cache()
+    cache_key = decision_key(symbol, market_data, intelligence_dict, version=_cache_version(system_prompt))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        log_info(f"[+] {symbol} 行情与情报未变，复用缓存决策: {cached.get('action')} - {cached.get('reason')}")
+        gate.record(symbol, market_data, intelligence_dict, cached)
+        return cached
     user_prompt = f"""
 TARGET ASSET: {symbol}
 MARKET DATA SNAPSHOT (Last 60 mins):
@@ -74,34 +165,17 @@ INSTRUCTIONS FOR REASONING:
 1. Micro (micro_stock_news): Assess the direct catalyst for {symbol}.
 2. Macro (macro_market_news): Assess the overall market systemic risk or trend. 
 3. If Macro is extremely bearish, DO NOT BUY even if Micro is good.
+4. local_sentiment (if present) is a fast keyword pre-score in [-1, 1]; treat it as a hint, never as the sole reason.
 Based strictly on this data, provide your JSON decision.
 """
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-    
-    payload = {
-        "model": MODEL_NAME,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        "temperature": 0.1 # 降低温度，减少幻觉 (Lower temperature to reduce hallucinations)
-    }
 
     log_info(f"[*] 正在向 DeepSeek (模型: {MODEL_NAME}) 请求 {symbol} 的决策...")
 
+    dispatcher = get_llm_dispatcher()
     for attempt in range(1, retry_count + 1):
+        error = None
         try:
-            # 发送请求 (发送到底层 Requests 时会自动走 config.py 中挂载的代理)
-            # Send request (will automatically use the proxy mounted in config.py)
-            response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=30)
-            response.raise_for_status() # 这会捕获非2xx状态码的错误
-            
-            # 提取大模型的原始回复
-            raw_content = response.json()['choices'][0]['message']['content']
+            raw_content = dispatcher.call(_chat_completion, system_prompt, user_prompt, label=symbol)
             
             # 使用针对 R1 的清洗机制
             # Use R1-specific cleaning mechanism
@@ -116,23 +190,172 @@ Based strictly on this data, provide your JSON decision.
                 raise ValueError("JSON 缺少 action 字段或内容不合法")
                 
             log_info(f"[+] DeepSeek 决策成功: {decision.get('action')} - {decision.get('reason')} (尝试 {attempt}/{retry_count})")
-            return decision
+            cache.put(cache_key, symbol, decision)  # 只缓存成功的决策，熔断兜底不入缓存 (Never cache the fallback)
+            gate.record(symbol, market_data, intelligence_dict, decision)
+            return dict(decision)
 
+        except DeadlineExceeded:
+            raise
         except json.JSONDecodeError as e:
             log_error(f"[-] 尝试 {attempt}/{retry_count} 失败: 大模型返回的不是合法 JSON 格式。错误: {e}")
         except requests.exceptions.RequestException as e:
-            log_error(f"[-] 尝试 {attempt}/{retry_count} 失败: API 请求失败或网络错误 - {e}")
-            if response is not None:
-                log_error(f"[-] API 响应状态码: {response.status_code}, 响应内容: {response.text}")
+            _log_request_error(attempt, retry_count, e)
+            error = e
         except ValueError as e:
             log_error(f"[-] 尝试 {attempt}/{retry_count} 失败: 决策 JSON 校验失败 - {e}")
         except Exception as e:
             log_error(f"[-] 尝试 {attempt}/{retry_count} 失败: 未知错误 - {e}")
+        if attempt < retry_count:
+            # 带抖动的指数退避，429 时遵守 Retry-After (Jittered backoff; honours Retry-After on 429)
+            dispatcher.backoff(attempt, error)
             
     # Fallback Mechanism: 如果多次重试全部失败，绝对不能盲目买入
     log_error(f"[!!!] {symbol} 决策环节彻底熔断，触发本地防御机制，强制要求 HOLD。")
     return {"action": "HOLD", "reason": "API_ERROR_OR_PARSE_FAILED_FALLBACK"}
 
+# ---------- 批量模式 (Batched multi-symbol mode) ----------
+
+def _symbol_block(symbol: str, market_data: dict, intelligence_dict: dict) -> str:
+    """单个标的在批量提示词中的段落，只含个股数据与个股新闻 (Per-symbol section: own data and stock news)"""
+    return f"""
+### STOCK {symbol}
+MARKET DATA SNAPSHOT (Last 60 mins):
+{json.dumps(market_data, ensure_ascii=False)}
+STOCK NEWS (micro_stock_news):
+{json.dumps(intelligence_dict.get("micro_stock_news", []), ensure_ascii=False)}
+LOCAL SENTIMENT PRE-SCORE (local_sentiment):
+{json.dumps(intelligence_dict.get("local_sentiment"), ensure_ascii=False)}
+"""
+
+def _batch_user_prompt(macro_news: list, blocks: list) -> str:
+    return f"""
+SHARED MACRO CONTEXT (macro_market_news, applies to every stock below):
+{json.dumps(macro_news, ensure_ascii=False)}
+{"".join(blocks)}
+INSTRUCTIONS FOR REASONING:
+1. Micro (STOCK NEWS): Assess the direct catalyst for each stock.
+2. Macro (SHARED MACRO CONTEXT): Assess the overall market systemic risk or trend.
+3. If Macro is extremely bearish, DO NOT BUY even if Micro is good.
+4. LOCAL SENTIMENT PRE-SCORE is a fast keyword score in [-1, 1]; treat it as a hint, never as the sole reason.
+Based strictly on this data, provide one JSON decision per stock in a single JSON array.
+"""
+
+def plan_batches(blocks: dict, macro_tokens: int, max_size: int = DEEPSEEK_BATCH_SIZE,
+                 max_prompt_tokens: int = DEEPSEEK_BATCH_MAX_PROMPT_TOKENS) -> list:
+    """
+    按标的数上限与提示词 token 预算贪心分批，单个超预算的标的独占一批
+    Greedy packing under a symbol-count cap and a prompt-token budget (an oversized symbol goes alone).
+    """
+    batches, current, used = [], [], macro_tokens
+    for symbol, block in blocks.items():
+        cost = estimate_tokens(block)
+        if current and (len(current) >= max_size or used + cost > max_prompt_tokens):
+            batches.append(current)
+            current, used = [], macro_tokens
+        current.append(symbol)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def _parse_batch_reply(raw_content: str, expected) -> dict:
+    """
+    解析批量回复并逐标的校验，返回合法的 {标的: 决策}；缺失或非法的标的不出现在结果中
+    Parse the array reply and validate per symbol; missing or malformed entries are left out.
+    """
+    parsed = json.loads(clean_r1_output(raw_content))
+    if isinstance(parsed, dict):
+        # 容忍 {"decisions": [...]} 这类外层包装 (Tolerate an object wrapping the array)
+        parsed = next((v for v in parsed.values() if isinstance(v, list)), [parsed])
+    wanted = {s.replace(".HK", ""): s for s in expected}
+    decisions = {}
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        symbol = wanted.get(str(item.get("symbol", "")).replace(".HK", ""))
+        if symbol is None or item.get("action") not in ["BUY", "SELL", "HOLD"]:
+            continue
+        decisions[symbol] = {"action": item["action"], "reason": item.get("reason", "")}
+    return decisions
+
+def ask_deepseek_batch(requests_by_symbol: dict, retry_count: int = 3) -> dict:
+    """
+    批量决策：{标的: (行情特征, 多维情报)} -> {标的: 决策}。先过触发门与决策缓存，其余标的按批次合并成一次请求，
+    宏观电报在每批中只出现一次。回复逐标的校验，解析失败或缺失的标的重新分批重试，最终仍失败的标的兜底 HOLD。
+    Batched decisions: gate and cache first, then one request per batch with the macro context stated once.
+    Replies are validated per symbol; failed symbols are re-batched and retried, then fall back to HOLD.
+    """
+    system_prompt = build_batch_system_prompt()
+    cache = get_decision_cache()
+    gate = get_llm_gate()
+    # 与单标的模式共用缓存键，两种模式的缓存可互相命中 (Same keys as single mode, so caches are shared)
+    version = _cache_version(build_system_prompt())
+    results, keys, blocks = {}, {}, {}
+    macro_news = []
+    for symbol, (market_data, intelligence_dict) in requests_by_symbol.items():
+        reused = gate.check(symbol, market_data, intelligence_dict)
+        if reused is not None:
+            results[symbol] = reused
+            continue
+        keys[symbol] = decision_key(symbol, market_data, intelligence_dict, version=version)
+        cached = cache.get(keys[symbol])
+        if cached is not None:
+            log_info(f"[+] {symbol} 行情与情报未变，复用缓存决策: {cached.get('action')} - {cached.get('reason')}")
+            gate.record(symbol, market_data, intelligence_dict, cached)
+            results[symbol] = cached
+            continue
+        blocks[symbol] = _symbol_block(symbol, market_data, intelligence_dict)
+        for item in intelligence_dict.get("macro_market_news", []):
+            if item not in macro_news:
+                macro_news.append(item)
+
+    macro_tokens = estimate_tokens(system_prompt) + estimate_tokens(_batch_user_prompt(macro_news, []))
+    pending = plan_batches(blocks, macro_tokens)
+    dispatcher = get_llm_dispatcher()
+    for attempt in range(1, retry_count + 1):
+        retry, error = [], None
+        for batch in pending:
+            log_info(f"[*] 正在向 DeepSeek (模型: {MODEL_NAME}) 批量请求 {len(batch)} 个标的的决策: {batch}")
+            try:
+                raw_content = dispatcher.call(_chat_completion, system_prompt,
+                                              _batch_user_prompt(macro_news, [blocks[s] for s in batch]),
+                                              openers="[{", label=f"batch_{len(batch)}")
+                decisions = _parse_batch_reply(raw_content, batch)
+            except DeadlineExceeded:
+                raise
+            except json.JSONDecodeError as e:
+                log_error(f"[-] 批量尝试 {attempt}/{retry_count} 失败: 大模型返回的不是合法 JSON 格式。错误: {e}")
+                decisions = {}
+            except requests.exceptions.RequestException as e:
+                _log_request_error(attempt, retry_count, e)
+                decisions = {}
+                error = e
+            except Exception as e:
+                log_error(f"[-] 批量尝试 {attempt}/{retry_count} 失败: 未知错误 - {e}")
+                decisions = {}
+            for symbol, decision in decisions.items():
+                log_info(f"[+] DeepSeek 决策成功: {symbol} {decision['action']} - {decision['reason']} (尝试 {attempt}/{retry_count})")
+                cache.put(keys[symbol], symbol, decision)
+                gate.record(symbol, *requests_by_symbol[symbol], decision)
+                results[symbol] = dict(decision)
+            missing = [s for s in batch if s not in decisions]
+            if missing and decisions:
+                log_warn(f"[!] 批量回复缺失或不合法的标的: {missing}，将重新分批重试。")
+            retry.extend(missing)
+        if not retry:
+            break
+        if attempt < retry_count:
+            dispatcher.backoff(attempt, error)
+        # 部分失败的标的重新分批再试 (Re-pack only the failed symbols)
+        pending = plan_batches({s: blocks[s] for s in retry}, macro_tokens)
+
+    for symbol in requests_by_symbol:
+        if symbol not in results:
+            # Fallback Mechanism: 多次重试仍失败的标的绝对不能盲目买入
+            log_error(f"[!!!] {symbol} 批量决策环节彻底熔断，触发本地防御机制，强制要求 HOLD。")
+            results[symbol] = {"action": "HOLD", "reason": "API_ERROR_OR_PARSE_FAILED_FALLBACK"}
+    return results
+
 if __name__ == "__main__":
     setup_global_proxy()
     # 模拟沙盒测试数据 (Mock Sandbox Data)
@@ -7,12 +7,33 @@ from debug_sentinel import log_info, log_error, log_warn # type: ignore
 # Phase 4/10 Update: Execution Layer (Thread-Safe Risk Control with Logging)
 # ==========================================
 
+# 止损/止盈防线参数 (Stop thresholds, shared with the tick pacer and the dashboard)
+HARD_STOP_RATIO = 0.92          # 跌破成本价 8% 硬止损
+TRAILING_ACTIVATE_RATIO = 1.10  # 最高价达到成本价 +10% 后启动移动止盈
+TRAILING_DRAWDOWN = 0.05        # 自最高价回撤 5% 触发移动止盈
+
+def stop_levels(pos: dict) -> dict:
+    """
+    计算单个持仓当前生效的触发价 (Active trigger prices for one position)
+    trailing_stop 在移动止盈启动前为 None (None until the trailing stop is armed)
+    """
+    cost_price = pos["cost_price"]
+    highest_price = pos.get("highest_price", cost_price)
+    trailing = highest_price * (1 - TRAILING_DRAWDOWN) if highest_price >= cost_price * TRAILING_ACTIVATE_RATIO else None
+    return {"hard_stop": cost_price * HARD_STOP_RATIO, "trailing_stop": trailing}
+
 class LocalRiskController:
     def __init__(self, initial_capital: float = 100000.0, persist_file: str = "local_positions.json"):
         self.total_capital = initial_capital
         self.max_exposure_ratio = 0.10
         self.persist_file = persist_file
         self.lock = threading.RLock() # 新增可重入锁 (Added Re-entrant thread-safe lock)
+        self.listeners = [] # 持仓变更订阅者，如本地消息总线 (Position-change listeners, e.g. the IPC bus)
+        # 待推送的最新持仓快照，由独立线程在风控锁之外推送 (Latest snapshot, delivered off the risk lock)
+        self.inline_listeners = []
+        self._notify_cond = threading.Condition()
+        self._pending_snapshot = None
+        self._notifier = None
         
         # 启动时自动从本地恢复记忆
         self.positions = self.load_positions()
@@ -34,6 +55,36 @@ class LocalRiskController:
             import copy
             return copy.deepcopy(self.positions)
 
+    def add_listener(self, callback, inline: bool = False):
+        """
+        注册持仓变更回调，每次落盘后收到一份持仓拷贝。回调在独立线程中执行，
+        慢速订阅端 (如卡住的大屏连接) 不会阻塞持有风控锁的止损循环；连续变更只推送最新一份。
+        Called with a positions copy after every save, on a separate thread so a stalled subscriber
+        never blocks the stop loop holding the risk lock; bursts coalesce to the latest snapshot.
+        :param inline: 在落盘时同步调用且不合并，仅限廉价的进程内回调 (如回放成交记录)
+                       (Call synchronously for every save; only for cheap in-process callbacks)
+        """
+        if inline:
+            self.inline_listeners.append(callback)
+            return
+        with self._notify_cond:
+            self.listeners.append(callback)
+            if self._notifier is None:
+                self._notifier = threading.Thread(target=self._notify_loop, name="positions_notifier", daemon=True)
+                self._notifier.start()
+
+    def _notify_loop(self):
+        while True:
+            with self._notify_cond:
+                self._notify_cond.wait_for(lambda: self._pending_snapshot is not None)
+                snapshot, self._pending_snapshot = self._pending_snapshot, None
+                listeners = list(self.listeners)
+            for callback in listeners:
+                try:
+                    callback(snapshot)
+                except Exception as e:
+                    log_error(f"[-] 持仓变更推送失败: {e}")
+
     def save_positions(self):
         """将当前持仓状态落盘保存 (原子级写入 Atomic Write + Thread-Safe ThreadLock)"""
         with self.lock: # 锁定文件写入资源
@@ -55,6 +106,18 @@ class LocalRiskController:
                 os.replace(temp_file, self.persist_file)
             except Exception as e:
                 log_error(f"[-] 保存本地持仓失败: {e}")
+            if self.listeners or self.inline_listeners:
+                snapshot = self.get_positions_copy()
+                for callback in self.inline_listeners:
+                    try:
+                        callback(snapshot)
+                    except Exception as e:
+                        log_error(f"[-] 持仓变更回调失败: {e}")
+            if self.listeners:
+                # 只登记待推送的快照，真正的推送在通知线程中进行 (Only hand the snapshot over here)
+                with self._notify_cond:
+                    self._pending_snapshot = snapshot
+                    self._notify_cond.notify()
 
     def calculate_position_size(self, current_price: float) -> int:
         max_capital_for_trade = self.total_capital * self.max_exposure_ratio
@@ -89,24 +152,34 @@ class LocalRiskController:
         with self.lock: # 全局包围防竞争 (Enclose fully to prevent race condition during iteration)
             if symbol not in self.positions: return False
             pos = self.positions[symbol]
-            cost_price = pos["cost_price"]
             
             # 更新最高价并持久化
             if current_price > pos["highest_price"]:
                 pos["highest_price"] = current_price
                 self.save_positions()
                 
-            highest_price = pos["highest_price"]
+            levels = stop_levels(pos)
             
-            if highest_price >= cost_price * 1.10: 
-                if (highest_price - current_price) / highest_price >= 0.05:
-                    log_warn(f"[!!!] 警报: {symbol} 触发移动止盈！强制 SELL_ALL。")
-                    return True
+            if levels["trailing_stop"] is not None and current_price <= levels["trailing_stop"]:
+                log_warn(f"[!!!] 警报: {symbol} 触发移动止盈！强制 SELL_ALL。")
+                return True
                     
-            if current_price <= cost_price * 0.92:
+            if current_price <= levels["hard_stop"]:
                 log_warn(f"[!!!] 警报: {symbol} 跌破8%硬止损！强制 SELL_ALL。")
                 return True
             return False
+
+    def stop_distance(self, symbol: str, current_price: float):
+        """
+        现价距最近一道生效防线的相对距离 (>0 为尚未触发)，无持仓返回 None
+        Relative distance from price to the nearest armed trigger; None when not held.
+        """
+        with self.lock:
+            if symbol not in self.positions or current_price <= 0:
+                return None
+            levels = stop_levels(self.positions[symbol])
+        triggers = [p for p in levels.values() if p is not None]
+        return min((current_price - p) / current_price for p in triggers)
         
     def execute_live_buy(self, symbol: str, price: float, volume: int):
         """实盘买入执行钉子 (Live Buy Hook)
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import threading
+import concurrent.futures
+from urllib.parse import urlsplit
+import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from urllib3 import connectionpool, connection # type: ignore
+from config import HTTP_POOL_LIMITS, HTTP_ASYNC_WORKERS # type: ignore
+from debug_sentinel import log_info, log_debug # type: ignore
+
+# ==========================================
+# Phase 37: Pooled Keep-Alive HTTP Client (连接池 + 长连接的共享 HTTP 客户端)
+# ==========================================
+# DeepSeek 与 Server酱 的调用原先每次 requests.post 都新建连接，经本地代理重新走一遍 TCP + TLS 握手。
+# 这里提供进程级共享的 Session: 按主机挂载独立连接池 (HTTP_POOL_LIMITS 限制每个主机的并发连接数，
+# 池满时排队等待而不是新开连接)，连接保持长连接复用。每次请求记录 TCP 建连/TLS 握手/首字节/总耗时。
+# A process-wide Session with a bounded keep-alive pool per host, so LLM and push calls reuse
+# connections instead of paying TCP + TLS through the proxy every time. Each request records
+# connect / TLS / first-byte / total timings.
+#
+# 异步变体 (AsyncHttpClient) 把同一个连接池放进有界线程池，供 asyncio 流水线 await，不引入新依赖。
+# The async variant runs the same pooled client on a bounded executor for asyncio callers.
+
+# 当前线程正在进行的请求的建连计时 (Connect timings of the request running on this thread)
+_timing = threading.local()
+
+class _TimedConnectMixin:
+    """记录 TCP 建连与完整建连 (含代理隧道与 TLS) 耗时 (Time TCP connect and the full connect incl. TLS)"""
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            _timing.tcp_ms = (time.perf_counter() - started) * 1000
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _timing.connect_ms = (time.perf_counter() - started) * 1000
+
+class _TimedHTTPConnection(_TimedConnectMixin, connection.HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_TimedConnectMixin, connection.HTTPSConnection):
+    pass
+
+class _TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+_TIMED_POOLS = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+class _TimedAdapter(HTTPAdapter):
+    """连接池使用计时连接类，直连与代理两条路径都生效 (Timed connection classes, direct and proxied)"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TIMED_POOLS
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = _TIMED_POOLS
+        return manager
+
+class PooledHttpClient:
+    def __init__(self, pool_limits: dict = HTTP_POOL_LIMITS):
+        """
+        :param pool_limits: {主机: 最大连接数}，"default" 为未列出主机的上限 (Per-host connection caps)
+        """
+        self.pool_limits = pool_limits
+        self.session = requests.Session()
+        default = pool_limits.get("default", 4)
+        for scheme in ("https://", "http://"):
+            self.session.mount(scheme, _TimedAdapter(pool_connections=len(pool_limits), pool_maxsize=default, pool_block=True))
+        for host, limit in pool_limits.items():
+            if host != "default":
+                # 池满时阻塞等待空闲连接，而不是临时新开连接 (Block for a free connection instead of opening more)
+                self.session.mount(f"https://{host}", _TimedAdapter(pool_connections=1, pool_maxsize=limit, pool_block=True))
+        self.lock = threading.Lock()
+        self.stats = {}  # host -> 累计计时 (Accumulated timings)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        发送请求并在 response.timing 上附带本次计时 (毫秒)；reused 表示复用了长连接
+        Send a request; response.timing carries this call's timings in ms (reused = kept-alive connection).
+        """
+        _timing.tcp_ms = None
+        _timing.connect_ms = None
+        started = time.perf_counter()
+        response = self.session.request(method, url, **kwargs)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        connect_ms = _timing.connect_ms
+        tcp_ms = _timing.tcp_ms
+        timing = {
+            "reused": connect_ms is None,
+            "connect_ms": round(tcp_ms or 0.0, 1),
+            "tls_ms": round(max((connect_ms or 0.0) - (tcp_ms or 0.0), 0.0), 1) if url.startswith("https") else 0.0,
+            # requests 的 elapsed 为发出请求到响应头解析完成 (Request sent -> headers parsed)
+            "first_byte_ms": round(response.elapsed.total_seconds() * 1000, 1),
+            "total_ms": round(total_ms, 1),
+        }
+        response.timing = timing
+        self._record(urlsplit(url).hostname, timing)
+        log_debug(f"[*] HTTP {method} {urlsplit(url).hostname} {response.status_code} | {timing}")
+        return response
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def _record(self, host: str, timing: dict):
+        with self.lock:
+            st = self.stats.setdefault(host, {"calls": 0, "reused": 0, "connect_ms": 0.0, "tls_ms": 0.0,
+                                              "first_byte_ms": 0.0, "total_ms": 0.0})
+            st["calls"] += 1
+            st["reused"] += int(timing["reused"])
+            for key in ("connect_ms", "tls_ms", "first_byte_ms", "total_ms"):
+                st[key] += timing[key]
+
+    def get_stats(self) -> dict:
+        """各主机的调用次数、长连接复用率与平均耗时 (Per-host calls, reuse ratio and mean timings)"""
+        with self.lock:
+            return {
+                host: {
+                    "calls": st["calls"],
+                    "reuse_ratio": round(st["reused"] / st["calls"], 3),
+                    **{f"avg_{key}": round(st[key] / st["calls"], 1) for key in ("connect_ms", "tls_ms", "first_byte_ms", "total_ms")},
+                }
+                for host, st in self.stats.items()
+            }
+
+    def close(self):
+        self.session.close()
+
+class AsyncHttpClient:
+    """
+    asyncio 变体：在有界线程池中复用同一个连接池 (Awaitable wrapper over the shared pooled client)
+    """
+    def __init__(self, client: PooledHttpClient = None, max_workers: int = HTTP_ASYNC_WORKERS):
+        self.client = client or get_http_client()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="http_async")
+
+    async def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: self.client.request(method, url, **kwargs))
+
+    async def post(self, url: str, **kwargs) -> requests.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> requests.Response:
+        return await self.request("GET", url, **kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_client = None
+_default_client_guard = threading.Lock()
+
+def get_http_client() -> PooledHttpClient:
+    """获取进程级共享的 HTTP 客户端 (Get the process-wide pooled HTTP client)"""
+    global _default_client
+    with _default_client_guard:
+        if _default_client is None:
+            _default_client = PooledHttpClient()
+        return _default_client
+
+def report_http_stats():
+    """将各主机的连接复用与耗时统计输出到日志 (Log per-host reuse and timing stats)"""
+    for host, st in get_http_client().get_stats().items():
+        log_info(f"[*] HTTP [{host}] 调用 {st['calls']} 次 | 长连接复用率 {st['reuse_ratio']} | 建连 {st['avg_connect_ms']}ms | "
+                 f"TLS {st['avg_tls_ms']}ms | 首字节 {st['avg_first_byte_ms']}ms | 总计 {st['avg_total_ms']}ms")
@@ -0,0 +1,193 @@
+import os
+import json
+import copy
+import math
+import threading
+import pandas as pd # type: ignore
+from config import INDICATOR_STATE_DIR # type: ignore
+from indicators import RSI_WINDOW, MACD_FAST, MACD_SLOW, MACD_SIGNAL # type: ignore
+from debug_sentinel import log_info, log_error, log_warn # type: ignore
+
+# ==========================================
+# Phase 21: Streaming Indicator Engine (流式 O(1) 指标状态机)
+# ==========================================
+# 为每个 (标的, 周期) 维护 RSI/MACD 的运行态累加器，新 K 线到达时只做常数时间的增量更新，
+# 而不是每个周期都对全量历史重新跑 rolling/ewm。状态落盘后重启可直接续算。
+# Keeps per-symbol running RSI/MACD accumulators so a new bar costs O(1) instead of a
+# full-history rolling/ewm pass. State is persisted and resumed across restarts.
+#
+# 结果与批量算法 (indicators 面板库 / fetch_and_clean_kline_data) 一致:
+#   RSI_14 为 14 期简单均值版 (rolling mean)，MACD 为 adjust=False 的 EMA(12, 26, 9)。
+# 最后一根 K 线可能仍在走 (盘中)，因此只作为 "临时" K 线参与计算，不写入持久化状态。
+# The last bar may still be forming, so it is evaluated provisionally and never committed.
+
+
+def _ewm_step(prev, x: float, span: int) -> float:
+    """
+    与 pandas ewm(span, adjust=False) 完全相同的单步递推 (含相同的归一化分母)
+    Single EMA step replicating pandas ewm(adjust=False) arithmetic exactly.
+    """
+    if prev is None:
+        return x
+    alpha = 2.0 / (span + 1.0)
+    old_wt = 1.0 - alpha
+    return (old_wt * prev + alpha * x) / (old_wt + alpha)
+
+def _new_state() -> dict:
+    return {
+        "last_ts": None,      # 最后一根已提交 K 线的时间 (Timestamp of the last committed bar)
+        "last_close": None,
+        "ema_fast": None,
+        "ema_slow": None,
+        "dea": None,
+        "gains": [],          # 最近 RSI_WINDOW 个涨幅 (Last RSI_WINDOW gains)
+        "losses": [],         # 最近 RSI_WINDOW 个跌幅 (Last RSI_WINDOW losses)
+        "snapshot": None,     # 最后一根指标有效 K 线的快照 (Latest bar with a valid RSI)
+    }
+
+def _step(state: dict, ts, close: float):
+    """吞入一根新 K 线，原地更新状态 (Consume one bar, updating state in place)"""
+    prev_close = state["last_close"]
+    # 第一根 K 线没有前收，批量写法 delta.where(delta > 0, 0) 会把它记为 0 涨跌幅，这里保持一致
+    # The batch formula counts the first bar's NaN move as zero; mirror that here.
+    delta = close - prev_close if prev_close is not None else 0.0
+    state["gains"].append(delta if delta > 0 else 0.0)
+    state["losses"].append(-delta if delta < 0 else 0.0)
+    if len(state["gains"]) > RSI_WINDOW:
+        state["gains"].pop(0)
+        state["losses"].pop(0)
+
+    state["ema_fast"] = _ewm_step(state["ema_fast"], close, MACD_FAST)
+    state["ema_slow"] = _ewm_step(state["ema_slow"], close, MACD_SLOW)
+    dif = state["ema_fast"] - state["ema_slow"]
+    state["dea"] = _ewm_step(state["dea"], dif, MACD_SIGNAL)
+    state["last_ts"] = pd.Timestamp(ts).isoformat()
+    state["last_close"] = close
+
+    # RSI 预热期未满或 0/0 时无效，批量算法会把这类行 dropna 掉 (Batch path drops these rows)
+    if len(state["gains"]) < RSI_WINDOW:
+        return
+    gain = sum(state["gains"]) / RSI_WINDOW
+    loss = sum(state["losses"]) / RSI_WINDOW
+    if loss == 0:
+        if gain == 0:
+            return
+        rsi = 100.0
+    else:
+        rsi = 100 - (100 / (1 + gain / loss))
+
+    state["snapshot"] = {
+        "时间": state["last_ts"],
+        "收盘": close,
+        "RSI_14": rsi,
+        "MACD_DIF": dif,
+        "MACD_DEA": state["dea"],
+        "MACD_HIST": 2 * (dif - state["dea"]),
+    }
+
+class IncrementalIndicatorEngine:
+    def __init__(self, state_dir: str = INDICATOR_STATE_DIR):
+        """
+        流式指标引擎 (Streaming Indicator Engine)
+        状态文件: {state_dir}/{period}/{symbol}.json
+        """
+        self.state_dir = state_dir
+        self._states = {}
+        self.lock = threading.RLock()
+
+    def _path_for(self, symbol: str, period: str) -> str:
+        return os.path.join(self.state_dir, period, f"{symbol}.json")
+
+    def _load(self, symbol: str, period: str):
+        key = (symbol, period)
+        if key in self._states:
+            return self._states[key]
+        path = self._path_for(symbol, period)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._states[key] = json.load(f)
+                    return self._states[key]
+            except Exception as e:
+                log_error(f"[-] 加载指标状态失败 ({symbol}/{period}): {e}")
+        return None
+
+    def _save(self, symbol: str, period: str, state: dict):
+        """原子级写入 (Atomic write)"""
+        path = self._path_for(symbol, period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log_error(f"[-] 保存指标状态失败 ({symbol}/{period}): {e}")
+
+    def _resume_position(self, state: dict, df: pd.DataFrame):
+        """
+        校验持久化状态与当前 K 线序列是否连续，返回续算起点下标；不连续返回 None
+        Verify the persisted state still lines up with the bars; return the resume index or None.
+        """
+        last_ts = pd.Timestamp(state["last_ts"])
+        pos = df.index.searchsorted(last_ts)
+        if pos >= len(df) or df.index[pos] != last_ts:
+            return None
+        # 前复权改写会让历史收盘价整体漂移 (A qfq rewrite shifts historical closes)
+        if not math.isclose(float(df['收盘'].iloc[pos]), state["last_close"], rel_tol=1e-9):
+            return None
+        return pos + 1
+
+    def update(self, symbol: str, period: str, df: pd.DataFrame):
+        """
+        输入清洗后的 K 线 (时间索引 + 收盘列)，返回最新一根有效 K 线的指标快照
+        Feed cleaned bars (datetime index + 收盘); returns the latest valid indicator snapshot.
+        """
+        if df is None or df.empty:
+            return None
+
+        with self.lock:
+            state = self._load(symbol, period)
+            start = None
+            if state is not None and state["last_ts"] is not None:
+                start = self._resume_position(state, df)
+                if start is None:
+                    log_warn(f"[!] {symbol}/{period} 指标状态与 K 线序列不连续 (复权改写或数据回补)，从头重建...")
+            if start is None:
+                state = _new_state()
+                start = 0
+
+            # 只提交已收盘的 K 线，最后一根临时计算 (Commit closed bars; evaluate the last bar provisionally)
+            closes = df['收盘'].to_numpy(dtype=float)
+            committed = 0
+            for i in range(start, len(df) - 1):
+                _step(state, df.index[i], float(closes[i]))
+                committed += 1
+
+            self._states[(symbol, period)] = state
+            if committed:
+                self._save(symbol, period, state)
+                if start == 0:
+                    log_info(f"[+] {symbol}/{period} 指标状态建档完成: 已提交 {committed} 根 K 线。")
+
+            if start > len(df) - 1:
+                # 没有比已提交状态更新的 K 线 (Nothing newer than committed state)
+                return state["snapshot"]
+
+            provisional = copy.deepcopy(state)
+            _step(provisional, df.index[-1], float(closes[-1]))
+            return provisional["snapshot"]
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_engine = None
+_default_engine_guard = threading.Lock()
+
+def get_indicator_engine() -> IncrementalIndicatorEngine:
+    """获取进程级共享的流式指标引擎 (Get the process-wide indicator engine)"""
+    global _default_engine
+    with _default_engine_guard:
+        if _default_engine is None:
+            _default_engine = IncrementalIndicatorEngine()
+        return _default_engine
@@ -0,0 +1,200 @@
+import numpy as np # type: ignore
+
+# ==========================================
+# Phase 24: Vectorized Panel Indicators (多标的向量化指标库)
+# ==========================================
+# 全系统唯一的技术指标实现，采集层 / 选股雷达 / 时光机回测共用。
+# 所有函数都作用在 2D NumPy 面板 (标的 × 时间) 上，一次向量化计算覆盖所有标的。
+# 不同长度的序列通过 stack_right_aligned 右对齐 (最新一根 K 线对齐在最后一列)，左侧用 NaN 填充。
+# The single indicator implementation shared by harvester, scanner and backtester.
+# Every function takes a 2D panel (symbols x time); ragged histories are right-aligned
+# (latest bar in the last column) and NaN-padded on the left.
+#
+# 数值约定与 pandas 批量写法一致: 滚动窗口内含 NaN 则结果为 NaN (min_periods=window)，
+# EMA 与 ewm(span, adjust=False) 逐位一致，Wilder RSI 与 ewm(alpha=1/14, adjust=False) 逐位一致，
+# 简单 RSI 与 indicator_state 流式引擎逐位一致。运行 `python indicators.py` 可对照 pandas 做一致性自检。
+# Numerics match the pandas batch formulas and the streaming engine in indicator_state;
+# `python indicators.py` checks parity against pandas.
+
+RSI_WINDOW = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+
+def as_panel(values) -> np.ndarray:
+    """把 1D 序列或 2D 面板统一转为 float64 的 2D 面板 (Coerce 1D/2D input to a float panel)"""
+    panel = np.asarray(values, dtype=np.float64)
+    if panel.ndim == 1:
+        panel = panel[np.newaxis, :]
+    return panel
+
+def stack_right_aligned(series_list, length: int = None) -> np.ndarray:
+    """
+    将长度不一的序列右对齐堆叠为面板，可选只保留最近 length 根
+    Stack ragged sequences into a right-aligned panel, optionally keeping the last `length` bars.
+    """
+    arrays = [np.asarray(s, dtype=np.float64) for s in series_list]
+    width = length if length is not None else max((len(a) for a in arrays), default=0)
+    panel = np.full((len(arrays), width), np.nan)
+    for row, arr in enumerate(arrays):
+        tail = arr[-width:] if width else arr[:0]
+        if len(tail):
+            panel[row, width - len(tail):] = tail
+    return panel
+
+def diff(panel) -> np.ndarray:
+    """逐期差分，第一列为 NaN (First difference; first column is NaN)"""
+    panel = as_panel(panel)
+    out = np.full_like(panel, np.nan)
+    out[:, 1:] = panel[:, 1:] - panel[:, :-1]
+    return out
+
+def rolling_mean(panel, window: int) -> np.ndarray:
+    """
+    滚动均值 (窗口内任一值为 NaN 则结果为 NaN)。按窗口内从旧到新的顺序逐项累加，
+    与流式引擎的求和顺序保持一致。
+    Rolling mean (NaN if any value in the window is NaN), summed oldest-to-newest to
+    stay bit-identical with the streaming engine.
+    """
+    panel = as_panel(panel)
+    n_sym, n_t = panel.shape
+    out = np.full_like(panel, np.nan)
+    if n_t < window:
+        return out
+    acc = panel[:, 0:n_t - window + 1].copy()
+    for k in range(1, window):
+        acc += panel[:, k:n_t - window + 1 + k]
+    out[:, window - 1:] = acc / window
+    return out
+
+def ewm_alpha(panel, alpha: float, min_periods: int = 0) -> np.ndarray:
+    """
+    按平滑系数 alpha 的指数加权均值，等价于 pandas ewm(alpha=alpha, adjust=False, min_periods=min_periods)；
+    每行从其第一个有效值起算，有效值不足 min_periods 个时为 NaN。
+    Exponentially weighted mean equal to pandas ewm(alpha, adjust=False, min_periods), seeded
+    per row at its first valid value.
+    """
+    panel = as_panel(panel)
+    old_wt = 1.0 - alpha
+    out = np.full_like(panel, np.nan)
+    prev = np.full(panel.shape[0], np.nan)
+    seen = np.zeros(panel.shape[0], dtype=int)
+    for t in range(panel.shape[1]):
+        x = panel[:, t]
+        seen += ~np.isnan(x)
+        stepped = (old_wt * prev + alpha * x) / (old_wt + alpha)
+        prev = np.where(np.isnan(prev), x, np.where(np.isnan(x), prev, stepped))
+        out[:, t] = np.where(seen >= max(min_periods, 1), prev, np.nan)
+    return out
+
+def ema(panel, span: int) -> np.ndarray:
+    """
+    指数移动平均，等价于 pandas ewm(span=span, adjust=False)；每行从其第一个有效值起算。
+    Exponential moving average equal to pandas ewm(span, adjust=False), seeded per row
+    at its first valid value.
+    """
+    return ewm_alpha(panel, 2.0 / (span + 1.0))
+
+def _rsi_from_averages(avg_gain: np.ndarray, avg_loss: np.ndarray) -> np.ndarray:
+    """RS -> RSI；只有跌幅为 0 时 RSI=100，涨跌均为 0 时为 NaN (0/0)"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+def rsi_simple(close, window: int = RSI_WINDOW) -> np.ndarray:
+    """
+    简单均值版 RSI (rolling mean of gains/losses)，与系统原有 pandas 写法一致：
+    每行第一根 K 线的差分 (NaN) 按 pandas where 语义记为 0 涨跌幅，左侧填充区保持 NaN。
+    Matches the original pandas formula: a row's first (NaN) move counts as a zero move,
+    exactly like Series.where(delta > 0, 0); left padding stays NaN.
+    """
+    close = as_panel(close)
+    delta = diff(close)
+    padding = np.isnan(close)
+    gain = np.where(padding, np.nan, np.where(delta > 0, delta, 0.0))
+    loss = np.where(padding, np.nan, np.where(delta < 0, -delta, 0.0))
+    return _rsi_from_averages(rolling_mean(gain, window), rolling_mean(loss, window))
+
+def rsi_wilder(close, window: int = RSI_WINDOW) -> np.ndarray:
+    """
+    Wilder 平滑版 RSI，涨跌幅的构造与 rsi_simple 相同，均值改为 alpha=1/window 的指数平滑：
+    与 pandas delta.where(...).ewm(alpha=1/window, adjust=False, min_periods=window) 逐位一致。
+    Wilder RSI: the same gains/losses as rsi_simple, smoothed with alpha = 1/window; matches
+    pandas ewm(alpha=1/window, adjust=False, min_periods=window) on them.
+    """
+    close = as_panel(close)
+    delta = diff(close)
+    padding = np.isnan(close)
+    gain = np.where(padding, np.nan, np.where(delta > 0, delta, 0.0))
+    loss = np.where(padding, np.nan, np.where(delta < 0, -delta, 0.0))
+    alpha = 1.0 / window
+    return _rsi_from_averages(ewm_alpha(gain, alpha, window), ewm_alpha(loss, alpha, window))
+
+def macd(close, fast: int = MACD_FAST, slow: int = MACD_SLOW, signal: int = MACD_SIGNAL):
+    """
+    MACD (DIF, DEA, HIST)，HIST 采用国内行情软件惯用的 2 倍柱
+    Returns (DIF, DEA, HIST) with the 2x histogram used by CN/HK charting software.
+    """
+    close = as_panel(close)
+    dif = ema(close, fast) - ema(close, slow)
+    dea = ema(dif, signal)
+    return dif, dea, 2 * (dif - dea)
+
+def momentum(close, lookback: int = 7) -> np.ndarray:
+    """N 期累计涨幅 (%) (Percent change over `lookback` bars)"""
+    close = as_panel(close)
+    out = np.full_like(close, np.nan)
+    out[:, lookback:] = (close[:, lookback:] - close[:, :-lookback]) / close[:, :-lookback] * 100
+    return out
+
+def volume_ratio(volume, recent: int = 3, prior: int = 7) -> np.ndarray:
+    """
+    放量比：近 recent 期均量 / 再往前 prior 期均量；前期均量为 0 时记为 1.0
+    Volume ratio: mean of the last `recent` bars over the mean of the `prior` bars before them.
+    """
+    volume = as_panel(volume)
+    recent_mean = rolling_mean(volume, recent)
+    prior_mean = np.full_like(volume, np.nan)
+    prior_mean[:, recent:] = rolling_mean(volume, prior)[:, :-recent]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = recent_mean / prior_mean
+    return np.where(prior_mean > 0, ratio, np.where(np.isnan(prior_mean), np.nan, 1.0))
+
+def _pandas_parity_check(n_sym: int = 6, n_t: int = 120, seed: int = 7) -> dict:
+    """
+    用随机的参差不齐面板对照 pandas 参考写法，返回各指标的最大绝对误差 (Max abs error per indicator vs pandas)
+    """
+    import pandas as pd # type: ignore
+    rng = np.random.default_rng(seed)
+    series_list = [100 + np.cumsum(rng.normal(0, 1, rng.integers(20, n_t))) for _ in range(n_sym)]
+    panel = stack_right_aligned(series_list)
+    width = panel.shape[1]
+    ours = {"rsi_simple": rsi_simple(panel), "rsi_wilder": rsi_wilder(panel), "ema_12": ema(panel, MACD_FAST)}
+    errors = {name: 0.0 for name in ours}
+    for row, values in enumerate(series_list):
+        close = pd.Series(values)
+        delta = close.diff()
+        gain, loss = delta.where(delta > 0, 0), -delta.where(delta < 0, 0)
+        wilder = dict(alpha=1 / RSI_WINDOW, adjust=False, min_periods=RSI_WINDOW)
+        reference = {
+            "rsi_simple": 100 - 100 / (1 + gain.rolling(RSI_WINDOW).mean() / loss.rolling(RSI_WINDOW).mean()),
+            "rsi_wilder": 100 - 100 / (1 + gain.ewm(**wilder).mean() / loss.ewm(**wilder).mean()),
+            "ema_12": close.ewm(span=MACD_FAST, adjust=False).mean(),
+        }
+        for name, expected in reference.items():
+            got = ours[name][row, width - len(values):]
+            expected = expected.to_numpy(dtype=np.float64)
+            if not np.array_equal(np.isnan(got), np.isnan(expected)):
+                errors[name] = float("inf")
+                continue
+            mask = ~np.isnan(expected)
+            if mask.any():
+                errors[name] = max(errors[name], float(np.max(np.abs(got[mask] - expected[mask]))))
+    return errors
+
+if __name__ == "__main__":
+    # 与 pandas 参考写法的一致性自检 (Parity self-check against the pandas formulas)
+    errors = _pandas_parity_check()
+    for name, err in errors.items():
+        print(f"[{'+' if err < 1e-9 else '-'}] {name}: 与 pandas 最大误差 {err:.3g}")
+    raise SystemExit(0 if all(err < 1e-9 for err in errors.values()) else 1)
@@ -0,0 +1,385 @@
+import os
+import copy
+import hmac
+import json
+import time
+import queue
+import socket
+import struct
+import secrets
+import threading
+from config import BUS_HOST, BUS_PORT, BUS_TOKEN_FILE, BUS_MAX_FRAME_BYTES, BUS_CLIENT_QUEUE_MAX # type: ignore
+from debug_sentinel import log_info, log_error, log_warn # type: ignore
+
+# ==========================================
+# Phase 28: Local IPC Bus (本机发布/订阅消息总线)
+# ==========================================
+# 守护进程、Web 大屏与选股雷达之间原本靠 JSON 文件轮询通信 (每个 tick 一次 fsync，大屏 2 秒一读)。
+# 这里由主守护进程托管一个回环 TCP 上的发布/订阅总线 (普通 socket 上的长度前缀 JSON 帧，Windows 同样可用)，
+# 行情、持仓、决策与自选股编辑都以消息推送；JSON 文件仅保留为总线不可用时的兜底快照。
+# The main daemon hosts a loopback pub/sub bus over a plain TCP socket (works on Windows).
+# Ticks, positions, decisions and watchlist edits travel as messages; the JSON files remain
+# only as a fallback snapshot for when the bus is down.
+#
+# 传输为普通 TCP 上的 "4 字节长度 + JSON" 帧，绝不反序列化 pickle；握手令牌每次启动随机生成，
+# 写入仅当前用户可读 (0600) 的 BUS_TOKEN_FILE，订阅端连上后第一帧须出示该令牌。
+# Frames are a 4-byte length prefix plus JSON over a plain socket (never pickle). The handshake
+# token is random per run and stored in BUS_TOKEN_FILE with mode 0600; clients must present it first.
+#
+# 每个主题维护 "最新状态"，新订阅者连上时先收到一份完整快照，之后只收增量。
+# Each topic keeps its latest state; a new subscriber gets a full snapshot, then deltas.
+#
+# publish 由止损 tick 循环调用，绝不能被某个订阅者拖住: 每个订阅者有一个有界发送队列和独立的写线程，
+# publish 只负责入队；停止读取的订阅者 (如挂起的大屏) 队列溢出后即被断开。
+# publish runs on the stop-loss tick loop and must never block on a subscriber: each one has a
+# bounded outbound queue drained by its own writer thread, and a subscriber that overflows it is dropped.
+
+TOPIC_TICK = "tick"            # {symbol: {"price", "pct"}}，按标的合并 (merged per symbol)
+TOPIC_POSITIONS = "positions"  # 完整持仓字典，整体替换 (full positions dict, replaced)
+TOPIC_DECISION = "decision"    # {symbol: {"action", "reason", "ts"}}，按标的合并
+TOPIC_WATCHLIST = "watchlist"  # 自选股代码列表，整体替换 (full symbol list, replaced)
+TOPIC_METRICS = "metrics"      # {指标名: 数值}，按指标合并 (merged per metric name)
+
+# 按标的增量合并的主题，其余主题整体替换 (Topics merged per symbol; the rest are replaced)
+MERGED_TOPICS = {TOPIC_TICK, TOPIC_DECISION, TOPIC_METRICS}
+
+def _json_default(obj):
+    """numpy 标量等转为原生类型 (numpy scalars and the like become plain values)"""
+    return obj.item() if hasattr(obj, "item") else str(obj)
+
+class _FramedConnection:
+    """长度前缀 JSON 帧连接 (Length-prefixed JSON frames over a socket)"""
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    @staticmethod
+    def encode(msg) -> bytes:
+        """编码为一帧，可一次编码后发给多个订阅者 (Encode once, send to many)"""
+        data = json.dumps(msg, ensure_ascii=False, default=_json_default).encode("utf-8")
+        return struct.pack(">I", len(data)) + data
+
+    def send_frame(self, frame: bytes):
+        self.sock.sendall(frame)
+
+    def send(self, msg):
+        self.send_frame(self.encode(msg))
+
+    def _recv_exact(self, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = self.sock.recv(min(size, 65536))
+            if not chunk:
+                raise EOFError("对端已关闭连接")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def recv(self):
+        (size,) = struct.unpack(">I", self._recv_exact(4))
+        if size > BUS_MAX_FRAME_BYTES:
+            raise OSError(f"消息帧过大: {size} 字节")
+        try:
+            return json.loads(self._recv_exact(size).decode("utf-8"))
+        except ValueError as e:
+            raise OSError(f"消息帧不是合法 JSON: {e}")
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def close(self):
+        self.sock.close()
+
+def _write_token(path: str, token: str):
+    """原子写入握手令牌，文件权限 0600 (Atomic write, readable by the current user only)"""
+    tmp_path = path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+
+def _read_token(path: str = BUS_TOKEN_FILE) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def _connect(address, token_path: str = BUS_TOKEN_FILE, timeout: float = 5.0) -> _FramedConnection:
+    """连接总线并出示本次运行的令牌 (Connect and present this run's token)"""
+    token = _read_token(token_path)
+    sock = socket.create_connection(address, timeout=timeout)
+    conn = _FramedConnection(sock)
+    try:
+        conn.send({"auth": token})
+        conn.settimeout(None)
+    except OSError:
+        conn.close()
+        raise
+    return conn
+
+def _merge(state: dict, topic: str, payload):
+    """把一条消息合并进主题最新状态 (Fold one message into the topic state)"""
+    if topic in MERGED_TOPICS:
+        state.setdefault(topic, {}).update(payload)
+    else:
+        state[topic] = payload
+
+class BusBroker:
+    def __init__(self, host: str = BUS_HOST, port: int = BUS_PORT, token_path: str = BUS_TOKEN_FILE):
+        """主守护进程内的总线服务端 (Bus server hosted by the main daemon)"""
+        self.address = (host, port)
+        self.token_path = token_path
+        self.token = None
+        self.state = {}
+        self.handlers = {}
+        self.clients = []
+        self.listener = None
+        self.queue_max = BUS_CLIENT_QUEUE_MAX
+        self.lock = threading.RLock()
+
+    def start(self) -> bool:
+        """开始监听；端口被占用时返回 False，调用方退回 JSON 文件通信 (False -> fall back to files)"""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name == "posix":
+                # 守护进程重启时端口可能仍处于 TIME_WAIT (Allow rebinding right after a restart)
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(self.address)
+            listener.listen()
+        except OSError as e:
+            listener.close()
+            log_error(f"[-] 本地消息总线监听 {self.address} 失败，退回 JSON 文件通信: {e}")
+            return False
+        try:
+            self.token = secrets.token_hex(32)
+            _write_token(self.token_path, self.token)
+        except OSError as e:
+            log_error(f"[-] 无法写入消息总线令牌 {self.token_path}，退回 JSON 文件通信: {e}")
+            listener.close()
+            return False
+        self.listener = listener
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        log_info(f"[+] 本地消息总线已启动: {self.address[0]}:{self.address[1]}")
+        return True
+
+    @property
+    def online(self) -> bool:
+        return self.listener is not None
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError as e:
+                log_warn(f"[!] 消息总线接受连接失败: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(_FramedConnection(sock),), daemon=True).start()
+
+    def _authenticate(self, conn: _FramedConnection) -> bool:
+        """第一帧须在超时内出示本次运行的令牌 (The first frame must carry this run's token)"""
+        try:
+            conn.settimeout(5.0)
+            hello = conn.recv()
+            conn.settimeout(None)
+        except (EOFError, OSError):
+            return False
+        token = hello.get("auth") if isinstance(hello, dict) else None
+        return isinstance(token, str) and hmac.compare_digest(token, self.token)
+
+    def _serve(self, conn):
+        """先推送完整快照，再持续接收该订阅者发来的消息 (Snapshot first, then read its publishes)"""
+        if not self._authenticate(conn):
+            # 握手失败 (令牌错误或对端中途断开) 不影响后续连接 (Bad handshakes are skipped)
+            log_warn("[!] 消息总线拒绝了一个未通过令牌校验的连接。")
+            conn.close()
+            return
+        client = {"conn": conn, "queue": queue.Queue(maxsize=self.queue_max), "closed": False}
+        with self.lock:
+            try:
+                snapshot = _FramedConnection.encode(("snapshot", self.state))
+            except (TypeError, ValueError) as e:
+                log_error(f"[-] 消息总线快照无法编码: {e}")
+                conn.close()
+                return
+            # 快照先于任何增量入队，之后才加入广播名单 (Snapshot is queued before any delta)
+            client["queue"].put_nowait(snapshot)
+            self.clients.append(client)
+        threading.Thread(target=self._writer, args=(client,), daemon=True).start()
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            if isinstance(msg, list) and len(msg) == 3 and msg[0] == "pub" and isinstance(msg[1], str):
+                self.publish(msg[1], msg[2])
+        self._drop(client)
+
+    def _writer(self, client: dict):
+        """订阅者专属写线程，慢订阅者只阻塞自己 (Per-subscriber writer; a slow reader only blocks itself)"""
+        while not client["closed"]:
+            frame = client["queue"].get()
+            if frame is None:
+                break
+            try:
+                client["conn"].send_frame(frame)
+            except OSError:
+                break
+        self._drop(client)
+
+    def _enqueue(self, client: dict, frame: bytes):
+        """非阻塞入队；队列已满说明订阅者已停止读取，直接断开 (Never blocks; drop on overflow)"""
+        try:
+            client["queue"].put_nowait(frame)
+        except queue.Full:
+            log_warn(f"[!] 消息总线订阅者积压超过 {self.queue_max} 帧，已断开该订阅者。")
+            self._drop(client)
+
+    def _drop(self, client: dict):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+            if client["closed"]:
+                return
+            client["closed"] = True
+        try:
+            # 唤醒空闲的写线程 (Wake an idle writer)
+            client["queue"].put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            # 关闭套接字会打断阻塞中的 sendall / recv (Closing interrupts a blocked sendall or recv)
+            client["conn"].sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            client["conn"].close()
+        except OSError:
+            pass
+
+    def publish(self, topic: str, payload):
+        """更新主题状态并推送给所有订阅者与本地处理函数 (Update state, fan out to subscribers and handlers)"""
+        with self.lock:
+            _merge(self.state, topic, payload)
+            clients = list(self.clients)
+            handlers = list(self.handlers.get(topic, []))
+        if clients:
+            try:
+                frame = _FramedConnection.encode(("pub", topic, payload))
+            except (TypeError, ValueError) as e:
+                log_error(f"[-] 消息总线主题 [{topic}] 的消息无法编码: {e}")
+                clients = []
+            for client in clients:
+                self._enqueue(client, frame)
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e:
+                log_error(f"[-] 消息总线处理函数 [{topic}] 异常: {e}")
+
+    def subscribe(self, topic: str, handler):
+        """注册本进程内的主题处理函数 (Register an in-process handler for a topic)"""
+        with self.lock:
+            self.handlers.setdefault(topic, []).append(handler)
+
+    def latest(self, topic: str, default=None):
+        """读取主题最新状态的拷贝 (Copy of the latest state for a topic)"""
+        with self.lock:
+            return copy.deepcopy(self.state.get(topic, default))
+
+class BusClient:
+    def __init__(self, host: str = BUS_HOST, port: int = BUS_PORT, token_path: str = BUS_TOKEN_FILE,
+                 reconnect_sec: float = 2.0):
+        """
+        订阅端 (Web 大屏等)：后台线程自动重连，并在内存中维护各主题最新状态
+        Subscriber that reconnects in the background and mirrors the latest topic state.
+        """
+        self.address = (host, port)
+        self.token_path = token_path
+        self.reconnect_sec = reconnect_sec
+        self.state = {}
+        self.conn = None
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    @property
+    def connected(self) -> bool:
+        return self.conn is not None
+
+    def _run(self):
+        while True:
+            try:
+                # 每次重连都重新读令牌，守护进程重启后令牌会变 (Token changes whenever the daemon restarts)
+                conn = _connect(self.address, self.token_path)
+            except Exception:
+                time.sleep(self.reconnect_sec)
+                continue
+            self.conn = conn
+            try:
+                while True:
+                    msg = conn.recv()
+                    with self.lock:
+                        if msg[0] == "snapshot":
+                            self.state = msg[1]
+                        elif msg[0] == "pub":
+                            _merge(self.state, msg[1], msg[2])
+                        self.updated_at = time.time()
+            except (EOFError, OSError):
+                pass
+            finally:
+                self.conn = None
+                try:
+                    conn.close()
+                except OSError:
+                    pass
+            time.sleep(self.reconnect_sec)
+
+    def latest(self, topic: str, default=None):
+        with self.lock:
+            return copy.deepcopy(self.state.get(topic, default))
+
+    def publish(self, topic: str, payload) -> bool:
+        """向总线发布一条消息，未连接时返回 False (Returns False while disconnected)"""
+        conn = self.conn
+        if conn is None:
+            return False
+        try:
+            with self.send_lock:
+                conn.send(["pub", topic, payload])
+            return True
+        except (OSError, ValueError, TypeError):
+            return False
+
+def publish_once(topic: str, payload) -> bool:
+    """
+    短连接发布一条消息 (供选股雷达等一次性脚本使用)，总线不在线时静默返回 False
+    Fire-and-forget publish over a short-lived connection; False if the bus is offline.
+    """
+    try:
+        conn = _connect((BUS_HOST, BUS_PORT))
+    except Exception:
+        return False
+    try:
+        conn.recv()  # 丢弃连接时推送的快照 (Discard the connect-time snapshot)
+        conn.send(["pub", topic, payload])
+        return True
+    except (EOFError, OSError, TypeError, ValueError):
+        return False
+    finally:
+        conn.close()
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_broker = None
+_default_broker_guard = threading.Lock()
+
+def get_bus() -> BusBroker:
+    """获取主守护进程内共享的总线服务端 (Get the process-wide bus broker)"""
+    global _default_broker
+    with _default_broker_guard:
+        if _default_broker is None:
+            _default_broker = BusBroker()
+        return _default_broker
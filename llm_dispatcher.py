@@ -0,0 +1,227 @@
+import time
+import random
+import threading
+import collections
+import contextvars
+import email.utils
+import concurrent.futures
+import requests # type: ignore
+from config import (LLM_MIN_IN_FLIGHT, LLM_MAX_IN_FLIGHT, LLM_INITIAL_IN_FLIGHT, LLM_AIMD_DECREASE, # type: ignore
+                    LLM_LATENCY_CEILING_SEC, LLM_BACKOFF_BASE_SEC, LLM_BACKOFF_MAX_SEC,
+                    LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES)
+from sim_clock import get_clock # type: ignore
+from cycle_scheduler import check_deadline, remaining_seconds, DeadlineExceeded # type: ignore
+from debug_sentinel import log_info, log_warn # type: ignore
+
+# ==========================================
+# Phase 39: Adaptive LLM Dispatcher (自适应并发 + 429 退避 + 对冲请求)
+# ==========================================
+# 大模型调用原先并发度写死，失败后立即原地重试，对 429 限流毫无感知。
+# 这里的调度器:
+#   1. AIMD 自适应在途上限: 每次成功加 1/limit (约每轮 +1)，遇到 429 / 超时 / 延迟越过上限时乘以 LLM_AIMD_DECREASE，
+#      且同一拥塞窗口内只减一次，在途上限逼近 API 真实承载能力;
+#   2. 带抖动的指数退避 (full jitter)，优先遵守服务端 Retry-After，且不睡过本轮截止时间;
+#   3. 对冲请求: 某次调用超过近期延迟的 LLM_HEDGE_PERCENTILE 分位仍未返回、且还有空闲名额时，
+#      再发一份相同请求，先返回者胜出，压低长尾延迟。
+# AIMD in-flight limit driven by 429s, timeouts and latency; jittered exponential backoff that
+# honours Retry-After and the cycle deadline; and hedged duplicates once an attempt outlives a
+# latency percentile, sent only when there is spare capacity.
+
+def retry_after_seconds(response) -> float:
+    """解析 Retry-After (秒数或 HTTP 日期)，没有则返回 None (Parse Retry-After: seconds or HTTP date)"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def _is_throttled(error: Exception) -> bool:
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code == 429
+
+def _is_congestion(error: Exception) -> bool:
+    """限流、超时与 5xx 视为拥塞信号 (429, timeouts and 5xx count as congestion)"""
+    if _is_throttled(error) or isinstance(error, requests.exceptions.Timeout):
+        return True
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code >= 500
+
+class AimdLimiter:
+    def __init__(self, min_limit: int = LLM_MIN_IN_FLIGHT, max_limit: int = LLM_MAX_IN_FLIGHT,
+                 initial: int = LLM_INITIAL_IN_FLIGHT, decrease: float = LLM_AIMD_DECREASE):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self._last_decrease = 0.0
+
+    def acquire(self, timeout: float = None) -> bool:
+        """等待一个在途名额，超时返回 False (Wait for an in-flight slot; False on timeout)"""
+        with self.cond:
+            ok = self.cond.wait_for(lambda: self.in_flight < int(self.limit), timeout=timeout)
+            if ok:
+                self.in_flight += 1
+            return ok
+
+    def try_acquire(self) -> bool:
+        """有空闲名额才占用，不等待 (Take a slot only if one is free)"""
+        return self.acquire(timeout=0)
+
+    def release(self, congested: bool = False, latency: float = None):
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if congested:
+                # 一个拥塞窗口 (约一次调用的时长) 内只减一次，避免同一波 429 把上限打到底
+                # Decrease at most once per congestion window so one burst of 429s counts once
+                if now - self._last_decrease >= max(latency or 0.0, 1.0):
+                    self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+class LlmDispatcher:
+    def __init__(self, limiter: AimdLimiter = None, hedge: bool = LLM_HEDGE_ENABLED,
+                 hedge_percentile: float = LLM_HEDGE_PERCENTILE, hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.limiter = limiter or AimdLimiter()
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.limiter.max_limit * 2,
+                                                              thread_name_prefix="llm_dispatch")
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=200)
+        self.calls = 0
+        self.throttled = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _hedge_after(self):
+        """近期成功调用延迟的分位数，样本不足时返回 None (Latency percentile, None until enough samples)"""
+        with self.lock:
+            if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+
+    def _attempt(self, fn, args, kwargs):
+        """执行一次调用并按结果调整在途上限；名额已在提交前占用 (Run once; the slot was taken by the caller)"""
+        started = time.monotonic()
+        congested = False
+        try:
+            result = fn(*args, **kwargs)
+            latency = time.monotonic() - started
+            congested = latency > LLM_LATENCY_CEILING_SEC
+            with self.lock:
+                self.latencies.append(latency)
+            return result
+        except Exception as e:
+            congested = _is_congestion(e)
+            if _is_throttled(e):
+                with self.lock:
+                    self.throttled += 1
+            raise
+        finally:
+            self.limiter.release(congested, time.monotonic() - started)
+
+    def _submit(self, fn, args, kwargs):
+        # 把截止时间等上下文带进工作线程 (Carry the deadline context into the worker thread)
+        ctx = contextvars.copy_context()
+        return self.executor.submit(ctx.run, self._attempt, fn, args, kwargs)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        在自适应在途上限内执行 fn(*args)，必要时发出对冲请求，返回最先成功的结果；全部失败则抛出最后一个异常
+        Run fn within the adaptive in-flight limit, hedging if it runs long; returns the first success.
+        """
+        left = remaining_seconds()
+        if not self.limiter.acquire(timeout=left):
+            raise DeadlineExceeded(f"等待大模型在途名额超过剩余 {max(left or 0.0, 0.0):.1f}s")
+        with self.lock:
+            self.calls += 1
+        futures = [self._submit(fn, args, kwargs)]
+
+        hedge_after = self._hedge_after()
+        if hedge_after is not None:
+            left = remaining_seconds()
+            done, _ = concurrent.futures.wait(futures, timeout=hedge_after if left is None else max(0.0, min(hedge_after, left)))
+            if not done and (left is None or hedge_after < left) and self.limiter.try_acquire():
+                log_info(f"[*] 大模型调用超过 P{int(self.hedge_percentile * 100)} 延迟 {hedge_after:.1f}s，发出对冲请求。")
+                with self.lock:
+                    self.hedged += 1
+                futures.append(self._submit(fn, args, kwargs))
+
+        pending, error = set(futures), None
+        while pending:
+            # 流式读取只有单次读超时，这里用本轮剩余时间兜底；超时的调用留在后台跑完并自行归还名额
+            # The stream only has a per-read timeout, so bound the wait by the cycle deadline; an
+            # abandoned attempt finishes in the background and releases its own slot
+            left = remaining_seconds()
+            done, pending = concurrent.futures.wait(pending, timeout=None if left is None else max(0.0, left),
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"大模型调用在本轮截止时间前未返回 (在途 {len(pending)} 份)")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        with self.lock:
+                            self.hedge_wins += 1
+                    # 落后的一份继续跑完并自行归还名额 (The loser finishes in the background and frees its slot)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def backoff(self, attempt: int, error: Exception = None):
+        """
+        重试前的退避: 遵守 Retry-After，否则 full-jitter 指数退避；睡过截止时间则抛出 DeadlineExceeded
+        Sleep before a retry: Retry-After if given, else full-jitter exponential; never past the deadline.
+        """
+        delay = random.uniform(0.0, min(LLM_BACKOFF_MAX_SEC, LLM_BACKOFF_BASE_SEC * (2 ** (attempt - 1))))
+        hinted = retry_after_seconds(getattr(error, "response", None))
+        if hinted is not None:
+            delay = max(delay, hinted)
+        check_deadline(delay)
+        if delay >= 1.0:
+            log_warn(f"[!] 大模型调用第 {attempt} 次失败，退避 {delay:.1f}s 后重试。")
+        get_clock().sleep(delay)
+
+    def stats(self) -> dict:
+        with self.lock:
+            ordered = sorted(self.latencies)
+            pct = lambda p: round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2) if ordered else None
+            return {
+                "limit": round(self.limiter.limit, 2),
+                "in_flight": self.limiter.in_flight,
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "p50_sec": pct(0.5),
+                "p90_sec": pct(0.9),
+            }
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_dispatcher = None
+_default_dispatcher_guard = threading.Lock()
+
+def get_llm_dispatcher() -> LlmDispatcher:
+    """获取进程级共享的大模型调度器 (Get the process-wide LLM dispatcher)"""
+    global _default_dispatcher
+    with _default_dispatcher_guard:
+        if _default_dispatcher is None:
+            _default_dispatcher = LlmDispatcher()
+        return _default_dispatcher
+
+def report_llm_dispatch_stats():
+    """将自适应并发与对冲统计输出到日志 (Log adaptive-concurrency and hedging stats)"""
+    st = get_llm_dispatcher().stats()
+    log_info(f"[*] 大模型调度: 在途上限 {st['limit']} | 调用 {st['calls']} 次 | 429 {st['throttled']} 次 | "
+             f"对冲 {st['hedged']} 次 (胜出 {st['hedge_wins']}) | P50 {st['p50_sec']}s | P90 {st['p90_sec']}s")
@@ -0,0 +1,170 @@
+import os
+import json
+import math
+import hashlib
+import threading
+from config import (LLM_GATE_ENABLED, LLM_GATE_FILE, LLM_GATE_MAX_AGE_SEC, # type: ignore
+                    LLM_GATE_PRICE_MOVE, LLM_GATE_FEATURE_MOVES)
+from decision_cache import normalize_news # type: ignore
+from sim_clock import get_clock # type: ignore
+from debug_sentinel import log_info, log_error # type: ignore
+
+# ==========================================
+# Phase 40: News-Novelty & Feature-Drift Gate (新闻增量 + 特征漂移触发门)
+# ==========================================
+# 决策缓存只在输入几乎完全相同时命中；而冷门标的每小时的新闻集合往往没有新增，RSI/MACD 也只是小幅波动，
+# 却仍要付一次完整的推理费用。这里改为事件驱动: 每个标的记录上次真正送给大模型时已见过的新闻指纹
+# (个股新闻与宏观电报分栏) 以及当时的行情特征，只有出现新标题、特征漂移超过阈值 (或 MACD 柱翻转)、
+# 或距上次决策超过 LLM_GATE_MAX_AGE_SEC 时才调用大模型，否则沿用上次决策并记录原因。
+# An event-driven trigger: per symbol it keeps the fingerprints of headlines already seen (stock
+# news and the macro feed) and the features last sent to the reasoner. The LLM is only called on
+# a new headline, a configured feature move, a MACD histogram sign flip, or when the last decision
+# is older than LLM_GATE_MAX_AGE_SEC; otherwise the previous decision is reused with a reason.
+#
+# 沿用的 BUY 降级为 HOLD: 上次的买入信号已交给风控/执行处理过，没有新信息时不重复下单。
+# A reused BUY becomes HOLD: that signal was already acted on, and no new information arrived.
+
+REASON_PREFIX = "NO_NEW_INFO"
+
+def headline_fingerprints(intelligence_dict: dict) -> dict:
+    """各栏目新闻的指纹集合 (去空白/标点后哈希) (Per-feed headline fingerprints)"""
+    fingerprints = {}
+    for key, items in normalize_news(intelligence_dict).items():
+        items = items if isinstance(items, list) else [items]
+        fingerprints[key] = sorted({hashlib.sha1(item.encode("utf-8")).hexdigest()[:16] for item in items})
+    return fingerprints
+
+def feature_drift(previous: dict, current: dict) -> str:
+    """
+    返回首个超过阈值的特征漂移描述，均未超过返回空字符串
+    Describe the first feature move past its threshold; empty string if none did.
+    """
+    old_price, new_price = previous.get("current_price"), current.get("current_price")
+    if old_price and new_price and abs(math.log(new_price / old_price)) >= math.log1p(LLM_GATE_PRICE_MOVE):
+        return f"价格 {old_price} -> {new_price}"
+    old_hist, new_hist = previous.get("MACD_HIST"), current.get("MACD_HIST")
+    if old_hist is not None and new_hist is not None and old_hist * new_hist < 0:
+        return f"MACD 柱翻转 {old_hist:.4f} -> {new_hist:.4f}"
+    for key, threshold in LLM_GATE_FEATURE_MOVES.items():
+        old, new = previous.get(key), current.get(key)
+        if old is not None and new is not None and abs(new - old) >= threshold:
+            return f"{key} {old:.2f} -> {new:.2f}"
+    return ""
+
+class LlmGate:
+    def __init__(self, path: str = LLM_GATE_FILE, max_age_sec: float = LLM_GATE_MAX_AGE_SEC, enabled: bool = LLM_GATE_ENABLED):
+        self.path = path
+        self.max_age_sec = max_age_sec
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # symbol -> {"seen": {栏目: [指纹]}, "features": {...}, "decision": {...}, "decided_at": epoch 秒}
+        self._state = {}
+        self.reused = 0
+        self.triggers = {"first": 0, "stale": 0, "news": 0, "drift": 0}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._state = json.load(f)
+            log_info(f"[+] 已恢复 {len(self._state)} 个标的的大模型触发门状态。")
+        except Exception as e:
+            log_error(f"[-] 加载触发门状态失败，从空状态开始: {e}")
+            self._state = {}
+
+    def _save_locked(self):
+        """原子级写入 (Atomic write)"""
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            log_error(f"[-] 保存触发门状态失败: {e}")
+
+    def _trigger(self, entry: dict, market_data: dict, seen: dict):
+        """需要调用大模型时返回 (类别, 描述)，否则返回 None (Why the LLM must be called, or None)"""
+        if entry is None:
+            return "first", "首次决策"
+        age = get_clock().time() - entry["decided_at"]
+        if age >= self.max_age_sec:
+            return "stale", f"上次决策已过去 {age / 60:.0f} 分钟"
+        for key, fingerprints in seen.items():
+            fresh = set(fingerprints) - set(entry["seen"].get(key, []))
+            if fresh:
+                return "news", f"{key} 新增 {len(fresh)} 条"
+        drift = feature_drift(entry["features"], market_data)
+        if drift:
+            return "drift", drift
+        return None
+
+    def check(self, symbol: str, market_data: dict, intelligence_dict: dict):
+        """
+        没有新信息时返回沿用的决策 (副本)，否则返回 None 表示应调用大模型
+        Returns the reused decision (a copy) when nothing new arrived, else None to call the LLM.
+        """
+        if not self.enabled:
+            return None
+        seen = headline_fingerprints(intelligence_dict)
+        with self.lock:
+            entry = self._state.get(symbol)
+            trigger = self._trigger(entry, market_data, seen)
+            if trigger is not None:
+                self.triggers[trigger[0]] += 1
+                if trigger[0] != "first":
+                    log_info(f"[*] {symbol} 触发大模型决策: {trigger[1]}")
+                return None
+            self.reused += 1
+            previous = entry["decision"]
+        age_min = (get_clock().time() - entry["decided_at"]) / 60
+        log_info(f"[+] {symbol} 无新标题且特征漂移未过阈值，沿用 {age_min:.0f} 分钟前的决策: "
+                 f"{previous.get('action')} - {previous.get('reason')}")
+        if previous.get("action") == "BUY":
+            return {"action": "HOLD", "reason": f"{REASON_PREFIX}_BUY_ALREADY_SIGNALLED: {previous.get('reason', '')}"}
+        return {"action": previous.get("action", "HOLD"), "reason": f"{REASON_PREFIX}: {previous.get('reason', '')}"}
+
+    def record(self, symbol: str, market_data: dict, intelligence_dict: dict, decision: dict):
+        """记录一次真实的大模型决策及其输入，作为后续判断的基准 (Remember a real decision and its inputs)"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self._state[symbol] = {
+                "seen": headline_fingerprints(intelligence_dict),
+                "features": dict(market_data),
+                "decision": {"action": decision.get("action"), "reason": decision.get("reason", "")},
+                "decided_at": get_clock().time(),
+            }
+            self._save_locked()
+
+    def stats(self) -> dict:
+        with self.lock:
+            called = sum(self.triggers.values())
+            checks = called + self.reused
+            return {
+                "checks": checks,
+                "reused": self.reused,
+                "reuse_rate": round(self.reused / checks, 3) if checks else None,
+                **self.triggers,
+            }
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_gate = None
+_default_gate_guard = threading.Lock()
+
+def get_llm_gate() -> LlmGate:
+    """获取进程级共享的大模型触发门 (Get the process-wide LLM gate)"""
+    global _default_gate
+    with _default_gate_guard:
+        if _default_gate is None:
+            _default_gate = LlmGate()
+        return _default_gate
+
+def report_llm_gate_stats():
+    """将触发门统计输出到日志 (Log LLM-gate stats)"""
+    st = get_llm_gate().stats()
+    log_info(f"[*] 大模型触发门: 检查 {st['checks']} 次 | 沿用 {st['reused']} 次 (比例 {st['reuse_rate']}) | "
+             f"首次 {st['first']} | 超时刷新 {st['stale']} | 新标题 {st['news']} | 特征漂移 {st['drift']}")
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import datetime
+from config import DEEPSEEK_STREAM_DRAIN_MAX_BYTES # type: ignore
+from debug_sentinel import log_debug, log_error # type: ignore
+
+# ==========================================
+# Phase 38: Streaming LLM Reply Parser (流式回复 + 提前截取 JSON 决策)
+# ==========================================
+# 推理模型先输出很长的思考过程 (reasoning_content 或 <think>...</think>)，最后才给出决策 JSON。
+# 原先要等整段回复下载完再用正则剥离思考块。这里以 SSE 流式读取: 思考内容边到边丢弃 (可选写入旁路日志)，
+# 正文逐字做括号/字符串状态机匹配，第一个完整且可解析的 JSON 值一出现就返回并关闭连接。
+# 内存占用只与决策 JSON 大小相关，与思考长度无关。
+# Reads the reply as server-sent events, discarding reasoning tokens as they arrive (optionally
+# teeing them to a side log) and returning the first complete, parseable JSON value in the
+# answer. Memory no longer grows with the reasoning length.
+#
+# 中途关闭流式响应会连带关闭连接池里的套接字。拿到决策后先读完剩余的短尾巴 (到 [DONE] 与流结束，
+# 有字节上限)，连接即可回池复用；只有出错或超过上限时才关闭套接字。
+# Closing a stream midway closes the pooled socket, so after the decision the short remainder is
+# drained (up to a byte cap) and the connection goes back to the pool; it is only closed on error
+# or when the cap is hit.
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """text 末尾与 tag 前缀重合的最长长度，用于跨分片识别标签 (Longest suffix of text that starts tag)"""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+class JsonStreamExtractor:
+    def __init__(self, openers: str = "{", on_reasoning=None):
+        """
+        :param openers: 允许作为决策起点的字符，单标的为 "{"，批量为 "[{" (Characters that may open the decision)
+        :param on_reasoning: 收到 <think> 内文本时的回调 (Called with text inside <think> blocks)
+        """
+        self.openers = openers
+        self.on_reasoning = on_reasoning
+        self.dropped = 0          # 已丢弃的思考字符数 (Reasoning characters discarded)
+        self._pending = ""        # 跨分片的半个标签 (A tag split across chunks)
+        self._in_think = False
+        self._buf = []            # 当前候选 JSON 的字符 (Characters of the current JSON candidate)
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+
+    def discard(self, text: str):
+        """丢弃一段思考内容 (可选转交旁路日志) (Drop reasoning text, teeing it to the side log if any)"""
+        self.dropped += len(text)
+        if text and self.on_reasoning is not None:
+            self.on_reasoning(text)
+
+    def feed(self, text: str):
+        """
+        喂入一段正文，得到完整且合法的 JSON 值时返回它，否则返回 None
+        Feed a chunk of answer text; returns the parsed value once a complete JSON value is seen.
+        """
+        data = self._pending + text
+        self._pending = ""
+        i, n = 0, len(data)
+        while i < n:
+            if self._in_think:
+                end = data.find(THINK_CLOSE, i)
+                if end < 0:
+                    keep = _partial_suffix(data[i:], THINK_CLOSE)
+                    self.discard(data[i:n - keep])
+                    self._pending = data[n - keep:] if keep else ""
+                    return None
+                self.discard(data[i:end])
+                self._in_think = False
+                i = end + len(THINK_CLOSE)
+                continue
+
+            ch = data[i]
+            if self._depth == 0:
+                # JSON 之外: 跳过说明文字与 markdown 围栏，识别思考块起点 (Outside JSON: skip prose, spot <think>)
+                if ch == "<":
+                    head = data[i:i + len(THINK_OPEN)]
+                    if head == THINK_OPEN:
+                        self._in_think = True
+                        i += len(THINK_OPEN)
+                        continue
+                    if i + len(head) == n and THINK_OPEN.startswith(head):
+                        self._pending = head
+                        return None
+                elif ch in self.openers:
+                    self._buf = [ch]
+                    self._depth = 1
+                i += 1
+                continue
+
+            self._buf.append(ch)
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate, self._buf = "".join(self._buf), []
+                    try:
+                        return json.loads(candidate)
+                    except json.JSONDecodeError:
+                        pass  # 括号配平但不是合法 JSON，继续往后找 (Balanced but invalid; keep scanning)
+            i += 1
+        return None
+
+def _sse_lines(response):
+    response.encoding = "utf-8"
+    return response.iter_lines(decode_unicode=True)
+
+def _parse_sse(lines):
+    """从行迭代器中解析 SSE 事件，读到 [DONE] 即停，剩余行留在迭代器中 (Stops at [DONE], leaving the rest)"""
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
+        choices = json.loads(data).get("choices") or [{}]
+        delta = choices[0].get("delta") or {}
+        yield delta.get("reasoning_content") or "", delta.get("content") or ""
+
+def iter_sse_deltas(response):
+    """
+    逐条解析 OpenAI 兼容的 SSE 流，产出 (思考增量, 正文增量) (Yield (reasoning, content) deltas)
+    """
+    return _parse_sse(_sse_lines(response))
+
+class ReasoningLog:
+    """
+    思考过程旁路日志：每次调用写入独立文件，边到边写，不在内存中累积
+    Side log for reasoning text: one file per call, written as it streams, never held in memory.
+    """
+    def __init__(self, log_dir: str, label: str):
+        now = datetime.datetime.now()
+        day_dir = os.path.join(log_dir, now.strftime("%Y%m%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        self.path = os.path.join(day_dir, f"{now.strftime('%H%M%S_%f')}_{label}.txt")
+        self.file = open(self.path, "w", encoding="utf-8")
+
+    def write(self, text: str):
+        self.file.write(text)
+
+    def close(self):
+        self.file.close()
+
+def _drain(lines, max_bytes: int) -> bool:
+    """
+    用同一个行迭代器读完决策之后的剩余回复 (含 [DONE] 之后到流结束)，读完返回 True，超过 max_bytes 返回 False。
+    必须沿用同一个迭代器读到结束，urllib3 才会在分块流正常收尾后把连接放回池中。
+    Read the remainder through the same line iterator until the body ends (True) or max_bytes
+    is exceeded (False). Only a chunked stream finished through its own reader is returned to the pool.
+    """
+    budget = max_bytes
+    for line in lines:
+        budget -= len(line.encode("utf-8")) + 1
+        if budget < 0:
+            return False
+    return True
+
+def stream_decision(response, openers: str = "{", reasoning_log_dir: str = "", label: str = "",
+                    drain_max_bytes: int = DEEPSEEK_STREAM_DRAIN_MAX_BYTES):
+    """
+    从流式响应中提前截取决策 JSON，流结束仍无完整 JSON 时抛出 JSONDecodeError。
+    拿到决策后读完剩余尾巴以复用连接，尾巴超过 drain_max_bytes 时直接关闭
+    Return the first complete JSON value from a streaming reply; raises JSONDecodeError if the stream
+    ends without one. The remainder is drained for connection reuse, or the socket closed past the cap.
+    """
+    side_log = None
+    if reasoning_log_dir:
+        try:
+            side_log = ReasoningLog(reasoning_log_dir, label or "decision")
+        except OSError as e:
+            log_error(f"[-] 无法创建思考过程日志: {e}")
+    extractor = JsonStreamExtractor(openers, on_reasoning=side_log.write if side_log else None)
+    started = time.perf_counter()
+    lines = _sse_lines(response)
+    try:
+        for reasoning, content in _parse_sse(lines):
+            if reasoning:
+                extractor.discard(reasoning)
+            if content:
+                value = extractor.feed(content)
+                if value is not None:
+                    log_debug(f"[*] {label} 流式决策 {(time.perf_counter() - started) * 1000:.0f}ms 内截取完成，"
+                              f"丢弃思考 {extractor.dropped} 字")
+                    try:
+                        if not _drain(lines, drain_max_bytes):
+                            log_debug(f"[*] {label} 决策后的剩余回复超过 {drain_max_bytes} 字节，关闭连接。")
+                    except Exception as e:
+                        # 决策已经拿到，尾巴读取失败只影响连接复用 (The decision is in hand; only reuse is lost)
+                        log_debug(f"[*] {label} 读取剩余回复失败，关闭连接: {e}")
+                    return value
+    finally:
+        # 已读完的响应关闭时不会动到已回池的连接；未读完 (出错/超限) 时关闭套接字
+        # A drained response no longer owns the pooled connection; otherwise the socket is closed
+        response.close()
+        if side_log is not None:
+            side_log.close()
+    raise json.JSONDecodeError("流式回复结束仍未得到完整 JSON 决策", "", 0)
@@ -1,221 +1,307 @@
 import time
 import schedule # type: ignore
+import threading
 from threading import Thread
-import datetime
 import subprocess
-import concurrent.futures
 import json
 import os
-import pytz # type: ignore
 from debug_sentinel import log_info, log_error, log_warn # type: ignore
 
 # 引入我们打磨好的所有模块并屏蔽 IDE 环境尚未识别到的本地包爆红 (Suppress IDE import false-alarms)
-from config import setup_global_proxy  # type: ignore
+from config import setup_global_proxy, REALTIME_CACHE_SNAPSHOT_SEC, BAR_AGG_RECONCILE_TIME, TICK_JOURNAL_FULL_MARKET  # type: ignore
+from rate_limiter import limited_call, report_rate_limit_stats  # type: ignore
+from decision_cache import report_decision_cache_stats  # type: ignore
+from llm_gate import report_llm_gate_stats  # type: ignore
+from sentiment_scorer import report_triage_stats  # type: ignore
+from http_client import report_http_stats  # type: ignore
+from llm_dispatcher import report_llm_dispatch_stats  # type: ignore
 import akshare as ak # type: ignore
-from data_harvester import TARGET_POOL, fetch_and_clean_kline_data, fetch_multi_dim_intelligence  # type: ignore
-from deepseek_brain import ask_deepseek  # type: ignore
+from data_harvester import TARGET_POOL, fetch_kline_snapshot_local, fetch_multi_dim_intelligence, reconcile_local_bars  # type: ignore
 from execution_risk import LocalRiskController  # type: ignore
 from monitor_hud import CyberpunkRadarHUD, send_mobile_notification  # type: ignore
+from market_hours import is_trading_time, hk_now  # type: ignore
+from sim_clock import get_clock  # type: ignore
+from bar_aggregator import get_bar_aggregator  # type: ignore
+from snapshot_engine import SpotSnapshotEngine, market_frame  # type: ignore
+from tick_journal import get_tick_journal  # type: ignore
+from ipc_bus import get_bus, TOPIC_TICK, TOPIC_POSITIONS, TOPIC_WATCHLIST, TOPIC_METRICS  # type: ignore
+from tick_pacer import TickPacer  # type: ignore
+from cycle_scheduler import CycleScheduler  # type: ignore
+from ai_pipeline import DecisionPipeline, build_features, pre_trade_guard, consult_llm, apply_risk, execute_decision  # type: ignore
 
 # ==========================================
 # Phase 7: Main Daemon (总线调度器)
 # ==========================================
 
-def is_trading_time() -> bool:
-    """精准判断港股交易时间段 (强制锁定东八区时区，防止海外运行时区错乱) [Phase 19 Fix 1]"""
-    hk_tz = pytz.timezone('Asia/Hong_Kong')
-    now = datetime.datetime.now(hk_tz)
-    if now.weekday() >= 5: return False  # 周末不交易
-    current_time = now.time()
-    return (datetime.time(9, 30) <= current_time <= datetime.time(12, 0)) or \
-           (datetime.time(13, 0) <= current_time <= datetime.time(16, 0))
+WATCHLIST_FILE = "watchlist.json"
+# 上次读取时 watchlist.json 的修改时间 (mtime of watchlist.json when last read)
+_watchlist_mtime = None
+_watchlist_lock = threading.Lock()
+
+def _load_watchlist_file():
+    """读取 watchlist.json，不存在或损坏时返回 None (None when missing or unreadable)"""
+    if os.path.exists(WATCHLIST_FILE):
+        try:
+            with open(WATCHLIST_FILE, "r", encoding="utf-8") as f:
+                watchlist = json.load(f)
+                if isinstance(watchlist, list):
+                    return watchlist
+        except Exception:
+            pass
+    return None
+
+def read_watchlist() -> list:
+    """
+    自选股名单：优先取消息总线上的最新编辑，总线不在线时读取 watchlist.json 兜底。
+    文件被修改 (手工编辑、大屏离线、选股雷达推送失败) 时重新读取并发布到总线，文件与总线以较新者为准。
+    Latest watchlist from the IPC bus, falling back to watchlist.json when the bus is down.
+    A changed file (by mtime) is re-read and republished, so the newer of file and bus wins.
+    """
+    global _watchlist_mtime
+    bus = get_bus()
+    if bus.online:
+        with _watchlist_lock:
+            mtime = os.path.getmtime(WATCHLIST_FILE) if os.path.exists(WATCHLIST_FILE) else None
+            if mtime != _watchlist_mtime:
+                _watchlist_mtime = mtime
+                watchlist = _load_watchlist_file()
+                if watchlist is not None and watchlist != bus.latest(TOPIC_WATCHLIST):
+                    log_info(f"[*] 检测到 {WATCHLIST_FILE} 变更，重新发布自选股: {watchlist}")
+                    bus.publish(TOPIC_WATCHLIST, watchlist)
+        watchlist = bus.latest(TOPIC_WATCHLIST)
+        if watchlist is not None:
+            return list(watchlist)
+    return _load_watchlist_file() or []
+
+def write_realtime_cache(quotes: dict):
+    """将行情原子写入 realtime_cache.json (总线不可用时大屏的兜底快照)"""
+    tmp_cache = "realtime_cache.json.tmp"
+    with open(tmp_cache, "w", encoding="utf-8") as f:
+        json.dump(quotes, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_cache, "realtime_cache.json")
 
 def single_target_cycle(symbol: str, risk_sys: LocalRiskController, hud: CyberpunkRadarHUD):
-    """单只股票的 [感知 -> 思考 -> 风控执行] 完整生命周期"""
+    """
+    单只股票的 [感知 -> 思考 -> 风控执行] 完整生命周期 (顺序执行版，供单标的调试/回放)
+    定时全盘扫描走 ai_pipeline 常驻流水线，两者复用同一组阶段函数。
+    Sequential single-symbol cycle; scheduled scans use the pipeline with the same stage functions.
+    """
     hud.update_status(symbol, "SCANNING...")
     
-    # 1. 并发启动感知层获取 K线数据 和 新闻情绪数据 (Parallelized network fetching to halve latency)
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        kline_future = executor.submit(fetch_and_clean_kline_data, symbol, "60")
-        intell_future = executor.submit(fetch_multi_dim_intelligence, symbol)
-        
-        df = kline_future.result()
-        intelligence_dict = intell_future.result()
-        
-    if df is None or df.empty: # type: ignore
+    # 1. 感知层: 本地合成 K 线的流式指标快照 + 多维情报 (Local-bar indicator snapshot + intelligence)
+    snapshot = fetch_kline_snapshot_local(symbol, "60")
+    if not snapshot:
         return
-    
-    # 向 IDE 声明 df 此时绝对不为 None，消除报警
-    assert df is not None 
-
-    current_price = float(df.iloc[-1]['收盘']) # type: ignore
-    current_rsi = float(df.iloc[-1]['RSI_14']) # type: ignore
-    macd_hist = float(df.iloc[-1]['MACD_HIST']) # type: ignore
+    intelligence_dict = fetch_multi_dim_intelligence(symbol)
+    market_data_snapshot = build_features(snapshot)
     
     # 2. 风控前置：检查是否触发割肉/止盈警报
-    if risk_sys.monitor_dynamic_stop_loss(symbol, current_price):
-        hud.update_status(symbol, "SELL_ALL")
-        send_mobile_notification(symbol, "SELL_ALL", f"触发本地风控止损/止盈防线！现价: {current_price}")
-        risk_sys.mock_sell_all(symbol)
-        
-        # 如果从深层拷贝中读写字典
+    if pre_trade_guard(symbol, market_data_snapshot, risk_sys, hud):
         return
 
-    # 从并发获取的结果中提取数据
-    market_data_snapshot = {
-        "current_price": current_price,
-        "RSI_14": current_rsi,
-        "MACD_HIST": macd_hist
-    }
-
     # 3. 呼叫 DeepSeek 决策大脑
-    # 为了防止网络抖动，计算时间较长
-    start_time = time.time()
-    ai_decision = ask_deepseek(symbol, market_data_snapshot, intelligence_dict)
-    latency_ms = int((time.time() - start_time) * 1000)
-    hud.update_network_latency(latency_ms)
+    ai_decision = consult_llm(symbol, market_data_snapshot, intelligence_dict, hud)
 
     # 4. 执行层：本地双重副驾驶审核
-    final_decision = risk_sys.dual_copilot_interceptor(symbol, ai_decision, current_price, current_rsi)
-    action = final_decision["action"]
+    final_decision = apply_risk(symbol, ai_decision, market_data_snapshot, risk_sys)
     
-    # 5. 更新 UI 与手机推送
-    hud.update_status(symbol, action)
-    if action == "BUY":
-        vol = final_decision.get("suggested_volume", 0)
-        risk_sys.mock_buy(symbol, current_price, vol)
-        send_mobile_notification(symbol, f"BUY ({vol}股)", final_decision.get("reason", ""))
-    elif action == "SELL":
-        risk_sys.mock_sell_all(symbol)
-        send_mobile_notification(symbol, "SELL", final_decision.get("reason", ""))
+    # 5. 更新 UI、总线广播与手机推送
+    execute_decision(symbol, final_decision, market_data_snapshot, risk_sys, hud)
 
-def fast_tick_monitor(hud: CyberpunkRadarHUD, risk_sys: LocalRiskController):
+def fetch_spot_snapshot():
+    """东财全市场实时快照 (极速轻量接口)，出网受令牌桶限速 (Rate-limited full-market spot snapshot)"""
+    return limited_call("eastmoney", ak.stock_hk_spot_em)
+
+class TickMonitor:
     """
-    高频价格雷达 (Fast Tick Radar)
-    每 10 秒扫描一次白名单标的，越过大模型直接触发本地硬风控防线。
-    将拉取结果写入 realtime_cache.json 供前端零延迟读取。
+    高频雷达的单轮状态机：每次 step() 处理一个快照 (拉取/对齐/合成 K 线/止损/推送)，返回下一轮间隔。
+    实盘由 fast_tick_monitor 按时钟循环驱动，回放由 replay.py 注入快照源逐轮驱动。
+    One fast-tick round per step(); driven by fast_tick_monitor live and by replay.py offline.
+    :param spot_fn: 快照数据源 (Spot snapshot source), 缺省拉取东财
+    :param watchlist_fn: 自选股名单来源 (Watchlist source)
+    :param journal: 行情日志，None 表示不记录 (Tick journal; None disables recording)
+    :param write_cache: 是否落盘 realtime_cache.json (Whether to write the fallback cache file)
+    :param notify_fn: 手机推送，回放时注入空函数 (Phone push; replay injects a no-op)
     """
-    targets_for_hud = TARGET_POOL[:4] # 严格限制最多观测 4 支
-    hud.register_symbols(targets_for_hud) # 初始化 UI 槽位
-
-    while True:
-        # [Phase 19 Fix 4] 实盘防线已恢复：非交易时间进入休眠，防止当 API 请求背山
-        if not is_trading_time():
-            time.sleep(60)
-            continue
+    def __init__(self, hud: CyberpunkRadarHUD, risk_sys: LocalRiskController, spot_fn=fetch_spot_snapshot,
+                 watchlist_fn=read_watchlist, aggregator=None, journal=None, write_cache: bool = True,
+                 notify_fn=send_mobile_notification):
+        self.hud = hud
+        self.risk_sys = risk_sys
+        self.spot_fn = spot_fn
+        self.watchlist_fn = watchlist_fn
+        self.notify_fn = notify_fn
+        self.targets_for_hud = TARGET_POOL[:4] # 严格限制最多观测 4 支
+        self.hud.register_symbols(self.targets_for_hud) # 初始化 UI 槽位
+        self.snapshot_engine = SpotSnapshotEngine()
+        self.bus = get_bus()
+        self.last_watched = set()
+        self.cache_dirty = False
+        self.last_cache_write = 0.0
+        self.pacer = TickPacer()
+        self.aggregator = aggregator or get_bar_aggregator()
+        self.journal = journal
+        self.write_cache = write_cache
+        self.interval = self.pacer.max_interval
 
+    def step(self) -> float:
+        """处理一轮快照并返回下一轮间隔 (秒) (Process one snapshot; returns the next interval)"""
+        clock = get_clock()
+        risk_sys = self.risk_sys
         try:
-            # 读取前端自定义的 watchlist
-            watchlist = []
-            if os.path.exists("watchlist.json"):
-                try:
-                    with open("watchlist.json", "r", encoding="utf-8") as f:
-                        watchlist = json.load(f)
-                except Exception:
-                    pass
-            
-            # 合并所有需要监控的标的 (去重)
-            all_targets = list(set(TARGET_POOL + watchlist))
-            
-            # 获取东财全市场实时快照 (极速轻量接口)
-            spot_df = ak.stock_hk_spot_em()
-            spot_df['代码'] = spot_df['代码'].astype(str)
+            # 读取前端自定义的 watchlist (总线优先，文件兜底)
+            watchlist = self.watchlist_fn()
             
             # [Phase 19 Fix 2] 将深拷贝提到循环外，每个 tick 只获取一次全局快照而不是 N 次
             safe_positions = risk_sys.get_positions_copy()
             
-            cache_data = {}
-            for symbol in all_targets:
-                clean_sym = symbol.replace(".HK", "")
-                match = spot_df[spot_df['代码'] == clean_sym]
+            # 合并所有需要监控的标的 (去重)；持仓即使已移出自选股也必须继续盯止损
+            # Held symbols stay monitored for stops even after leaving the watchlist
+            all_targets = list(set(TARGET_POOL + watchlist) | set(safe_positions))
+            
+            # 获取全市场实时快照
+            fetch_start = clock.time()
+            spot_df = self.spot_fn()
+            fetch_ms = (clock.time() - fetch_start) * 1000
+            
+            # 快照按代码索引一次、与监控名单一次性对齐，只拿到价格发生变化的标的 (Changed quotes only)
+            events = self.snapshot_engine.update(spot_df, all_targets)
+            watched = self.snapshot_engine.watched()
+            
+            # 快照流在本地合成 1/5/15/60 分钟 K 线，AI 决策轮因此无需再拉分时 K 线
+            # Feed every quote into the local bar aggregator so the AI cycle needs no kline fetch
+            tick_time = hk_now().replace(tzinfo=None)
+            for sym, row in self.snapshot_engine.latest().iterrows():
+                self.aggregator.ingest(sym, tick_time, row["price"], row.get("volume"))
+            
+            # 每轮快照追加进压缩列式日志，供回放与延迟取证 (Append the snapshot to the tick journal)
+            if self.journal is not None:
+                frame = market_frame(spot_df) if TICK_JOURNAL_FULL_MARKET else self.snapshot_engine.latest()
+                self.journal.record(fetch_start, frame.index, frame["price"], frame["pct"], frame.get("volume", float("nan")), fetch_ms)
+            
+            for event in events:
+                symbol = event["symbol"]
+                current_price = event["price"]
+                pct_change = event["pct"]
                 
-                if not match.empty:
-                    current_price = float(match.iloc[0]['最新价'])
-                    pct_change = float(match.iloc[0]['涨跌幅'])
+                # 如果是前4大核心标的，刷新桌面雷达 UI
+                if symbol in self.targets_for_hud:
+                    self.hud.update_tick(symbol, current_price, pct_change)
                     
-                    # 保存到缓存结构中供 Web UI 读取
-                    cache_data[symbol] = {"price": current_price, "pct": pct_change}
-                    
-                    # 如果是前4大核心标的，刷新桌面雷达 UI 和风控心跳
-                    if symbol in targets_for_hud:
-                        hud.update_tick(symbol, current_price, pct_change)
-                        
-                        # 直接使用循环外的 safe_positions 快照进行判断
-                        if symbol in safe_positions:
-                            if risk_sys.monitor_dynamic_stop_loss(symbol, current_price):
-                                hud.update_status(symbol, "SELL_ALL")
-                                send_mobile_notification(symbol, "SELL_ALL", f"急速雷达极速防线触发！现价: {current_price}")
-                                risk_sys.mock_sell_all(symbol)  # 本地落盘清仓
-                                
-            # 将多维度行情原子写入到本地缓存文件 
-            tmp_cache = "realtime_cache.json.tmp"
-            with open(tmp_cache, "w", encoding="utf-8") as f:
-                json.dump(cache_data, f, ensure_ascii=False)
-                f.flush()
-                os.fsync(f.fileno())
-            os.replace(tmp_cache, "realtime_cache.json")
+                # 每个持仓都做 tick 级止损检查，不限于 HUD 槽位 (Stop check for every held symbol, not just HUD slots)
+                # 直接使用循环外的 safe_positions 快照进行判断
+                if symbol in safe_positions:
+                    if risk_sys.monitor_dynamic_stop_loss(symbol, current_price):
+                        self.hud.update_status(symbol, "SELL_ALL")
+                        self.notify_fn(symbol, "SELL_ALL", f"急速雷达极速防线触发！现价: {current_price}")
+                        risk_sys.mock_sell_all(symbol)  # 本地落盘清仓
+                            
+            # 变化的报价即时推送到消息总线，大屏毫秒级刷新 (Push changed quotes to the bus)
+            if events:
+                self.bus.publish(TOPIC_TICK, {e["symbol"]: {"price": e["price"], "pct": e["pct"]} for e in events})
+            
+            # realtime_cache.json 降级为兜底快照：总线在线时低频落盘，离线时每次变化都落盘
+            # The cache file is only a fallback: written rarely while the bus is up
+            if events or watched != self.last_watched:
+                self.cache_dirty = True
+                self.last_watched = watched
+            
+            # 按持仓距止损/止盈触发价的远近决定下一轮间隔，并作为指标推送到总线
+            # Pick the next interval from stop proximity and export it as a metric
+            quotes = self.snapshot_engine.quotes()
+            distances = {sym: risk_sys.stop_distance(sym, quotes[sym]["price"]) for sym in safe_positions if sym in quotes}
+            self.interval = self.pacer.next_interval(distances)
+            self.bus.publish(TOPIC_METRICS, self.pacer.metrics())
+            
+            snapshot_due = not self.bus.online or clock.time() - self.last_cache_write >= REALTIME_CACHE_SNAPSHOT_SEC
+            if self.write_cache and self.cache_dirty and snapshot_due:
+                write_realtime_cache(quotes)
+                self.cache_dirty = False
+                self.last_cache_write = clock.time()
             
         except Exception as e:
             # 不死鸟机制：捕获网络抖动，防止监控主线程崩溃
             log_error(f"[-] 高频雷达网络抖动拦截成功: {e}")
-            
-        time.sleep(10) # 10 秒轮询一次，保护 IP 且满足实盘监控需求
+        return self.interval
 
-# 维护全局 ThreadPool 对象以便优雅退出
-global_executor = None
+def fast_tick_monitor(hud: CyberpunkRadarHUD, risk_sys: LocalRiskController):
+    """
+    高频价格雷达 (Fast Tick Radar)
+    按持仓距止损防线的远近自适应轮询白名单标的 (2~15 秒)，越过大模型直接触发本地硬风控防线。
+    将拉取结果写入 realtime_cache.json 供前端零延迟读取。
+    """
+    monitor = TickMonitor(hud, risk_sys, journal=get_tick_journal())
+    clock = get_clock()
 
-def run_schedule_loop(hud: CyberpunkRadarHUD, risk_sys: LocalRiskController):
-    """后台定时任务慢速 AI 思考循环"""
-    global global_executor
-    
-    def job():
-        # 【脱离沙盘 1】恢复交易时间锁 (Trading Hours Guard - Production)
-        if not is_trading_time(): 
-            log_info(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] 当前非交易时间，全盘扫描进入休眠。")
-            return
+    while True:
+        # [Phase 19 Fix 4] 实盘防线已恢复：非交易时间进入休眠，防止当 API 请求背山
+        if not is_trading_time():
+            clock.sleep(60)
+            continue
+
+        interval = monitor.step()
+        clock.sleep(interval) # 自适应节拍，下限受东财配额约束以保护 IP (Adaptive, floored by the quota share)
 
-        # 【脱离沙盘 2】动态构建真实猎杀名单合并硬编码与 Web UI 传入的动态标的
-        active_targets = list(TARGET_POOL)
-        if os.path.exists("watchlist.json"):
-            try:
-                with open("watchlist.json", "r", encoding="utf-8") as f:
-                    user_watchlist = json.load(f)
-                    if isinstance(user_watchlist, list):
-                        active_targets.extend(user_watchlist)
-            except Exception:
-                pass
-        # 去重，防止重复扫描
-        active_targets = list(set(active_targets))
+# 紧贴 AkShare 60 分钟 K 线的收线时间进行触发，留出 2 分钟让数据落位
+# Follow the 60-min K-line close time with a 2-min buffer for data arrival.
+AI_TRADE_TIMES = ["10:32", "11:32", "14:02", "15:02", "15:55"]
+
+def run_ai_cycle(pipeline: DecisionPipeline, scheduler: CycleScheduler, risk_sys: LocalRiskController,
+                 watchlist_fn=read_watchlist) -> dict:
+    """
+    一轮全盘 AI 决策 (定时任务主体)，返回 {标的: 最终动作}；非交易时间返回 None
+    One scheduled AI decision cycle; returns {symbol: outcome}, or None outside trading hours.
+    """
+    # 【脱离沙盘 1】恢复交易时间锁 (Trading Hours Guard - Production)
+    if not is_trading_time(): 
+        log_info(f"[{hk_now().strftime('%H:%M:%S')}] 当前非交易时间，全盘扫描进入休眠。")
+        return None
 
-        log_info(f"\n[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] >>> 开启全盘并发扫描 (总索敌数量: {len(active_targets)}) <<<")
+    # 【脱离沙盘 2】动态构建真实猎杀名单合并硬编码与 Web UI 传入的动态标的
+    active_targets = list(TARGET_POOL)
+    active_targets.extend(watchlist_fn())
+    # 去重并排优先级: 持仓 > 上轮顺延 > 按得分排序的自选股 (Dedupe and order by priority)
+    active_targets, deadline = scheduler.plan(active_targets, risk_sys.get_positions_copy())
 
-        # ThreadPool 并发管理 (根据建议调整为保守策略)
-        max_workers = 2  # 保持并发数量防止 API 并发超限
+    log_info(f"\n[{hk_now().strftime('%Y-%m-%d %H:%M:%S')}] >>> 开启全盘并发扫描 (总索敌数量: {len(active_targets)}) <<<")
 
-        global global_executor
-        global_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    # 常驻分级流水线: 采集 / 大模型 / 执行 各阶段按自身并发度重叠推进，出网节奏仍由令牌桶控制
+    # The long-lived staged pipeline overlaps fetch, LLM and execution; buckets still set the pace
+    results = pipeline.run_cycle(active_targets, deadline=deadline)
+    log_info(f"[*] 本轮决策结果: {results}")
+    scheduler.record(results)
 
-        with global_executor as executor:
-            # [Phase 19 Fix 3] 让 AI 真正分析所有自定义标的，并暴露线程内部的隐藏异常
-            fut_map = {executor.submit(single_target_cycle, symbol, risk_sys, hud): symbol  # type: ignore
-                       for symbol in active_targets}
-            for future in concurrent.futures.as_completed(fut_map):
-                try:
-                    future.result()  # 激发并捕获子线程内部的隐藏异常
-                except Exception as e:
-                    log_error(f"[-] AI 思考舱处理标的 {fut_map[future]} 时发生崩溃: {e}")
+    report_rate_limit_stats()
+    report_triage_stats()
+    report_llm_gate_stats()
+    report_decision_cache_stats()
+    report_http_stats()
+    report_llm_dispatch_stats()
+    log_info("[+] 本轮全盘并发扫描已结束，系统进入休眠等待下一班车。")
+    return results
 
-        log_info("[+] 本轮全盘并发扫描已结束，系统进入休眠等待下一班车。")
+# 维护全局决策流水线对象以便优雅退出 (Kept global for graceful shutdown)
+ai_pipeline = None
 
+def run_schedule_loop(hud: CyberpunkRadarHUD, risk_sys: LocalRiskController):
+    """后台定时任务慢速 AI 思考循环"""
+    global ai_pipeline
+    ai_pipeline = DecisionPipeline(risk_sys, hud).start()
+    scheduler = CycleScheduler()
+    
+    def job():
+        run_ai_cycle(ai_pipeline, scheduler, risk_sys)
 
     # 摒弃简单的轮询，改为硬编码的精准定时触发 (Precision Market Scheduling)
-    # 紧贴 AkShare 60 分钟 K 线的收线时间进行触发，留出 2 分钟让数据落位
-    # Follow the 60-min K-line close time with a 2-min buffer for data arrival.
-    trade_times = ["10:32", "11:32", "14:02", "15:02", "15:55"]
-    for t in trade_times:
+    for t in AI_TRADE_TIMES:
         schedule.every().day.at(t).do(job)
         print(f"[*] 已设定定时扫描任务: {t}")
     
+    # 收盘后与东财 K 线对账本地合成结果 (Reconcile the locally built bars after the close)
+    schedule.every().day.at(BAR_AGG_RECONCILE_TIME).do(reconcile_local_bars)
+    
     # 启动时立刻强行跑一次，用于测试连通性
     job() 
     
@@ -245,6 +331,13 @@ if __name__ == "__main__":
     hud = CyberpunkRadarHUD(max_slots=4)
     risk_sys = LocalRiskController(initial_capital=100000.0)
     
+    # 启动本地消息总线：行情/持仓/决策/自选股改为推送，JSON 文件只作兜底快照
+    bus = get_bus()
+    if bus.start():
+        bus.publish(TOPIC_POSITIONS, risk_sys.get_positions_copy())
+        bus.publish(TOPIC_WATCHLIST, read_watchlist())
+        risk_sys.add_listener(lambda positions: bus.publish(TOPIC_POSITIONS, positions))
+    
     # 包装全局退出逻辑
     try:
         # 线程 1: 启动高频急速监控雷达 (负责 10 秒级看盘与保命止损)
@@ -263,9 +356,11 @@ if __name__ == "__main__":
         log_warn("\n[!] 收到外界中断指令 (KeyboardInterrupt)！系统正在执行优雅退出流水线...")
     finally:
         # 优雅退出流：等待所有在途的订单和落盘逻辑执行完毕
-        if global_executor is not None:
-            log_info("[*] 正在关闭底层 ThreadPoolExecutor，等待所有任务排空...")
-            global_executor.shutdown(wait=True)
+        if ai_pipeline is not None:
+            log_info("[*] 正在关闭 AI 决策流水线，等待所有在途标的排空...")
+            ai_pipeline.stop()
+        
+        get_tick_journal().close()
         
         log_info("[*] 正在最后一次安全核对内存状态与硬盘状态...")
         risk_sys.save_positions()
@@ -0,0 +1,93 @@
+import datetime
+import pytz # type: ignore
+from sim_clock import get_clock # type: ignore
+
+# ==========================================
+# Phase 26: HK Market Hours (港股交易时段)
+# ==========================================
+# 交易时段判断的唯一出处，主守护进程与选股雷达共用 (Single source of HK session rules)
+
+HK_TZ = pytz.timezone('Asia/Hong_Kong')
+
+# 港股连续交易时段: 早市 09:30-12:00, 午市 13:00-16:00 (中间为午休)
+# HK continuous trading sessions (lunch break in between)
+HK_SESSIONS = [
+    (datetime.time(9, 30), datetime.time(12, 0)),
+    (datetime.time(13, 0), datetime.time(16, 0)),
+]
+
+def hk_now() -> datetime.datetime:
+    """当前东八区 (香港) 时间，回放时取模拟时钟 (Current Hong Kong time; simulated during replay)"""
+    return get_clock().now().astimezone(HK_TZ)
+
+def is_trading_time(now: datetime.datetime = None) -> bool:
+    """精准判断港股交易时间段 (强制锁定东八区时区，防止海外运行时区错乱) [Phase 19 Fix 1]"""
+    now = now or hk_now()
+    if now.weekday() >= 5: return False  # 周末不交易
+    current_time = now.time()
+    return any(start <= current_time <= end for start, end in HK_SESSIONS)
+
+# 港股 60 分钟 K 线收线时刻 (早市最后半根在 12:00 收线) (Hourly bar closes; the morning stub closes at 12:00)
+HK_HOURLY_BAR_CLOSES = [
+    datetime.time(10, 30),
+    datetime.time(11, 30),
+    datetime.time(12, 0),
+    datetime.time(14, 0),
+    datetime.time(15, 0),
+    datetime.time(16, 0),
+]
+
+def next_bar_close(now: datetime.datetime = None) -> datetime.datetime:
+    """
+    严格晚于 now 的下一根 60 分钟 K 线收线时间；当日已收市则顺延到下一个工作日首根
+    The next hourly bar close strictly after `now`, rolling over to the next weekday.
+    """
+    now = (now or hk_now()).astimezone(HK_TZ)
+    day = now.date()
+    while True:
+        if day.weekday() < 5:
+            for close in HK_HOURLY_BAR_CLOSES:
+                candidate = HK_TZ.localize(datetime.datetime.combine(day, close))
+                if candidate > now:
+                    return candidate
+        day += datetime.timedelta(days=1)
+
+def bar_end(ts: datetime.datetime, minutes: int):
+    """
+    时间点所属 N 分钟 K 线的收线时间 (与东财一致按收线时刻标记)，非交易时段返回 None。
+    每个交易时段从开盘起独立切分，最后一根在时段收盘处截断 (如 60 分钟线的 11:30-12:00)。
+    Close time labelling the N-minute bar that contains `ts` (None outside sessions). Buckets
+    restart at each session open and the last one is cut at the session close.
+    接受带时区或不带时区 (视为香港本地时间) 的 datetime，返回值与输入一致。
+    """
+    local = ts.astimezone(HK_TZ).replace(tzinfo=None) if ts.tzinfo is not None else ts
+    for start, end in HK_SESSIONS:
+        open_dt = datetime.datetime.combine(local.date(), start)
+        close_dt = datetime.datetime.combine(local.date(), end)
+        if open_dt <= local <= close_dt:
+            offset_min = (local - open_dt).total_seconds() / 60
+            buckets = max(1, -(-offset_min // minutes))
+            label = min(open_dt + datetime.timedelta(minutes=minutes * buckets), close_dt)
+            return HK_TZ.localize(label) if ts.tzinfo is not None else label
+    return None
+
+def next_bar_end(label: datetime.datetime, minutes: int) -> datetime.datetime:
+    """
+    紧随 label 之后的一根 N 分钟 K 线收线时间，跨午休与周末 (不含公众假期)
+    The bar close following `label`, across the lunch break and weekends (holidays unknown).
+    label 须为不带时区的香港本地时间 (Naive HK local time, like vendor bar timestamps).
+    """
+    day = label.date()
+    for start, end in HK_SESSIONS:
+        open_dt = datetime.datetime.combine(day, start)
+        close_dt = datetime.datetime.combine(day, end)
+        if open_dt <= label < close_dt:
+            return bar_end(label + datetime.timedelta(seconds=1), minutes)
+    # label 位于时段收盘或时段之外：取下一个时段的第一根 (At/after a session close: first bar of the next session)
+    probe = label
+    while True:
+        for start, _ in HK_SESSIONS:
+            open_dt = datetime.datetime.combine(probe.date(), start)
+            if open_dt > label and probe.weekday() < 5:
+                return bar_end(open_dt, minutes)
+        probe = datetime.datetime.combine(probe.date() + datetime.timedelta(days=1), datetime.time(0, 0))
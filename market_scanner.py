@@ -3,24 +3,30 @@ import pandas as pd # type: ignore
 import datetime
 import time
 import os
+import random
+import concurrent.futures
 import json
-import matplotlib.pyplot as plt # type: ignore
-import matplotlib.colors as mcolors # type: ignore
+import multiprocessing
 from tqdm import tqdm # type: ignore
+from config import SCANNER_TOP_N, SCANNER_MAX_WORKERS, SCANNER_FUNNEL_TIERS, SCANNER_SNAPSHOT_WEIGHTS, SCANNER_INTRADAY_INTERVAL_MIN, CHART_FORMAT, CHART_DPI # type: ignore
+from config import SCANNER_RETRY_BACKOFF_BASE_SEC, SCANNER_RETRY_BACKOFF_MAX_SEC # type: ignore
+from market_hours import hk_now, is_trading_time # type: ignore
+from bar_store import get_bar_store # type: ignore
+from rate_limiter import limited_call, report_rate_limit_stats # type: ignore
+import indicators # type: ignore
+from scan_checkpoint import ScanCheckpoint, DONE_STATUSES, STATUS_OK, STATUS_SUSPENDED, STATUS_INSUFFICIENT, STATUS_FAILED # type: ignore
+from ipc_bus import publish_once, TOPIC_WATCHLIST # type: ignore
 # from config import setup_global_proxy # type: ignore  # 调试阶段注释掉代理，防止报错
 
 # ==========================================
 # 量化选股雷达: 7日动量与异动扫描系统 (Phase 17)
 # ==========================================
 
-# 设置中文字体，防止图表乱码 (Windows常用SimHei，Mac常用Arial Unicode MS)
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS']
-plt.rcParams['axes.unicode_minus'] = False
-
-def get_top_liquid_stocks(top_n=100) -> pd.DataFrame:
-    """第一层漏斗：获取全市场成交额最大的 Top N 港股，剔除老千股"""
-    print("[*] 正在拉取全市场快照，进行流动性初筛...")
-    df_spot = ak.stock_hk_spot_em()
+def get_top_liquid_stocks(top_n=100, df_spot: pd.DataFrame = None) -> pd.DataFrame:
+    """第一层漏斗：获取全市场成交额最大的 Top N 港股，剔除老千股 (可复用已拉取的快照)"""
+    if df_spot is None:
+        print("[*] 正在拉取全市场快照，进行流动性初筛...")
+        df_spot = limited_call("eastmoney", ak.stock_hk_spot_em)
     
     # 调优一：流动性漏斗的“仙股”漏洞
     # 确保数据格式正确，剔除没有成交额的死水股，并且价格必须大于等于 1.0 港币
@@ -28,16 +34,34 @@ def get_top_liquid_stocks(top_n=100) -> pd.DataFrame:
     df_spot = df_spot.sort_values(by='成交额', ascending=False).head(top_n)
     return df_spot[['代码', '名称', '最新价', '成交额']]
 
-def calculate_stock_indicators(symbol: str, retries=3):
-    """第二层漏斗：拉取个股日线，计算 7 日看好指标，带有API熔断保护"""
+# 是否启用全市场分级漏斗模式 (命令行 --funnel 开启)
+SCANNER_USE_FUNNEL = False
+# 断点续扫 (--resume) 与失败定向重试 (--retry-failed)
+SCANNER_RESUME = False
+SCANNER_RETRY_FAILED = False
+
+# 面板计算只截取最近 60 根日线 (留足 RSI 预热空间，同时覆盖 7 日动量与 10 日量比窗口)
+SCAN_PANEL_BARS = 60
+
+def fetch_scan_history_with_status(symbol: str, retries=3, offline: bool = False):
+    """
+    第二层漏斗 (上半段)：拉取个股日线并剔除停牌股/次新股，带有API熔断保护
+    返回 (日线 DataFrame 或 None, 扫描状态, 原因)，从而区分 "停牌" 与 "拉取失败"。
+    offline=True 时只读本地 K 线仓库 (断点续扫复用当日已同步的数据)，本地缺失时再触网。
+    Returns (df or None, status, reason) so a suspended stock is distinguishable from a
+    failed fetch. offline=True reads the local bar store only, falling back to the network.
+    """
+    last_error = ""
     for attempt in range(retries):
         try:
-            # 调优二：拉取过去 60 天的日线前复权数据（留足计算 RSI 的预热空间）
-            df = ak.stock_hk_hist(symbol=symbol, period="daily", adjust="qfq")
+            # 调优二：经由本地 K 线仓库增量同步日线前复权数据（只拉取最新几根，留足计算 RSI 的预热空间）
+            df = get_bar_store().load(symbol, "daily") if offline else None
+            if df is None:
+                df = get_bar_store().sync(symbol, "daily")
             
             # 调优一：停牌股与次新股物理隔离
             if df is None or len(df) < 30:
-                return None
+                return None, STATUS_INSUFFICIENT, f"日线仅 {0 if df is None else len(df)} 根 (<30)"
                 
             df['日期'] = pd.to_datetime(df['日期'])
             df.set_index('日期', inplace=True)
@@ -46,69 +70,139 @@ def calculate_stock_indicators(symbol: str, retries=3):
             last_date = df.index[-1]
             if (datetime.datetime.now() - last_date).days > 5:
                 # 容忍周末加上一点假期的天数，超过5天没交易则认为停牌
-                return None
-            
-            # 1. 计算 7 日累计涨幅 (7-Day Momentum)
-            # 取最近的一天和 7 个交易日之前的那天
-            close_now = df['收盘'].iloc[-1]
-            close_7d_ago = df['收盘'].iloc[-8]
-            momentum_7d = ((close_now - close_7d_ago) / close_7d_ago) * 100
-            
-            # 2. 计算 RSI_14 (使用 60 天预热，确保极其平滑)
-            delta = df['收盘'].diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=14).mean() # 真正的金融系统一般用 EMA，这里用 rolling mean 简化，但 60 天依然能过滤噪音
-            loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-            rs = gain / loss
-            rsi_14 = 100 - (100 / (1 + rs))
-            current_rsi = rsi_14.iloc[-1]
-            
-            # 3. 计算放量比例 (近期3天均量 / 前7天均量)
-            vol_recent_3d = df['成交量'].iloc[-3:].mean()
-            vol_prev_7d = df['成交量'].iloc[-10:-3].mean()
-            volume_ratio = vol_recent_3d / vol_prev_7d if vol_prev_7d > 0 else 1.0
-
-            return {
-                "7日涨幅(%)": round(momentum_7d, 2),
-                "RSI_14": round(current_rsi, 2),
-                "放量比": round(volume_ratio, 2)
-            }
+                return None, STATUS_SUSPENDED, f"最后交易日 {last_date.date()}"
+            return df, STATUS_OK, ""
         except Exception as e:
-            # 调优二：API 熔断与动态退避
-            if attempt < retries - 1:
-                time.sleep(3) # 强制休眠退避
-            else:
-                return None
-
-def run_scanner():
-    """执行全盘扫描"""
-    # 1. 获取流动性 Top 100
-    liquid_stocks = get_top_liquid_stocks(100)
+            # 调优二：API 熔断重试。令牌桶只控制请求速率，不会因端点报错/限流而退让，
+            # 重试之间仍需带抖动的指数退避 (full jitter)
+            # The token bucket only paces requests; back off from a failing endpoint with full jitter
+            last_error = f"{type(e).__name__}: {e}"
+            if attempt + 1 < retries:
+                time.sleep(random.uniform(0.0, min(SCANNER_RETRY_BACKOFF_MAX_SEC, SCANNER_RETRY_BACKOFF_BASE_SEC * (2 ** attempt))))
+    return None, STATUS_FAILED, last_error
+
+def fetch_scan_history(symbol: str, retries=3):
+    """第二层漏斗 (上半段) 的便捷入口，只返回日线 DataFrame 或 None"""
+    df, _, _ = fetch_scan_history_with_status(symbol, retries)
+    return df
+
+def compute_scan_indicators(histories: dict) -> dict:
+    """
+    第二层漏斗 (下半段)：对所有标的一次性向量化计算 7 日看好指标
+    Compute momentum / RSI_14 / volume ratio for every symbol in one vectorized panel pass.
+    :param histories: {代码: 日线 DataFrame}
+    :return: {代码: 指标字典}
+    """
+    symbols = list(histories.keys())
+    if not symbols:
+        return {}
+    close = indicators.stack_right_aligned([histories[s]['收盘'] for s in symbols], SCAN_PANEL_BARS)
+    volume = indicators.stack_right_aligned([histories[s]['成交量'] for s in symbols], SCAN_PANEL_BARS)
     
-    results = []
-    print(f"[*] 开始对 Top 100 活跃港股进行 60日深度数据溯源与计算...")
+    # 1. 7 日累计涨幅 (7-Day Momentum)：最近一天对比 7 个交易日之前
+    momentum_7d = indicators.momentum(close, lookback=7)[:, -1]
+    # 2. RSI_14 (使用 60 天预热，确保极其平滑)
+    rsi_14 = indicators.rsi_simple(close)[:, -1]
+    # 3. 放量比例 (近期3天均量 / 前7天均量)
+    volume_ratio = indicators.volume_ratio(volume, recent=3, prior=7)[:, -1]
     
-    # 使用 tqdm 显示进度条
-    for index, row in tqdm(liquid_stocks.iterrows(), total=len(liquid_stocks)):
-        symbol = str(row['代码'])
-        name = str(row['名称'])
+    return {
+        sym: {
+            "7日涨幅(%)": round(float(momentum_7d[i]), 2),
+            "RSI_14": round(float(rsi_14[i]), 2),
+            "放量比": round(float(volume_ratio[i]), 2)
+        }
+        for i, sym in enumerate(symbols)
+    }
+
+def calculate_stock_indicators(symbol: str, retries=3):
+    """第二层漏斗：拉取个股日线，计算 7 日看好指标 (单标的便捷入口)"""
+    df = fetch_scan_history(symbol, retries)
+    if df is None:
+        return None
+    return compute_scan_indicators({symbol: df}).get(symbol)
+
+def _score_candidate(symbol: str, name: str, price, metrics):
+    """第三层漏斗：过滤并打分，未通过返回 None (Filter and score one candidate)"""
+    if not metrics:
+        return None
+    # 第三层漏斗：过滤掉 RSI 严重超买 (>75) 或者处于严重下跌趋势 (<0 放量下跌) 的股票
+    if not (metrics["RSI_14"] < 75 and metrics["RSI_14"] > 0):
+        return None
+    # 调优一：量纲归一化
+    score = (metrics["7日涨幅(%)"] * 1.0) + (metrics["放量比"] * 5.0)
+    res = {
+        "代码": symbol,
+        "名称": name,
+        "最新价": price,
+        "综合看好得分": round(score, 2)
+    }
+    res.update(metrics)
+    return res
+
+def _fetch_histories(candidates, max_workers: int, time_budget_sec: float = None,
+                     checkpoint: ScanCheckpoint = None, resume: bool = False) -> list:
+    """
+    有界线程池并发拉取日线，结果按候选排名顺序返回 (未完成/失败的位置为 None)。
+    给定 time_budget_sec 时，超出预算仍未开始的任务直接取消，已在途的任务结果被丢弃。
+    给定 checkpoint 时每只标的处理完立即落盘；resume=True 时跳过当日已完成的标的
+    (已成功的直接读本地 K 线仓库，不再触网)。
+    Fetch histories with a bounded pool; results keep candidate order. With a time budget,
+    queued work past the deadline is cancelled. Each result is checkpointed; with resume,
+    symbols already done today are skipped (successful ones are re-read from the local store).
+    """
+    done = {}
+    if checkpoint is not None and resume:
+        done = {sym: entry["status"] for sym, entry in checkpoint.load().items() if entry["status"] in DONE_STATUSES}
+        print(f"[*] 断点续扫: 当日已完成 {len(done)} 只，本次跳过。")
+
+    def scan_one(symbol: str, name: str, price):
+        if done.get(symbol) == STATUS_OK:
+            df, _, _ = fetch_scan_history_with_status(symbol, offline=True)
+            return df
+        df, status, reason = fetch_scan_history_with_status(symbol)
+        if checkpoint is not None:
+            checkpoint.record(symbol, name, price, status, reason)
+        return df
+
+    histories_by_rank = [None] * len(candidates)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        fut_map = {executor.submit(scan_one, symbol, name, price): rank
+                   for rank, (symbol, name, price) in enumerate(candidates)
+                   if done.get(symbol) in (None, STATUS_OK)}
+        # 使用 tqdm 显示完成进度 (Progress over completion order)
+        with tqdm(total=len(fut_map)) as bar:
+            try:
+                for future in concurrent.futures.as_completed(fut_map, timeout=time_budget_sec):
+                    rank = fut_map[future]
+                    try:
+                        histories_by_rank[rank] = future.result()
+                    except Exception as e:
+                        print(f"[-] {candidates[rank][0]} 日线拉取异常: {e}")
+                    bar.update(1)
+            except concurrent.futures.TimeoutError:
+                unfinished = sum(1 for f in fut_map if not f.done())
+                print(f"[!] 深度扫描超出时间预算 {time_budget_sec}s，放弃剩余 {unfinished} 只标的。")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if checkpoint is not None:
+        checkpoint.report()
+    return histories_by_rank
+
+def _rank_candidates(candidates, histories_by_rank, keep: int) -> pd.DataFrame:
+    """所有存活标的一次性向量化计算指标，第三层漏斗打分后取前 keep 名"""
+    histories = {candidates[rank][0]: df for rank, df in enumerate(histories_by_rank) if df is not None}
+    metrics_by_symbol = compute_scan_indicators(histories)
+
+    results = []
+    for symbol, name, price in candidates:
+        res = _score_candidate(symbol, name, price, metrics_by_symbol.get(symbol))
+        if res is not None:
+            results.append(res)
         
-        indicators = calculate_stock_indicators(symbol)
-        if indicators:
-            # 第三层漏斗：过滤掉 RSI 严重超买 (>75) 或者处于严重下跌趋势 (<0 放量下跌) 的股票
-            if indicators["RSI_14"] < 75 and indicators["RSI_14"] > 0: 
-                # 调优一：量纲归一化
-                score = (indicators["7日涨幅(%)"] * 1.0) + (indicators["放量比"] * 5.0)
-                res = {
-                    "代码": symbol,
-                    "名称": name,
-                    "最新价": row['最新价'],
-                    "综合看好得分": round(score, 2)
-                }
-                res.update(indicators)
-                results.append(res)
-                
-        # 保护 API，防止封禁
-        time.sleep(0.3)
+    # 出网节奏已由限速层统一控制，此处输出排队统计 (Pacing is done by the rate limiter)
+    report_rate_limit_stats()
         
     # 转换为 DataFrame
     df_results = pd.DataFrame(results)
@@ -116,13 +210,112 @@ def run_scanner():
     if df_results.empty:
         return df_results
         
-    # 提取 Top 20
-    df_top20 = df_results.sort_values(by="综合看好得分", ascending=False).head(20)
-    return df_top20
+    # 提取 Top N (稳定排序：同分按候选排名先后)
+    return df_results.sort_values(by="综合看好得分", ascending=False, kind="mergesort").head(keep)
 
-def plot_top_20(df_top20):
-    """绘制 Top 20 潜力股指标图"""
+def run_scanner(top_n: int = SCANNER_TOP_N, max_workers: int = SCANNER_MAX_WORKERS, resume: bool = False):
+    """
+    执行全盘扫描 (有界线程池并发拉取 + 一次向量化面板计算)
+    并发只决定可重叠的在途请求数，真正的出网节奏仍由东财令牌桶控制；
+    结果按流动性排名原顺序收集，再做稳定排序，保证同分时输出确定。
+    Concurrent history fetch with a bounded pool, then one vectorized indicator pass.
+    The eastmoney token bucket still paces requests; results are collected in
+    liquidity-rank order and stably sorted, so output is deterministic.
+    """
+    # 1. 获取流动性 Top N
+    liquid_stocks = get_top_liquid_stocks(top_n)
+    candidates = [(str(row['代码']), str(row['名称']), row['最新价']) for _, row in liquid_stocks.iterrows()]
+    
+    print(f"[*] 开始对 Top {len(candidates)} 活跃港股进行 60日深度数据溯源与计算 (并发线程: {max_workers})...")
+    histories_by_rank = _fetch_histories(candidates, max_workers, checkpoint=ScanCheckpoint(), resume=resume)
+    return _rank_candidates(candidates, histories_by_rank, keep=20)
+
+def rank_spot_universe(df_spot: pd.DataFrame) -> pd.DataFrame:
+    """
+    漏斗第一级：只用全市场快照里现成的列 (涨跌幅 / 成交额 / 振幅) 在内存中给全部港股打分排序，
+    不产生任何历史 K 线请求。各维度先转为百分位排名再按 SCANNER_SNAPSHOT_WEIGHTS 加权。
+    Tier one: rank the whole HK market in memory using snapshot columns only (no history
+    fetches). Each factor is turned into a percentile rank and weighted.
+    """
+    df = df_spot.copy()
+    for col in ['最新价', '涨跌幅', '成交额', '最高', '最低', '昨收']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    # 与流动性漏斗同样的仙股/死水股防线 (Same penny-stock and zero-turnover guard)
+    df = df[(df['成交额'] > 0) & (df['最新价'] >= 1.0)].copy()
+    df['振幅'] = (df['最高'] - df['最低']) / df['昨收'] * 100
+    
+    df['快照得分'] = 0.0
+    for col, weight in SCANNER_SNAPSHOT_WEIGHTS.items():
+        df['快照得分'] += df[col].rank(pct=True).fillna(0.0) * weight
+    return df.sort_values(by=['快照得分', '成交额'], ascending=False, kind="mergesort")
+
+def run_funnel_scanner(tiers=SCANNER_FUNNEL_TIERS, max_workers: int = SCANNER_MAX_WORKERS, resume: bool = False):
+    """
+    全市场分级漏斗扫描 (Full-universe tiered funnel)
+    第一级: 全市场快照内存排序，保留 tiers[0]["keep"] 只；
+    第二级: 只有这些幸存者才支付历史 K 线拉取成本，在 tiers[1]["time_budget_sec"] 内完成深度打分，
+            最终保留 tiers[1]["keep"] 只。
+    Tier one ranks every HK stock from the spot snapshot; only its survivors pay for
+    history fetches in tier two, which runs under its own time budget.
+    """
+    snapshot_tier, history_tier = tiers[0], tiers[-1]
+    tier_start = time.time()
+    print("[*] 漏斗第一级: 拉取全市场快照并在内存中排序...")
+    df_spot = limited_call("eastmoney", ak.stock_hk_spot_em)
+    ranked = rank_spot_universe(df_spot)
+    shortlist = ranked.head(snapshot_tier["keep"])
+    elapsed = time.time() - tier_start
+    print(f"[+] 第一级完成: 全市场 {len(ranked)} 只 -> 保留 {len(shortlist)} 只 (耗时 {elapsed:.1f}s)")
+    if elapsed > snapshot_tier["time_budget_sec"]:
+        print(f"[!] 第一级耗时超出预算 {snapshot_tier['time_budget_sec']}s，请检查快照接口延迟。")
+
+    candidates = [(str(row['代码']), str(row['名称']), row['最新价']) for _, row in shortlist.iterrows()]
+    print(f"[*] 漏斗第二级: 对 {len(candidates)} 只幸存者进行 60日深度计算 (预算 {history_tier['time_budget_sec']}s, 并发线程: {max_workers})...")
+    histories_by_rank = _fetch_histories(candidates, max_workers, time_budget_sec=history_tier["time_budget_sec"],
+                                         checkpoint=ScanCheckpoint(), resume=resume)
+    return _rank_candidates(candidates, histories_by_rank, keep=history_tier["keep"])
+
+def run_failed_retry(max_workers: int = SCANNER_MAX_WORKERS):
+    """
+    定向重试当日断点中失败的标的，并结合当日已成功的标的 (读本地仓库) 重新出榜
+    Targeted pass: retry today's failed symbols only, then re-rank with today's successes.
+    """
+    checkpoint = ScanCheckpoint()
+    records = checkpoint.load()
+    failed = checkpoint.failed_entries()
+    print(f"[*] 定向重试: 当日断点共 {len(records)} 只，其中失败 {len(failed)} 只。")
+    for sym, entry in failed.items():
+        print(f"    - {sym} {entry['name']}: {entry['reason']}")
+    candidates = [(sym, entry["name"], entry["price"]) for sym, entry in records.items()]
+    histories_by_rank = _fetch_histories(candidates, max_workers, checkpoint=checkpoint, resume=True)
+    return _rank_candidates(candidates, histories_by_rank, keep=20)
+
+def run_configured_scan():
+    """按当前配置选择扫描模式 (Dispatch to the configured scan mode)"""
+    if SCANNER_RETRY_FAILED:
+        return run_failed_retry(SCANNER_MAX_WORKERS)
+    if SCANNER_USE_FUNNEL:
+        return run_funnel_scanner(SCANNER_FUNNEL_TIERS, SCANNER_MAX_WORKERS, resume=SCANNER_RESUME)
+    return run_scanner(SCANNER_TOP_N, SCANNER_MAX_WORKERS, resume=SCANNER_RESUME)
+
+def plot_top_20(df_top20, chart_format: str = CHART_FORMAT, dpi: int = CHART_DPI):
+    """
+    绘制 Top 20 潜力股指标图 (matplotlib 仅在真正需要出图时才延迟导入)
+    Render the Top 20 chart; matplotlib is imported lazily, only when a chart is requested.
+    :param chart_format: "png" / "svg" / "none"
+    """
+    if chart_format == "none":
+        return
     print("[*] 正在生成 Top 20 分析图表...")
+
+    import matplotlib # type: ignore
+    matplotlib.use("Agg") # 无界面后端，适配后台进程与无人值守运行 (Headless backend)
+    import matplotlib.pyplot as plt # type: ignore
+    import matplotlib.colors as mcolors # type: ignore
+
+    # 设置中文字体，防止图表乱码 (Windows常用SimHei，Mac常用Arial Unicode MS)
+    plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS']
+    plt.rcParams['axes.unicode_minus'] = False
     
     # 倒序排列以便在水平柱状图中得分高的在最上面
     df_plot = df_top20.sort_values(by="综合看好得分", ascending=True).copy()
@@ -148,16 +341,31 @@ def plot_top_20(df_top20):
     ax.set_xlabel('综合看好得分 (Momentum & Volume Score)', fontsize=12)
     ax.grid(axis='x', linestyle='--', alpha=0.7)
     
-    # 紧凑布局并保存
+    # 紧凑布局并保存 (SVG 为矢量图，dpi 只影响 PNG)
     plt.tight_layout()
-    save_path = "top20_promising_stocks.png"
-    plt.savefig(save_path, dpi=300, bbox_inches='tight')
+    save_path = f"top20_promising_stocks.{chart_format}"
+    plt.savefig(save_path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
     print(f"[+] 图表已成功保存至当前目录: {save_path}")
-    
-    # 将 Top 20 数据导出为 CSV 备查
+
+def export_top20_csv(df_top20):
+    """将 Top 20 数据导出为 CSV 备查 (轻量，同步执行)"""
     df_top20.to_csv("top20_promising_stocks.csv", index=False, encoding="utf-8-sig")
     print(f"[+] 数据表已成功导出为: top20_promising_stocks.csv")
 
+def render_chart_in_background(df_top20, chart_format: str = CHART_FORMAT, dpi: int = CHART_DPI):
+    """
+    在独立子进程中出图，调用方 (watchlist 注入) 不再被 matplotlib 渲染阻塞。
+    返回子进程对象以便需要时 join；chart_format 为 "none" 时不启动进程并返回 None。
+    Render the chart in a separate worker process so the watchlist hand-off is never
+    blocked by matplotlib. Returns the process (or None when charts are disabled).
+    """
+    if chart_format == "none":
+        return None
+    proc = multiprocessing.Process(target=plot_top_20, args=(df_top20, chart_format, dpi), name="top20-chart")
+    proc.start()
+    return proc
+
 def atomic_inject_watchlist(df_top20):
     """调优三：IPC 通信的原子化写入"""
     top5_symbols = df_top20.head(5)['代码'].tolist()
@@ -174,35 +382,162 @@ def atomic_inject_watchlist(df_top20):
             os.fsync(f.fileno())
         os.replace(tmp_file, tgt_file)
         print(f"[+] 已经成功以原子化方式将 Top 5 猎物灌入系统后台白名单箱 ({tgt_file})！")
+        # 主守护进程在线时经消息总线即时生效，文件留作兜底 (Bus push when the daemon is up)
+        if publish_once(TOPIC_WATCHLIST, formatted_symbols):
+            print("[+] 白名单已同步推送至主守护进程消息总线。")
     except Exception as e:
         print(f"[-] 写入 watchlist 失败: {e}")
 
+def build_intraday_history(symbol: str, spot_row):
+    """
+    盘中合成日线：本地仓库已缓存的日线 (不触网) + 由实时快照合成的 "今日" K 线。
+    今日成交量为截至当前的累计值，放量比在盘中会系统性偏低，只用于相对排名。
+    Cached daily bars (no network) plus a synthetic "today" bar built from the spot row.
+    Today's volume is partial, so the volume ratio reads low intraday; it is only used to rank.
+    """
+    cached = get_bar_store().load(symbol, "daily")
+    if cached is None or len(cached) < 30:
+        return None
+    today = pd.Timestamp(hk_now().date())
+    today_bar = {
+        "日期": today,
+        "开盘": float(spot_row['今开']),
+        "收盘": float(spot_row['最新价']),
+        "最高": float(spot_row['最高']),
+        "最低": float(spot_row['最低']),
+        "成交量": float(spot_row['成交量']),
+    }
+    cached = cached[cached['日期'] < today]
+    df = pd.concat([cached, pd.DataFrame([today_bar])], ignore_index=True)
+    df.set_index('日期', inplace=True)
+    return df
+
+def run_intraday_rescan(top_n: int = SCANNER_TOP_N) -> pd.DataFrame:
+    """
+    盘中增量重排：整轮只消耗 1 次全市场快照请求，不拉任何历史 K 线。
+    只有本地仓库已有日线缓存的标的 (通常来自收盘后的全量扫描) 才参与排名。
+    Intraday re-rank costing one snapshot call and zero history calls. Only symbols with
+    cached daily history (usually from the post-close scan) take part.
+    """
+    df_spot = limited_call("eastmoney", ak.stock_hk_spot_em)
+    df_spot['代码'] = df_spot['代码'].astype(str)
+    liquid = get_top_liquid_stocks(top_n, df_spot=df_spot)
+    spot_by_code = df_spot.set_index('代码')
+
+    candidates, histories_by_rank = [], []
+    for _, row in liquid.iterrows():
+        symbol = str(row['代码'])
+        history = build_intraday_history(symbol, spot_by_code.loc[symbol])
+        if history is None:
+            continue
+        candidates.append((symbol, str(row['名称']), row['最新价']))
+        histories_by_rank.append(history)
+    print(f"[*] 盘中重排: 流动性 Top {len(liquid)} 中 {len(candidates)} 只具备本地日线缓存。")
+    return _rank_candidates(candidates, histories_by_rank, keep=20)
+
+def _read_watchlist() -> list:
+    """读取当前 watchlist.json (Read the current watchlist)"""
+    try:
+        with open("watchlist.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return []
+
+def intraday_rescan_loop(interval_min: int = SCANNER_INTRADAY_INTERVAL_MIN):
+    """
+    盘中每 N 分钟重排一次，仅当 Top 5 发生变化时才原子化写入 watchlist.json
+    Re-rank every N minutes during the session; write watchlist.json only when the Top 5 changes.
+    """
+    print(f"[*] 盘中增量重排模式启动: 每 {interval_min} 分钟一次 (仅交易时段)。Press Ctrl+C to exit.")
+    while True:
+        if is_trading_time():
+            try:
+                top20_data = run_intraday_rescan(SCANNER_TOP_N)
+                if not top20_data.empty:
+                    new_top5 = [sym + ".HK" for sym in top20_data.head(5)['代码'].tolist()]
+                    current = _read_watchlist()
+                    if new_top5 != current:
+                        print(f"[+] 盘中排名变化: {current} -> {new_top5}")
+                        atomic_inject_watchlist(top20_data)
+                    else:
+                        print("[*] 盘中排名无变化，watchlist.json 保持不动。")
+            except Exception as e:
+                print(f"[-] 盘中重排失败: {e}")
+        time.sleep(interval_min * 60)
+
+# 上一次定时扫描的出图子进程，下一轮开始前回收并检查退出码 (Chart process from the previous scheduled run)
+_last_chart_proc = None
+
+def _reap_chart_process():
+    """回收上一轮的出图子进程，避免僵尸进程并暴露渲染失败 (Join the previous chart process and report failures)"""
+    global _last_chart_proc
+    proc, _last_chart_proc = _last_chart_proc, None
+    if proc is None:
+        return
+    proc.join()
+    if proc.exitcode != 0:
+        print(f"[-] 上一轮 Top 20 出图子进程异常退出 (exitcode={proc.exitcode})")
+
 def scheduled_job():
     """Unattended scheduled execution (no interactive prompts)"""
+    global _last_chart_proc
+    _reap_chart_process()
     ts = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     print(f"\n[{ts}] Timed trigger! Running post-close stock screener...")
-    top20_data = run_scanner()
+    top20_data = run_configured_scan()
     if not top20_data.empty:
         print(top20_data[['\u540d\u79f0', '\u4ee3\u7801', '7\u65e5\u6da8\u5e45(%)', 'RSI_14', '\u653e\u91cf\u6bd4', '\u7efc\u5408\u770b\u597d\u5f97\u5206']].head(5))
-        plot_top_20(top20_data)
-        atomic_inject_watchlist(top20_data)  # auto-inject, no prompt
+        atomic_inject_watchlist(top20_data)  # auto-inject first, no prompt
+        export_top20_csv(top20_data)
+        _last_chart_proc = render_chart_in_background(top20_data, CHART_FORMAT, CHART_DPI)  # off the critical path
         print("[+] Scheduled scan done. Top 5 auto-injected into watchlist.json.")
     else:
         print("[-] No qualifying stocks found. Market may be closed or network error.")
 
+def _read_int_flag(argv, flag: str, default: int) -> int:
+    """读取形如 `--workers 8` 的整数命令行参数 (Parse an integer CLI flag)"""
+    if flag in argv:
+        pos = argv.index(flag)
+        if pos + 1 < len(argv):
+            try:
+                return int(argv[pos + 1])
+            except ValueError:
+                print(f"[!] 参数 {flag} 需要整数，已回退默认值 {default}")
+    return default
+
 if __name__ == "__main__":
     import sys
     is_schedule_mode = "--schedule" in sys.argv
+    # 并发扫描参数: --top N (流动性 Top N), --workers N (并发线程数)
+    SCANNER_TOP_N = _read_int_flag(sys.argv, "--top", SCANNER_TOP_N)
+    SCANNER_MAX_WORKERS = _read_int_flag(sys.argv, "--workers", SCANNER_MAX_WORKERS)
+    # --funnel: 全市场分级漏斗模式 (先快照排序全部港股，再只对幸存者拉历史)
+    SCANNER_USE_FUNNEL = "--funnel" in sys.argv
+    # --resume: 跳过当日断点中已完成的标的; --retry-failed: 只重试当日失败的标的
+    SCANNER_RESUME = "--resume" in sys.argv
+    SCANNER_RETRY_FAILED = "--retry-failed" in sys.argv
+    # --intraday N: 盘中每 N 分钟用实时快照 + 本地日线缓存增量重排
+    is_intraday_mode = "--intraday" in sys.argv
+    SCANNER_INTRADAY_INTERVAL_MIN = _read_int_flag(sys.argv, "--intraday", SCANNER_INTRADAY_INTERVAL_MIN)
+    # --chart png|svg|none: 图表输出格式 (none 时完全不加载 matplotlib)
+    if "--chart" in sys.argv and sys.argv.index("--chart") + 1 < len(sys.argv):
+        CHART_FORMAT = sys.argv[sys.argv.index("--chart") + 1]
 
     print("="*60)
     print("DeepSeek Quant Market Scanner")
-    if is_schedule_mode:
+    if is_intraday_mode:
+        print(f"Mode: Intraday Incremental Re-rank  (every {SCANNER_INTRADAY_INTERVAL_MIN} min, 1 snapshot call per pass)")
+    elif is_schedule_mode:
         print("Mode: Daily Timed Daemon  (auto-scan every weekday at 16:18)")
     else:
         print("Mode: Single-Shot Interactive Scan")
+    if SCANNER_USE_FUNNEL:
+        print("Universe: Full-market tiered funnel (spot snapshot -> history deep scan)")
     print("="*60)
 
-    if is_schedule_mode:
+    if is_intraday_mode:
+        intraday_rescan_loop(SCANNER_INTRADAY_INTERVAL_MIN)
+    elif is_schedule_mode:
         import schedule as _sch  # type: ignore
         SCAN_TIME = "16:18"
         for _day in [_sch.every().monday, _sch.every().tuesday, _sch.every().wednesday,
@@ -214,14 +549,17 @@ if __name__ == "__main__":
             time.sleep(30)
     else:
         # Interactive single-shot mode
-        top20_data = run_scanner()
+        top20_data = run_configured_scan()
         if not top20_data.empty:
             print(top20_data[['\u540d\u79f0', '\u4ee3\u7801', '7\u65e5\u6da8\u5e45(%)', 'RSI_14', '\u653e\u91cf\u6bd4', '\u7efc\u5408\u770b\u597d\u5f97\u5206']].head(5))
-            plot_top_20(top20_data)
+            export_top20_csv(top20_data)
+            chart_proc = render_chart_in_background(top20_data, CHART_FORMAT, CHART_DPI)
             ans = input("\n[?] Auto-inject Top 5 into watchlist.json for live radar? (Y/Enter=Yes / N): ")
             if ans.upper() in ["Y", "", "YES"]:
                 atomic_inject_watchlist(top20_data)
                 print("[+] Closed-loop complete. Live radar is now tracking Top 5.")
+            if chart_proc is not None:
+                chart_proc.join()
         else:
             print("[-] No qualifying stocks found.")
 
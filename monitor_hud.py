@@ -1,7 +1,7 @@
 import tkinter as tk
 from threading import Thread
 import time
-import requests # type: ignore
+from http_client import get_http_client # type: ignore
 
 # ==========================================
 # Phase 12/14: Visual Monitoring Center (Bilingual 4-Slot Radar HUD)
@@ -17,7 +17,7 @@ def send_mobile_notification(symbol: str, action: str, reason: str):
     url = f"https://sctapi.ftqq.com/{SERVER_CHAN_SENDKEY}.send"
     payload = {"title": f"【量化信号】{symbol} 执行 {action}", "desp": f"### 动作: **{action}**\n\n### 标的: {symbol}\n\n### AI与风控综合理由:\n{reason}\n\n*请及时前往券商APP进行复核下单。*"}
     try:
-        response = requests.post(url, data=payload, timeout=10) # type: ignore
+        response = get_http_client().post(url, data=payload, timeout=10) # 共享长连接池 (Pooled keep-alive)
         if response.status_code == 200:
             print("[+] 手机推送下发成功")
     except Exception as e:
@@ -0,0 +1,118 @@
+import time
+import threading
+from config import RATE_LIMITS, RATE_LIMIT_WAIT_LOG_SEC # type: ignore
+from cycle_scheduler import remaining_seconds, DeadlineExceeded # type: ignore
+from debug_sentinel import log_info, log_debug # type: ignore
+
+# ==========================================
+# Phase 23: Token-Bucket Rate Limiter (按上游主机的令牌桶限速层)
+# ==========================================
+# 取代散落在各模块中的 time.sleep 盲睡防封：每个上游主机 (东财 / 财联社 / DeepSeek)
+# 拥有一个令牌桶，所有 AkShare 与 HTTP 调用都先取令牌再出网。并发线程可以尽情提交，
+# 实际吞吐只由配额 (config.RATE_LIMITS) 决定，而不是由最坏情况下的休眠决定。
+# One token bucket per upstream host replaces blind sleeps. Every AkShare/HTTP call takes
+# a token first, so throughput is set by the real quota instead of worst-case sleeps.
+
+class TokenBucket:
+    def __init__(self, name: str, rate_per_sec: float, burst: int):
+        """
+        :param rate_per_sec: 令牌补充速率 (每秒可发出的请求数)
+        :param burst: 桶容量 (允许的瞬时突发请求数)
+        """
+        self.name = name
+        self.rate = float(rate_per_sec)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+        # 排队等待统计 (Queue-wait statistics)
+        self.calls = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        预约令牌并返回需要等待的秒数 (不阻塞)。令牌可以被预约成负数，
+        后来者自动排在前面预约者之后，从而保证先到先得。
+        Reserve tokens and return the required wait (non-blocking). The balance may go
+        negative so later callers queue behind earlier reservations (FIFO).
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            self.calls += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def release(self, tokens: float = 1.0):
+        """归还一次未使用的预约 (Return an unused reservation)"""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + tokens)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        阻塞直到拿到令牌，返回实际排队等待秒数。若当前决策轮的截止时间等不到令牌，
+        归还预约并抛出 DeadlineExceeded，而不是睡过收线。
+        Block until granted; returns the queue wait. If the cycle deadline would pass first,
+        the reservation is returned and DeadlineExceeded is raised instead of sleeping.
+        """
+        wait = self.reserve(tokens)
+        left = remaining_seconds()
+        if left is not None and wait >= left:
+            self.release(tokens)
+            raise DeadlineExceeded(f"限速层 [{self.name}] 需排队 {wait:.1f}s，距截止仅剩 {max(left, 0.0):.1f}s")
+        if wait > 0:
+            with self.lock:
+                self.waiting += 1
+            try:
+                time.sleep(wait)
+            finally:
+                with self.lock:
+                    self.waiting -= 1
+            if wait >= RATE_LIMIT_WAIT_LOG_SEC:
+                log_debug(f"[*] 限速层 [{self.name}] 排队 {wait:.2f}s (当前排队 {self.waiting} 个请求)")
+        return wait
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "waiting": self.waiting,
+                "avg_wait_sec": round(self.total_wait / self.calls, 3) if self.calls else 0.0,
+                "max_wait_sec": round(self.max_wait, 3),
+            }
+
+_buckets = {}
+_buckets_guard = threading.Lock()
+
+def get_limiter(host: str) -> TokenBucket:
+    """按主机名获取共享令牌桶，未配置的主机使用 default 配额 (Unknown hosts use the default quota)"""
+    with _buckets_guard:
+        if host not in _buckets:
+            quota = RATE_LIMITS.get(host, RATE_LIMITS["default"])
+            _buckets[host] = TokenBucket(host, quota["rate"], quota["burst"])
+        return _buckets[host]
+
+def limited_call(host: str, fn, *args, **kwargs):
+    """先向对应主机的令牌桶取令牌，再执行上游调用 (Take a token for host, then call fn)"""
+    get_limiter(host).acquire()
+    return fn(*args, **kwargs)
+
+def get_rate_limit_stats() -> dict:
+    """返回所有主机的排队统计快照 (Snapshot of queue-wait stats for every host)"""
+    with _buckets_guard:
+        buckets = list(_buckets.values())
+    return {b.name: b.stats() for b in buckets}
+
+def report_rate_limit_stats():
+    """将排队统计输出到日志 (Log queue-wait stats)"""
+    for host, st in get_rate_limit_stats().items():
+        log_info(f"[*] 限速层 [{host}] 调用 {st['calls']} 次 | 平均排队 {st['avg_wait_sec']}s | 最长排队 {st['max_wait_sec']}s")
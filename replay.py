@@ -0,0 +1,224 @@
+import os
+import sys
+import time
+import datetime
+import tempfile
+import collections
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+from config import REPLAY_KLINE_PERIOD, REPLAY_SYNTHETIC_STEP_SEC, REPLAY_SYNTHETIC_VOLATILITY # type: ignore
+from sim_clock import SimClock, use_clock # type: ignore
+from market_hours import HK_TZ, HK_SESSIONS # type: ignore
+from tick_journal import iter_journal # type: ignore
+from snapshot_engine import clean_symbol # type: ignore
+from bar_aggregator import BarAggregator # type: ignore
+from indicator_state import IncrementalIndicatorEngine # type: ignore
+from execution_risk import LocalRiskController # type: ignore
+from cycle_scheduler import CycleScheduler # type: ignore
+from ai_pipeline import DecisionPipeline # type: ignore
+from data_harvester import TARGET_POOL # type: ignore
+from main import TickMonitor, run_ai_cycle, AI_TRADE_TIMES # type: ignore
+from debug_sentinel import log_info, log_debug # type: ignore
+
+# ==========================================
+# Phase 35: Simulated-Clock Daemon Replay (模拟时钟整日回放)
+# ==========================================
+# 用录制的行情日志 (tick_journal) 或合成行情驱动守护进程的真实代码路径:
+# TickMonitor.step (对齐/合成 K 线/止损) + run_ai_cycle (调度/流水线/风控/执行) + LocalRiskController。
+# 时钟换成 SimClock，定时任务按 AI_TRADE_TIMES 在虚拟时间上触发，大模型/情报/K 线数据源换成本地桩函数，
+# 持仓与指标状态写入临时目录，不触碰实盘文件。整日回放只需数秒，可用于回归与性能测试。
+# Drives the daemon's real code paths (tick step, AI cycle, risk controller) from a recorded or
+# synthetic tick stream on a simulated clock, with stubbed LLM / intelligence / kline sources and
+# positions kept in a temp dir. A full trading day replays in seconds.
+#
+# 快照时间由行情流决定，高频雷达的自适应节拍在回放中只作为指标记录。
+# Snapshot timing comes from the stream; the tick pacer's interval is only recorded as a metric.
+
+# ---------- 行情源 (Tick sources) ----------
+
+def _spot_frame(symbols, price, pct, volume) -> pd.DataFrame:
+    """还原成东财快照的列名，供 SpotSnapshotEngine 原样消费 (Rebuild vendor-shaped spot columns)"""
+    return pd.DataFrame({"代码": [clean_symbol(s) for s in symbols], "最新价": price, "涨跌幅": pct, "成交量": volume})
+
+def journal_source(day: str, symbols=None, root_dir: str = None):
+    """
+    按时间顺序产出录制日志中的 (epoch 秒, 快照 DataFrame) (Recorded snapshots from the tick journal)
+    """
+    kwargs = {"root_dir": root_dir} if root_dir else {}
+    for chunk in iter_journal(day, symbols=symbols, **kwargs):
+        ts = chunk["ts"]
+        bounds = np.flatnonzero(np.diff(ts)) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(ts)]):
+            yield ts[lo] / 1000.0, _spot_frame(chunk["symbol"][lo:hi], chunk["price"][lo:hi],
+                                               chunk["pct"][lo:hi], chunk["volume"][lo:hi])
+
+def synthetic_source(day: datetime.date, symbols=None, step_sec: float = REPLAY_SYNTHETIC_STEP_SEC,
+                     volatility: float = REPLAY_SYNTHETIC_VOLATILITY, seed: int = 7):
+    """
+    合成一整个交易日的随机游走行情 (同一 seed 结果可复现) (Reproducible random-walk trading day)
+    """
+    symbols = list(symbols or TARGET_POOL)
+    rng = np.random.default_rng(seed)
+    prev_close = rng.uniform(50, 400, len(symbols))
+    price = prev_close.copy()
+    cum_volume = np.zeros(len(symbols))
+    for start, end in HK_SESSIONS:
+        ts = HK_TZ.localize(datetime.datetime.combine(day, start)).timestamp()
+        close_ts = HK_TZ.localize(datetime.datetime.combine(day, end)).timestamp()
+        while ts <= close_ts:
+            price = np.round(price * np.exp(rng.normal(0.0, volatility, len(symbols))), 3)
+            cum_volume += rng.integers(1_000, 50_000, len(symbols))
+            yield ts, _spot_frame(symbols, price, (price / prev_close - 1) * 100, cum_volume)
+            ts += step_sec
+
+# ---------- 桩函数 (Stubs) ----------
+
+class HeadlessHUD:
+    """无界面 HUD，回放时替代 tkinter 雷达 (No-op HUD used instead of the tkinter radar)"""
+    def register_symbols(self, symbols): pass
+    def update_tick(self, symbol, price, pct_change): pass
+    def update_status(self, symbol, action): pass
+    def update_network_latency(self, latency_ms): pass
+    def trigger_alert(self): pass
+
+def stub_llm(symbol: str, market_data: dict, intelligence_dict: dict) -> dict:
+    """确定性的规则 "大模型": RSI 超卖且 MACD 翻红买入，RSI 超买卖出 (Deterministic rule-based stand-in)"""
+    rsi, hist = market_data["RSI_14"], market_data["MACD_HIST"]
+    if rsi < 35 and hist > 0:
+        return {"action": "BUY", "reason": f"[REPLAY] RSI {rsi:.1f} 超卖且 MACD 翻红"}
+    if rsi > 65:
+        return {"action": "SELL", "reason": f"[REPLAY] RSI {rsi:.1f} 超买"}
+    return {"action": "HOLD", "reason": f"[REPLAY] RSI {rsi:.1f} 中性"}
+
+def stub_notify(symbol: str, action: str, reason: str):
+    """回放绝不向手机推送 (Replay never pushes to the phone)"""
+    log_debug(f"[REPLAY] 跳过手机推送: {symbol} {action} - {reason}")
+
+def stub_intel(symbol: str) -> dict:
+    return {"micro_stock_news": [], "macro_market_news": []}
+
+class LocalKlineSource:
+    """
+    只读回放中本地合成的 K 线，再跑流式指标 (零网络)；忽略调用方传入的周期，统一用 REPLAY_KLINE_PERIOD
+    Kline stub over the replay's own aggregated bars; uses REPLAY_KLINE_PERIOD whatever period is asked.
+    """
+    def __init__(self, aggregator: BarAggregator, state_dir: str, period: int = REPLAY_KLINE_PERIOD):
+        self.aggregator = aggregator
+        self.period = period
+        self.engine = IncrementalIndicatorEngine(state_dir)
+
+    def __call__(self, symbol: str, period: str = "60") -> dict:
+        bars = self.aggregator.bars(symbol, self.period)
+        if bars is None:
+            return None
+        return self.engine.update(symbol, str(self.period), bars)
+
+# ---------- 回放驱动 (Replay driver) ----------
+
+class DaemonReplay:
+    def __init__(self, source, symbols=None, llm_fn=stub_llm, intel_fn=stub_intel, kline_fn=None,
+                 initial_capital: float = 100000.0, trade_times=AI_TRADE_TIMES):
+        """
+        :param source: 可迭代的 (epoch 秒, 快照 DataFrame)，按时间升序 (Time-ordered snapshots)
+        :param kline_fn: K 线快照桩，缺省为 LocalKlineSource (Kline stub; defaults to the replay's own bars)
+        """
+        self.source = source
+        self.symbols = list(symbols or TARGET_POOL)
+        self.llm_fn = llm_fn
+        self.intel_fn = intel_fn
+        self.kline_fn = kline_fn
+        self.initial_capital = initial_capital
+        self.trade_times = [datetime.datetime.strptime(t, "%H:%M").time() for t in trade_times]
+
+    def _triggers(self, day: datetime.date) -> collections.deque:
+        return collections.deque(HK_TZ.localize(datetime.datetime.combine(day, t)).timestamp() for t in self.trade_times)
+
+    def run(self) -> dict:
+        """回放整条行情流，返回统计报告 (Replay the whole stream; returns a report)"""
+        source = iter(self.source)
+        first = next(source, None)
+        if first is None:
+            return {"ticks": 0}
+
+        wall_start = time.perf_counter()
+        report = {"ticks": 0, "cycles": 0, "outcomes": collections.Counter(), "trades": [], "intervals": []}
+        with tempfile.TemporaryDirectory(prefix="replay_") as work_dir, \
+                use_clock(SimClock(datetime.datetime.fromtimestamp(first[0], HK_TZ))) as clock:
+            hud = HeadlessHUD()
+            risk_sys = LocalRiskController(self.initial_capital, persist_file=os.path.join(work_dir, "positions.json"))
+            held = {}
+
+            def on_positions(positions):
+                for sym in set(held) - set(positions):
+                    report["trades"].append((clock.now().strftime("%H:%M:%S"), sym, "SELL"))
+                for sym in set(positions) - set(held):
+                    report["trades"].append((clock.now().strftime("%H:%M:%S"), sym, "BUY"))
+                held.clear()
+                held.update(positions)
+            risk_sys.add_listener(on_positions, inline=True)
+
+            aggregator = BarAggregator()
+            kline_fn = self.kline_fn or LocalKlineSource(aggregator, os.path.join(work_dir, "indicator_state"))
+            current = {}
+            monitor = TickMonitor(hud, risk_sys, spot_fn=lambda: current["spot"], watchlist_fn=lambda: list(self.symbols),
+                                  aggregator=aggregator, journal=None, write_cache=False, notify_fn=stub_notify)
+            pipeline = DecisionPipeline(risk_sys, hud, kline_fn=kline_fn, intel_fn=self.intel_fn, llm_fn=self.llm_fn,
+                                        notify_fn=stub_notify).start()
+            scheduler = CycleScheduler()
+
+            day, triggers = None, collections.deque()
+            sim_start = first[0]
+            try:
+                for ts, spot_df in _chain(first, source):
+                    tick_day = datetime.datetime.fromtimestamp(ts, HK_TZ).date()
+                    if tick_day != day:
+                        day, triggers = tick_day, self._triggers(tick_day)
+                    # 先跑到点的定时任务，再处理这一轮快照 (Fire due jobs before the snapshot)
+                    while triggers and triggers[0] <= ts:
+                        clock.advance_to(triggers.popleft())
+                        results = run_ai_cycle(pipeline, scheduler, risk_sys, watchlist_fn=lambda: list(self.symbols))
+                        if results is not None:
+                            report["cycles"] += 1
+                            report["outcomes"].update(results.values())
+                    clock.advance_to(ts)
+                    current["spot"] = spot_df
+                    report["intervals"].append(monitor.step())
+                    report["ticks"] += 1
+            finally:
+                pipeline.stop()
+
+            wall = time.perf_counter() - wall_start
+            sim_span = clock.time() - sim_start
+            report.update({
+                "sim_seconds": round(sim_span, 1),
+                "wall_seconds": round(wall, 2),
+                "speedup": round(sim_span / wall, 1) if wall > 0 else None,
+                "avg_tick_interval_sec": round(float(np.mean(report["intervals"])), 2),
+                "positions": risk_sys.get_positions_copy(),
+                "outcomes": dict(report["outcomes"]),
+            })
+            del report["intervals"]
+        log_info(f"[+] 回放完成: {report['ticks']} 轮快照 / {report['cycles']} 轮决策，模拟 {report['sim_seconds']}s "
+                 f"用时 {report['wall_seconds']}s (加速 {report['speedup']}x)，成交 {len(report['trades'])} 笔。")
+        return report
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+if __name__ == "__main__":
+    # 用法 (Usage):
+    #   python replay.py --day 20251009          回放录制的行情日志 (Replay a recorded journal day)
+    #   python replay.py --synthetic 2025-10-09  回放合成行情 (Replay a synthetic day)
+    def _flag_value(flag: str):
+        pos = sys.argv.index(flag) if flag in sys.argv else -1
+        return sys.argv[pos + 1] if 0 <= pos < len(sys.argv) - 1 else None
+
+    if _flag_value("--day"):
+        source = journal_source(_flag_value("--day"))
+    else:
+        day = datetime.date.fromisoformat(_flag_value("--synthetic")) if _flag_value("--synthetic") else datetime.date.today()
+        while day.weekday() >= 5:
+            day -= datetime.timedelta(days=1)
+        source = synthetic_source(day)
+    print(DaemonReplay(source).run())
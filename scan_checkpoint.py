@@ -0,0 +1,83 @@
+import os
+import json
+import datetime
+import threading
+from config import SCAN_CHECKPOINT_DIR # type: ignore
+from debug_sentinel import log_info, log_error # type: ignore
+
+# ==========================================
+# Phase 25: Scan Checkpoint (选股雷达断点续扫)
+# ==========================================
+# 扫描过程中每处理完一只标的就追加一行 JSONL 记录 (含状态与原因)，断网后可用 --resume
+# 跳过当日已完成的标的；失败的标的带有原因，可用 --retry-failed 单独定向重试。
+# Every processed symbol is appended as a JSONL record (status + reason) while the scan runs.
+# --resume skips symbols already done today; failures keep their reason for --retry-failed.
+
+# 扫描状态 (Scan statuses)
+STATUS_OK = "OK"                               # 日线已同步，可参与打分
+STATUS_SUSPENDED = "SUSPENDED"                 # 超过 5 天无成交，视为停牌
+STATUS_INSUFFICIENT = "INSUFFICIENT_HISTORY"   # 次新股，日线不足 30 根
+STATUS_FAILED = "FETCH_FAILED"                 # 网络/接口失败，需要重试
+
+# 这些状态在同一交易日内不需要重做 (Terminal for the trading day)
+DONE_STATUSES = {STATUS_OK, STATUS_SUSPENDED, STATUS_INSUFFICIENT}
+
+class ScanCheckpoint:
+    def __init__(self, trading_day: datetime.date = None, checkpoint_dir: str = SCAN_CHECKPOINT_DIR):
+        """
+        按交易日切分的扫描断点文件: {checkpoint_dir}/scan_YYYYMMDD.jsonl
+        One append-only checkpoint file per trading day.
+        """
+        self.trading_day = trading_day or datetime.date.today()
+        self.path = os.path.join(checkpoint_dir, f"scan_{self.trading_day.strftime('%Y%m%d')}.jsonl")
+        self.lock = threading.Lock()
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def record(self, symbol: str, name: str, price, status: str, reason: str = ""):
+        """追加一条标的处理结果并立即刷盘 (Append one result and flush it immediately)"""
+        entry = {
+            "symbol": symbol,
+            "name": name,
+            "price": float(price) if price is not None else None,
+            "status": status,
+            "reason": reason,
+            "ts": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self.lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                log_error(f"[-] 写入扫描断点失败 ({symbol}): {e}")
+
+    def load(self) -> dict:
+        """读取当日断点，同一标的以最后一条记录为准 (Latest record per symbol wins)"""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with self.lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 断电可能留下半行记录，直接跳过 (A power cut may leave a torn last line)
+                        continue
+                    records[entry["symbol"]] = entry
+        return records
+
+    def failed_entries(self) -> dict:
+        """当日失败的标的及其原因 (Failed symbols with their reasons)"""
+        return {sym: entry for sym, entry in self.load().items() if entry["status"] == STATUS_FAILED}
+
+    def report(self):
+        """输出当日断点的状态分布 (Log the status breakdown of today's checkpoint)"""
+        counts = {}
+        for entry in self.load().values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        log_info(f"[*] 扫描断点 {os.path.basename(self.path)} 状态分布: {counts}")
@@ -0,0 +1,132 @@
+import re
+import math
+import threading
+from config import (SENTIMENT_TRIAGE_ENABLED, SENTIMENT_MICRO_THRESHOLD, SENTIMENT_MACRO_THRESHOLD, # type: ignore
+                    SENTIMENT_RSI_BAND, SENTIMENT_SCALE)
+from debug_sentinel import log_info # type: ignore
+
+# ==========================================
+# Phase 41: Local Sentiment Pre-Scorer & Triage (本地情绪预打分 + 大模型分诊)
+# ==========================================
+# fetch_multi_dim_intelligence 抓到的标题原先对每个标的都原样塞进昂贵的 deepseek-reasoner 提示词。
+# 这里先用离线的中文财经词典模型在微秒级给个股新闻与宏观电报打分 (否定词翻转、程度词加权)，
+# 只有情绪或技术面越过阈值的标的才升级给大模型，其余标的本地直接 HOLD；升级时把本地分数一并写进提示词。
+# An offline keyword/lexicon scorer for Chinese financial headlines scores stock news and the
+# macro feed in microseconds (negators flip, intensifiers amplify). Only symbols whose sentiment
+# or technicals cross a threshold are escalated to the reasoner, with the local score added to
+# the prompt; the rest HOLD locally.
+#
+# 打分器可替换: 任何实现 score_headline(text) -> (分数, 命中词) 的对象都可通过 set_sentiment_scorer 注入。
+# Swappable: anything with score_headline(text) -> (score, hits) can be installed via set_sentiment_scorer.
+
+# 词典权重: 正数利好，负数利空 (Lexicon weights: positive = bullish, negative = bearish)
+LEXICON = {
+    # 利好 (Bullish)
+    "利好": 2.0, "大涨": 2.0, "涨停": 3.0, "暴涨": 3.0, "飙升": 2.0, "急升": 2.0, "创新高": 2.0, "新高": 1.0,
+    "增持": 2.0, "回购": 2.0, "超预期": 2.0, "扭亏为盈": 3.0, "扭亏": 2.0, "盈利增长": 2.0, "净利润增长": 2.0,
+    "增长": 1.0, "上调评级": 2.0, "上调": 1.0, "买入评级": 2.0, "中标": 2.0, "签约": 1.0, "获批": 2.0,
+    "分红": 1.0, "派息": 1.0, "降息": 2.0, "降准": 2.0, "宽松": 1.0, "刺激": 1.0, "反弹": 1.0, "走强": 1.0,
+    "突破": 1.0, "看好": 1.0, "强劲": 1.0, "提振": 1.0, "回暖": 1.0, "复苏": 1.0, "纳入": 1.0,
+    # 利空 (Bearish)
+    "利空": -2.0, "大跌": -2.0, "跌停": -3.0, "暴跌": -3.0, "重挫": -2.0, "跳水": -2.0, "急跌": -2.0, "新低": -1.0,
+    "减持": -2.0, "亏损": -2.0, "预亏": -2.0, "首亏": -2.0, "盈警": -2.0, "不及预期": -2.0, "低于预期": -2.0,
+    "下调评级": -2.0, "下调": -1.0, "卖出评级": -2.0, "处罚": -2.0, "罚款": -2.0, "立案": -3.0, "调查": -2.0,
+    "违规": -2.0, "诉讼": -1.0, "违约": -3.0, "爆雷": -3.0, "停牌": -1.0, "退市": -3.0, "清盘": -3.0,
+    "沽空": -2.0, "做空": -2.0, "加息": -2.0, "收紧": -1.0, "制裁": -2.0, "关税": -1.0, "下滑": -1.0,
+    "下跌": -1.0, "走弱": -1.0, "承压": -1.0, "裁员": -1.0, "拖累": -1.0, "恐慌": -2.0, "抛售": -2.0, "衰退": -2.0,
+}
+# 出现在命中词前 NEGATION_WINDOW 个字符内时翻转/放大 (Negators flip, intensifiers amplify, within the window)
+NEGATORS = ("不", "未", "没有", "无", "否认", "并非", "难以")
+INTENSIFIERS = {"大幅": 1.5, "显著": 1.5, "全面": 1.3, "持续": 1.2}
+NEGATION_WINDOW = 4
+
+class LexiconSentimentScorer:
+    def __init__(self, lexicon: dict = None, negators=NEGATORS, intensifiers: dict = None, window: int = NEGATION_WINDOW):
+        self.lexicon = dict(LEXICON if lexicon is None else lexicon)
+        self.negators = tuple(negators)
+        self.intensifiers = dict(INTENSIFIERS if intensifiers is None else intensifiers)
+        self.window = window
+        # 长词优先，"扭亏为盈" 不会被拆成 "扭亏" (Longest match first)
+        self.pattern = re.compile("|".join(re.escape(term) for term in sorted(self.lexicon, key=len, reverse=True)))
+
+    def score_headline(self, text: str):
+        """单条标题的原始得分 (未归一化) 与命中词 (Raw headline score and the matched terms)"""
+        total, hits = 0.0, []
+        for match in self.pattern.finditer(text):
+            weight = self.lexicon[match.group(0)]
+            context = text[max(0, match.start() - self.window):match.start()]
+            if any(neg in context for neg in self.negators):
+                weight = -weight
+            for word, factor in self.intensifiers.items():
+                if word in context:
+                    weight *= factor
+            total += weight
+            hits.append(match.group(0))
+        return total, hits
+
+def score_feed(headlines, scorer=None) -> dict:
+    """
+    一个栏目的情绪分: 各标题原始得分之和经 tanh 压到 [-1, 1] (Feed score squashed into [-1, 1])
+    """
+    scorer = scorer or get_sentiment_scorer()
+    total, hits = 0.0, []
+    for headline in headlines or []:
+        score, matched = scorer.score_headline(str(headline))
+        total += score
+        hits.extend(matched)
+    return {"score": round(math.tanh(total / SENTIMENT_SCALE), 3), "hits": hits[:8]}
+
+def score_intelligence(intelligence_dict: dict, scorer=None) -> dict:
+    """个股新闻与宏观电报分别打分 (Score stock news and the macro feed separately)"""
+    micro = score_feed(intelligence_dict.get("micro_stock_news"), scorer)
+    macro = score_feed(intelligence_dict.get("macro_market_news"), scorer)
+    return {"micro": micro["score"], "macro": macro["score"], "micro_hits": micro["hits"], "macro_hits": macro["hits"]}
+
+# 分诊计数 (Triage counters)
+_triage_lock = threading.Lock()
+_triage_counts = {"escalated": 0, "held": 0}
+
+def triage(market_data: dict, sentiment: dict, enabled: bool = SENTIMENT_TRIAGE_ENABLED):
+    """
+    判断是否升级给大模型，返回 (是否升级, 原因) (Whether to escalate to the LLM, and why)
+    """
+    low, high = SENTIMENT_RSI_BAND
+    rsi = market_data.get("RSI_14")
+    if not enabled:
+        escalate, why = True, "分诊已关闭"
+    elif abs(sentiment["micro"]) >= SENTIMENT_MICRO_THRESHOLD:
+        escalate, why = True, f"个股情绪 {sentiment['micro']:+.2f} {sentiment['micro_hits']}"
+    elif abs(sentiment["macro"]) >= SENTIMENT_MACRO_THRESHOLD:
+        escalate, why = True, f"宏观情绪 {sentiment['macro']:+.2f} {sentiment['macro_hits']}"
+    elif rsi is not None and not low < rsi < high:
+        escalate, why = True, f"RSI {rsi:.1f} 越出 ({low}, {high})"
+    else:
+        escalate, why = False, (f"个股情绪 {sentiment['micro']:+.2f} / 宏观情绪 {sentiment['macro']:+.2f} / "
+                                f"RSI {rsi if rsi is None else round(rsi, 1)} 均在阈值内")
+    with _triage_lock:
+        _triage_counts["escalated" if escalate else "held"] += 1
+    return escalate, why
+
+def report_triage_stats():
+    """将分诊统计输出到日志 (Log triage stats)"""
+    with _triage_lock:
+        escalated, held = _triage_counts["escalated"], _triage_counts["held"]
+    log_info(f"[*] 本地情绪分诊: 升级大模型 {escalated} 个 | 本地 HOLD {held} 个")
+
+# 进程级共享打分器，可替换为更强的模型 (Process-wide scorer; swap in a better model later)
+_default_scorer = None
+_default_scorer_guard = threading.Lock()
+
+def get_sentiment_scorer():
+    """获取当前的情绪打分器 (Get the active sentiment scorer)"""
+    global _default_scorer
+    with _default_scorer_guard:
+        if _default_scorer is None:
+            _default_scorer = LexiconSentimentScorer()
+        return _default_scorer
+
+def set_sentiment_scorer(scorer):
+    """替换情绪打分器，需实现 score_headline(text) -> (分数, 命中词) (Install another scorer)"""
+    global _default_scorer
+    with _default_scorer_guard:
+        _default_scorer = scorer
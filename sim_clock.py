@@ -0,0 +1,78 @@
+import time
+import datetime
+import threading
+import contextlib
+import pytz # type: ignore
+
+# ==========================================
+# Phase 34: Swappable Clock (可替换时钟：实盘墙钟 / 回放模拟时钟)
+# ==========================================
+# 交易时段判断、截止时间、高频雷达的节拍睡眠原先都直接读写墙钟，验证一整个交易日只能真的等一天。
+# 这里把 "现在几点" 与 "睡多久" 收口到一个进程级时钟对象: 实盘用 WallClock，
+# 回放 (replay.py) 换成 SimClock，sleep 只推进虚拟时间，整日行情按 CPU 速度跑完。
+# Every "what time is it" / "sleep" in the daemon goes through one process-wide clock. Live runs
+# use the wall clock; replay swaps in a SimClock whose sleep only advances virtual time.
+
+_HK_TZ = pytz.timezone('Asia/Hong_Kong')
+
+class WallClock:
+    """实盘墙钟 (Real wall clock)"""
+    def now(self) -> datetime.datetime:
+        """当前香港时间 (带时区) (Aware Hong Kong time)"""
+        return datetime.datetime.now(_HK_TZ)
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+class SimClock:
+    """
+    回放用模拟时钟：时间只在 sleep/advance_to 时前进，不做真实等待
+    Virtual clock for replay: time only moves on sleep()/advance_to(), never blocks.
+    """
+    def __init__(self, start: datetime.datetime):
+        start = _HK_TZ.localize(start) if start.tzinfo is None else start
+        self._now = start.timestamp()
+        self.lock = threading.Lock()
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.time(), _HK_TZ)
+
+    def time(self) -> float:
+        with self.lock:
+            return self._now
+
+    def sleep(self, seconds: float):
+        with self.lock:
+            self._now += max(0.0, seconds)
+
+    def advance_to(self, epoch: float):
+        """推进到指定 epoch 秒，不会倒退 (Move forward to an epoch second; never backwards)"""
+        with self.lock:
+            self._now = max(self._now, epoch)
+
+# 进程级当前时钟 (Process-wide active clock)
+_active_clock = WallClock()
+_active_clock_guard = threading.Lock()
+
+def get_clock():
+    """获取当前生效的时钟 (Get the active clock)"""
+    return _active_clock
+
+def set_clock(clock):
+    """替换进程级时钟，返回旧时钟 (Swap the process-wide clock; returns the previous one)"""
+    global _active_clock
+    with _active_clock_guard:
+        previous, _active_clock = _active_clock, clock
+    return previous
+
+@contextlib.contextmanager
+def use_clock(clock):
+    """在代码块内使用指定时钟，退出后恢复 (Use a clock for the enclosed block, then restore)"""
+    previous = set_clock(clock)
+    try:
+        yield clock
+    finally:
+        set_clock(previous)
@@ -0,0 +1,189 @@
+import os
+import glob
+import time
+import datetime
+import threading
+import numpy as np # type: ignore
+from config import (TICK_JOURNAL_DIR, TICK_JOURNAL_BUFFER_ROWS, TICK_JOURNAL_FLUSH_SEC, # type: ignore
+                    TICK_JOURNAL_MAX_BUFFER_ROWS)
+from debug_sentinel import log_info, log_error, log_warn # type: ignore
+
+# ==========================================
+# Phase 33: Tick Journal (压缩列式行情快照日志)
+# ==========================================
+# 高频雷达每轮拉到的快照原先只覆盖写入 realtime_cache.json，这里把它们追加记录下来，
+# 作为回放、延迟取证与盘中真实回测的原始素材。
+# 目录结构: {root}/{YYYYMMDD}/chunk_{首笔毫秒}_{末笔毫秒}.npz，按交易日自动切换目录。
+# 每个分块是一次落盘的压缩列式数据 (np.savez_compressed)，写完即不再修改 (只追加)。
+# Every tick snapshot is appended to an on-disk journal for replay, latency forensics and
+# intraday backtests: one directory per trading day, immutable compressed columnar chunks
+# named by their first/last timestamp so a range read can skip chunks without opening them.
+#
+# 列 (Columns): ts (epoch 毫秒), symbol, price, pct, volume, fetch_ms (该轮快照的拉取耗时)
+
+NUMERIC_COLUMNS = ["price", "pct", "volume", "fetch_ms"]
+
+def _day_key(ts_ms: int) -> str:
+    """epoch 毫秒 -> 香港本地交易日目录名 (HK trading day for a timestamp)"""
+    hk = datetime.timezone(datetime.timedelta(hours=8))
+    return datetime.datetime.fromtimestamp(ts_ms / 1000, hk).strftime("%Y%m%d")
+
+class TickJournal:
+    def __init__(self, root_dir: str = TICK_JOURNAL_DIR, buffer_rows: int = TICK_JOURNAL_BUFFER_ROWS,
+                 flush_sec: float = TICK_JOURNAL_FLUSH_SEC, max_buffer_rows: int = TICK_JOURNAL_MAX_BUFFER_ROWS):
+        self.root_dir = root_dir
+        self.buffer_rows = buffer_rows
+        self.flush_sec = flush_sec
+        self.max_buffer_rows = max_buffer_rows
+        self.lock = threading.Lock()
+        self._reset_buffer()
+        self._day = None
+        self._last_flush = time.monotonic()
+
+    def _reset_buffer(self):
+        self._blocks = []   # 每轮快照一块列数组 (One block of column arrays per snapshot)
+        self._rows = 0
+
+    def record(self, ts: float, symbols, price, pct, volume, fetch_ms: float = np.nan):
+        """
+        追加一轮快照 (ts 为 epoch 秒)；到达行数或时间阈值时自动落盘，跨日自动切换目录
+        Append one snapshot (ts in epoch seconds); flushes on the row/time thresholds and rotates daily.
+        """
+        ts_ms = int(ts * 1000)
+        symbols = np.asarray(symbols, dtype=str)
+        n = len(symbols)
+        if n == 0:
+            return
+        block = {
+            "ts": np.full(n, ts_ms, dtype=np.int64),
+            "symbol": symbols,
+            "price": np.broadcast_to(np.asarray(price, dtype=np.float64), n).copy(),
+            "pct": np.broadcast_to(np.asarray(pct, dtype=np.float64), n).copy(),
+            "volume": np.broadcast_to(np.asarray(volume, dtype=np.float64), n).copy(),
+            "fetch_ms": np.full(n, fetch_ms, dtype=np.float64),
+        }
+        day = _day_key(ts_ms)
+        with self.lock:
+            if self._day is not None and day != self._day:
+                self._flush_locked()  # 跨日先落盘前一天的缓冲 (Rotate: flush the previous day first)
+            self._day = day
+            self._blocks.append(block)
+            self._rows += n
+            if self._rows >= self.buffer_rows or time.monotonic() - self._last_flush >= self.flush_sec:
+                self._flush_locked()
+            if self._rows > self.max_buffer_rows:
+                # 落盘持续失败: 丢弃最旧的快照，保证内存有界 (Keep memory bounded if flushes keep failing)
+                while self._rows > self.max_buffer_rows and self._blocks:
+                    self._rows -= len(self._blocks.pop(0)["ts"])
+                log_warn(f"[!] 行情日志缓冲区超过 {self.max_buffer_rows} 行，已丢弃最旧的快照。")
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._blocks:
+            return
+        columns = {col: np.concatenate([b[col] for b in self._blocks]) for col in self._blocks[0]}
+        # 代码列字典编码: 分块内的代码表 + int32 下标 (Dictionary-encode symbols per chunk)
+        table, codes = np.unique(columns.pop("symbol"), return_inverse=True)
+        columns["symbol_table"] = table
+        columns["symbol_idx"] = codes.astype(np.int32)
+
+        day_dir = os.path.join(self.root_dir, self._day)
+        os.makedirs(day_dir, exist_ok=True)
+        name = f"chunk_{columns['ts'][0]}_{columns['ts'][-1]}.npz"
+        path = os.path.join(day_dir, name)
+        # 临时文件名不匹配 chunk_*.npz，崩溃残留也不会被读取端当成分块 (Never matches the reader's glob)
+        tmp_path = os.path.join(day_dir, f".tmp_{name}")
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, **columns)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            self._reset_buffer()
+        except Exception as e:
+            # 保留缓冲，下次再试 (Keep the buffer and retry on the next flush)
+            log_error(f"[-] 行情日志落盘失败: {e}")
+
+    def close(self):
+        """停机前落盘剩余缓冲 (Flush whatever is buffered before shutdown)"""
+        self.flush()
+        log_info(f"[+] 行情日志已落盘关闭: {self.root_dir}")
+
+# ---------- 读取 (Reader) ----------
+
+def _chunk_range(path: str):
+    """解析文件名中的 (首毫秒, 末毫秒)，无法解析时返回 None (None for names that do not parse)"""
+    stem = os.path.basename(path)[len("chunk_"):-len(".npz")]
+    try:
+        first, last = stem.split("_")
+        return int(first), int(last)
+    except ValueError:
+        return None
+
+def _chunk_paths(day_dir: str) -> list:
+    """某日目录下可解析的分块，按时间排序 (Parseable chunks of a day, in time order)"""
+    ranged = []
+    for path in glob.glob(os.path.join(day_dir, "chunk_*.npz")):
+        chunk_range = _chunk_range(path)
+        if chunk_range is None:
+            log_warn(f"[!] 跳过无法识别的行情日志文件: {path}")
+            continue
+        ranged.append((chunk_range, path))
+    return [(path, chunk_range) for chunk_range, path in sorted(ranged)]
+
+def iter_journal(day: str, start: float = None, end: float = None, symbols=None, root_dir: str = TICK_JOURNAL_DIR):
+    """
+    按时间顺序逐块读取某个交易日 (YYYYMMDD) 的日志，可按 [start, end] (epoch 秒) 与标的过滤，
+    每次产出一个 {列名: NumPy 数组} 的分块，整日数据无需一次性载入内存。
+    Stream a trading day chunk by chunk as {column: ndarray}, optionally filtered by an epoch-second
+    range and a symbol set, without loading the whole day at once.
+    """
+    start_ms = int(start * 1000) if start is not None else None
+    end_ms = int(end * 1000) if end is not None else None
+    wanted = set(symbols) if symbols is not None else None
+    for path, (first, last) in _chunk_paths(os.path.join(root_dir, day)):
+        # 按文件名中的时间范围跳过整块 (Skip whole chunks by the range in their name)
+        if (start_ms is not None and last < start_ms) or (end_ms is not None and first > end_ms):
+            continue
+        with np.load(path, allow_pickle=False) as data:
+            ts = data["ts"]
+            lo = np.searchsorted(ts, start_ms, side="left") if start_ms is not None else 0
+            hi = np.searchsorted(ts, end_ms, side="right") if end_ms is not None else len(ts)
+            table = data["symbol_table"]
+            idx = data["symbol_idx"][lo:hi]
+            mask = np.isin(idx, np.flatnonzero(np.isin(table, list(wanted)))) if wanted is not None else slice(None)
+            chunk = {"ts": ts[lo:hi][mask], "symbol": table[idx[mask]]}
+            for col in NUMERIC_COLUMNS:
+                chunk[col] = data[col][lo:hi][mask]
+        if len(chunk["ts"]):
+            yield chunk
+
+def read_journal(day: str, start: float = None, end: float = None, symbols=None, root_dir: str = TICK_JOURNAL_DIR) -> dict:
+    """把 iter_journal 的分块拼成整段 NumPy 列 (Concatenate iter_journal chunks into whole columns)"""
+    chunks = list(iter_journal(day, start, end, symbols, root_dir))
+    if not chunks:
+        return {"ts": np.array([], dtype=np.int64), "symbol": np.array([], dtype=str),
+                **{col: np.array([], dtype=np.float64) for col in NUMERIC_COLUMNS}}
+    return {col: np.concatenate([c[col] for c in chunks]) for col in chunks[0]}
+
+def journal_days(root_dir: str = TICK_JOURNAL_DIR) -> list:
+    """已记录的交易日列表 (Recorded trading days)"""
+    if not os.path.isdir(root_dir):
+        return []
+    return sorted(d for d in os.listdir(root_dir) if d.isdigit())
+
+# 进程级共享实例 (Process-wide shared instance)
+_default_journal = None
+_default_journal_guard = threading.Lock()
+
+def get_tick_journal() -> TickJournal:
+    """获取进程级共享的行情日志 (Get the process-wide tick journal)"""
+    global _default_journal
+    with _default_journal_guard:
+        if _default_journal is None:
+            _default_journal = TickJournal()
+        return _default_journal
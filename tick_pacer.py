@@ -0,0 +1,71 @@
+import threading
+from config import (TICK_INTERVAL_MIN_SEC, TICK_INTERVAL_MAX_SEC, TICK_STOP_NEAR_PCT, TICK_STOP_FAR_PCT, # type: ignore
+                    TICK_RATE_BUDGET_SHARE, RATE_LIMITS)
+from debug_sentinel import log_info # type: ignore
+
+# ==========================================
+# Phase 31: Stop-Proximity Tick Pacer (按止损距离自适应的高频轮询节拍器)
+# ==========================================
+# 高频雷达原先固定 10 秒一轮。这里根据持仓现价距最近一道止损/止盈触发价的相对距离选择下一轮间隔:
+# 逼近防线时收紧到 TICK_INTERVAL_MIN_SEC，全部远离时放宽到 TICK_INTERVAL_MAX_SEC，中间线性过渡。
+# 下限同时受东财令牌桶配额约束 (只允许占用 TICK_RATE_BUDGET_SHARE)，平时放宽节省的请求
+# 抵消了危险时段的加密，整体 API 负载不升反降。
+# Picks the next poll interval from how close any held position is to its stop trigger: tight
+# near a trigger, relaxed when everything is far away, linear in between. The floor also
+# respects the eastmoney quota share, so stop reaction improves without raising average load.
+
+def _budget_floor(host: str = "eastmoney") -> float:
+    """令牌桶配额允许的最短轮询间隔 (Shortest interval the upstream quota share allows)"""
+    quota = RATE_LIMITS.get(host, RATE_LIMITS["default"])
+    return 1.0 / (quota["rate"] * TICK_RATE_BUDGET_SHARE)
+
+class TickPacer:
+    def __init__(self, min_interval: float = TICK_INTERVAL_MIN_SEC, max_interval: float = TICK_INTERVAL_MAX_SEC,
+                 near_pct: float = TICK_STOP_NEAR_PCT, far_pct: float = TICK_STOP_FAR_PCT):
+        self.min_interval = max(min_interval, _budget_floor())
+        self.max_interval = max(max_interval, self.min_interval)
+        self.near_pct = near_pct
+        self.far_pct = far_pct
+        self.lock = threading.Lock()
+
+        # 节拍统计 (Pacing statistics)
+        self.interval = self.max_interval
+        self.nearest = None
+        self.ticks = 0
+        self.total_interval = 0.0
+
+    def next_interval(self, distances: dict) -> float:
+        """
+        根据 {标的: 距触发价的相对距离} 选择下一轮间隔 (秒)；没有持仓时用最慢节拍
+        Choose the next interval from {symbol: distance-to-trigger}; no positions -> slowest.
+        """
+        live = {sym: d for sym, d in distances.items() if d is not None}
+        nearest = min(live.items(), key=lambda kv: kv[1]) if live else None
+
+        if nearest is None or nearest[1] >= self.far_pct:
+            interval = self.max_interval
+        elif nearest[1] <= self.near_pct:
+            interval = self.min_interval
+        else:
+            frac = (nearest[1] - self.near_pct) / (self.far_pct - self.near_pct)
+            interval = self.min_interval + frac * (self.max_interval - self.min_interval)
+
+        with self.lock:
+            if abs(interval - self.interval) >= 1.0 or (interval == self.min_interval) != (self.interval == self.min_interval):
+                target = f"{nearest[0]} 距防线 {nearest[1] * 100:.2f}%" if nearest else "无持仓"
+                log_info(f"[*] 高频雷达节拍调整为 {interval:.1f}s ({target})")
+            self.interval = interval
+            self.nearest = nearest
+            self.ticks += 1
+            self.total_interval += interval
+        return interval
+
+    def metrics(self) -> dict:
+        """导出当前节拍指标 (Current pacing metrics)"""
+        with self.lock:
+            return {
+                "tick_interval_sec": round(self.interval, 2),
+                "avg_tick_interval_sec": round(self.total_interval / self.ticks, 2) if self.ticks else None,
+                "nearest_stop_symbol": self.nearest[0] if self.nearest else None,
+                "nearest_stop_pct": round(self.nearest[1] * 100, 3) if self.nearest else None,
+            }
@@ -0,0 +1,78 @@
+import time
+import threading
+from debug_sentinel import log_debug # type: ignore
+
+# ==========================================
+# Phase 22: Shared TTL Cache (进程级 TTL 缓存 + 单飞去重)
+# ==========================================
+# 全市场共享的数据源 (如财联社宏观电报) 在同一轮扫描中对所有标的都相同，没必要每个标的拉一次。
+# TTLCache 在过期时间内直接复用结果，并对同一个 key 的并发请求做 single-flight 去重：
+# 只有第一个线程真正触网，其余线程挂起等待并共享同一份结果 (或同一个异常)。
+# Market-wide feeds are identical for every symbol in a cycle. Within the TTL results are
+# reused, and concurrent misses on the same key share one in-flight load (single-flight).
+
+class _InFlight:
+    """一次正在进行中的加载 (One in-flight load shared by concurrent callers)"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class TTLCache:
+    def __init__(self, ttl_sec: float, name: str = "cache"):
+        self.ttl_sec = ttl_sec
+        self.name = name
+        self.lock = threading.Lock()
+        self._entries = {}   # key -> (expire_at, value)
+        self._inflight = {}  # key -> _InFlight
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader):
+        """
+        命中且未过期直接返回；否则由第一个调用者执行 loader，其余并发调用者等待共享结果。
+        loader 抛出的异常不会被缓存，会原样抛给本次所有等待者。
+        Return a fresh cached value, or run loader once for all concurrent callers.
+        Exceptions are not cached; they propagate to every waiter of that load.
+        """
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _InFlight()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not is_leader:
+            log_debug(f"[*] {self.name} 缓存单飞合并: {key} 等待在途请求...")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            with self.lock:
+                self._entries[key] = (time.monotonic() + self.ttl_sec, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, key=None):
+        """删除指定 key，或在 key 为 None 时清空全部缓存 (Drop one key, or everything)"""
+        with self.lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)